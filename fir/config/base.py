@@ -186,6 +186,58 @@ INCIDENT_CREATOR_PERMISSION = 'incidents.view_incidents'
 # If you can see an event/incident, you can comment it!
 INCIDENT_VIEWER_CAN_COMMENT = True
 
+# Django cache alias sharing the resolved authorization paths between requests, None to disable
+# It must be shared by all FIR processes (memcached, redis...) for the invalidation to reach them
+AUTHORIZATION_CACHE = None
+
+# Lifetime (in seconds) of the shared authorization paths
+AUTHORIZATION_CACHE_TIMEOUT = 300
+
+# How authorized objects are selected: 'subquery' (pk IN semi-join), 'exists' (correlated EXISTS)
+# or 'distinct' (join and deduplicate the whole query, as in previous versions)
+AUTHORIZATION_QUERY_STRATEGY = 'subquery'
+
+# Use the materialized incident authorization index (run './manage.py rebuild_authorization_index' after enabling it)
+AUTHORIZATION_INDEX = False
+
+# Maintain a monthly incident rollup and read the statistics from it when the user's scope allows it
+# (run './manage.py rebuild_statistics_rollup' after enabling it)
+STATISTICS_ROLLUP = False
+
+# Django cache alias sharing the statistics chart data between the users with the same scope, None to disable
+STATISTICS_CACHE = None
+
+# Lifetime (in seconds) of the cached statistics chart data
+STATISTICS_CACHE_TIMEOUT = 600
+
+# Serve the standard statistics from snapshots precomputed for each authorization scope
+# (refreshed by celery beat with the fir_celery plugin, or by './manage.py refresh_statistics_snapshots')
+STATISTICS_SNAPSHOTS = False
+
+# Interval (in seconds) between two refreshes of the statistics snapshots
+STATISTICS_SNAPSHOTS_INTERVAL = 3600
+
+# Delay (in seconds) of the refresh of the statistics snapshots after incident writes
+STATISTICS_SNAPSHOTS_DELAY = 60
+
+# Search the incidents, their comments and nuggets with the full-text index of the database: PostgreSQL,
+# or SQLite with FTS5 (run './manage.py rebuild_search_index' after enabling it)
+# Search terms then match words and word prefixes instead of any substring
+SEARCH_INDEX = False
+
+# Python path of the full-text search backend class, None for the backend of the database
+SEARCH_INDEX_BACKEND = None
+
+# Update the search index in a celery task (with the fir_celery plugin) instead of during the requests
+SEARCH_INDEX_ASYNC = False
+
+# Pagination of the incident, search and task lists (HTML tables and API): 'offset' numbers the pages,
+# 'keyset' seeks the rows after or before the ones of the current page with opaque cursors
+LIST_PAGINATION = 'offset'
+
+# Count the rows of the keyset paginated lists (on their first page only, the count is then approximate)
+LIST_PAGINATION_COUNT = True
+
 
 # Escape HTML when displaying markdown
 MARKDOWN_SAFE_MODE = True
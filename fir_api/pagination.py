@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.template import loader
+from rest_framework.compat import template_render
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from incidents import pagination
+
+
+class ListPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination with the ``cursor`` parameter when ``LIST_PAGINATION`` is 'keyset'
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = pagination.is_keyset()
+        if not self.keyset:
+            return super(ListPagination, self).paginate_queryset(queryset, request, view=view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = pagination.KeysetPaginator(queryset, page_size,
+                                               counted=getattr(settings, 'LIST_PAGINATION_COUNT', True))
+        self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        if self.page.has_other_pages() and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_cursor_link(self, cursor):
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super(ListPagination, self).get_next_link()
+        if not self.page.has_next():
+            return None
+        return self.get_cursor_link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super(ListPagination, self).get_previous_link()
+        if not self.page.has_previous():
+            return None
+        return self.get_cursor_link(self.page.previous_cursor)
+
+    def to_html(self):
+        if not self.keyset:
+            return super(ListPagination, self).to_html()
+        template = loader.get_template('rest_framework/pagination/previous_and_next.html')
+        context = {'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()}
+        return template_render(template, context)
+
+    def get_fields(self, view):
+        return [self.cursor_query_param if pagination.is_keyset() else self.page_query_param]
@@ -23,10 +23,13 @@ from fir_alerting.models import CategoryTemplate, RecipientTemplate
 from fir_api.serializers import UserSerializer, IncidentSerializer, ArtifactSerializer, FileSerializer, \
     BusinessLineSerializer, RecipientTemplateSerializer, CategoryTemplateSerializer, AccessControlEntrySerializer, \
     GroupSerializer, CategorySerializer, DetectionSerializer
+from fir_api.pagination import ListPagination
 from fir_api.permissions import IsIncidentHandler
+from fir_artifacts import index as artifact_index
 from fir_artifacts.files import handle_uploaded_file, do_download
 from incidents.models import Incident, Artifact, Comments, File, BusinessLine, AccessControlEntry, IncidentCategory, \
     Label
+from incidents.search import query as search_query
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -47,9 +50,10 @@ class IncidentViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows creation of, viewing, and closing of incidents
     """
-    queryset = Incident.objects.all()
+    queryset = Incident.objects.order_by('pk')
     serializer_class = IncidentSerializer
     permission_classes = (IsAuthenticated, IsIncidentHandler)
+    pagination_class = ListPagination
 
     def perform_create(self, serializer):
         instance = serializer.save(opened_by=self.request.user)
@@ -62,6 +66,23 @@ class IncidentViewSet(viewsets.ModelViewSet):
         instance = serializer.save()
         instance.refresh_main_business_lines()
 
+    @list_route(methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Incidents the user can view matching the search query ``q``, the most relevant first with the search index
+        """
+        plan = search_query.get_plan(request.query_params.get('q', ''))
+        incidents = plan.filter(Incident.authorization.for_user(request.user, 'incidents.view_incidents'), request.user)
+        if plan.is_ranked():
+            incidents = incidents.order_by('-search_rank', '-date')
+        else:
+            incidents = incidents.order_by('-date')
+        incidents = incidents.distinct()
+        page = self.paginate_queryset(incidents)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(incidents, many=True).data, status=status.HTTP_200_OK)
+
     @staticmethod
     def populate_incident_template(instance):
         incident_templates = instance.category.incidenttemplate_set.all()
@@ -144,7 +165,10 @@ class ArtifactViewSet(viewsets.ModelViewSet):
         art_type = request.query_params.get('type')
         value = request.query_params.get('value')
 
-        artifacts = Artifact.objects.filter(type=art_type, value=value)
+        if value is None:
+            artifacts = Artifact.objects.none()
+        else:
+            artifacts = Artifact.objects.filter(artifact_index.exact_filter([value]), type=art_type)
         return Response(ArtifactSerializer(artifacts, many=True, context={'request': request}).data,
                         status=status.HTTP_200_OK)
 
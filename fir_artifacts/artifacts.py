@@ -1,9 +1,12 @@
 import re
 
 from django import template
+from django.db.models import Q
 from django.template.loader import get_template
 from django.template import RequestContext
 
+from fir_artifacts import index
+
 register = template.Library()
 
 INSTALLED_ARTIFACTS = dict()
@@ -29,11 +32,24 @@ def find(data):
 def after_save(type, value, event):
     return INSTALLED_ARTIFACTS[type].after_save(value, event)
 
-def incs_for_art(art_string):
+def matching(art_string):
+    """
+    Returns the artifacts whose value contains ``art_string``, with the value index
+    """
     from fir_artifacts.models import Artifact
-    artifacts = Artifact.objects.filter(value__contains=art_string)
+    return index.get_index().filter(Artifact.objects.all(), art_string)
+
+
+def incidents_filter(art_string):
+    """
+    Returns the filter of the incidents linked to the artifacts containing ``art_string``, as one semi-join
+    """
+    return Q(pk__in=matching(art_string).filter(incidents__isnull=False).values('incidents'))
+
+
+def incs_for_art(art_string):
     incs = []
-    for a in artifacts:
+    for a in matching(art_string):
         incs.extend(a.relations.all())
     return incs
 
@@ -11,6 +11,7 @@ from django.shortcuts import get_object_or_404
 from django.core.files import File as FileWrapper
 
 from fir_artifacts import Hash
+from fir_artifacts import index
 from fir_artifacts.models import File, Artifact
 
 
@@ -41,7 +42,7 @@ def handle_uploaded_file(file, description, obj):
     hashes = f.get_hashes()
     for h in hashes:
         try:
-            a = Artifact.objects.get(value=hashes[h])
+            a = Artifact.objects.get(index.exact_filter([hashes[h]]))
             a.save()
         except Exception:
             a = Artifact()
@@ -0,0 +1,149 @@
+"""
+Artifact value index
+
+ Exact values are looked up with the indexed ``value_hash`` column of the artifacts (the values
+ are unbounded texts). Substrings are looked up with the n-gram index of the database, when it
+ has one: a trigram FTS5 table (kept in sync by triggers) on SQLite, a pg_trgm GIN index on
+ PostgreSQL. ``get_index`` returns the index of the database vendor.
+
+"""
+import hashlib
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+ARTIFACTS_TABLE = 'fir_artifacts_artifact'
+
+# Default index of each database vendor
+INDEXES = {
+    'sqlite': 'SQLiteIndex',
+    'postgresql': 'PostgreSQLIndex',
+}
+
+# Length of the n-grams, shorter substrings are looked up without index
+MIN_LENGTH = 3
+
+_available = {}
+
+
+def get_hash(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def exact_filter(values):
+    """
+    Returns the filter of the artifacts of ``values``
+    """
+    return Q(value_hash__in=[get_hash(value) for value in values]) & Q(value__in=values)
+
+
+class Candidates(RawSQL):
+    """
+    Raw SELECT of candidate primary keys, for the ``in`` lookup (which parenthesizes its subqueries)
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class ValueIndex(object):
+    """
+    Substring index of the artifact values
+
+    ``setup_sql`` creates the index, ``teardown_sql`` drops it.
+    """
+    setup_sql = []
+    teardown_sql = []
+
+    def is_available(self, connection):
+        return True
+
+    def filter(self, queryset, value):
+        """
+        Returns the ``queryset`` artifacts whose value contains ``value``
+        """
+        return queryset.filter(value__contains=value)
+
+
+class SQLiteIndex(ValueIndex):
+    """
+    FTS5 external content table of the value trigrams, maintained by triggers
+
+    Its matches are candidates, the ``contains`` lookup keeps the SQL semantics of the substring search.
+    """
+    setup_sql = [
+        "CREATE VIRTUAL TABLE {table}_trigram USING fts5(value, content='{table}', content_rowid='id', "
+        "tokenize='trigram')",
+        "CREATE TRIGGER {table}_trigram_insert AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {table}_trigram(rowid, value) VALUES (new.id, new.value); END",
+        "CREATE TRIGGER {table}_trigram_delete AFTER DELETE ON {table} BEGIN "
+        "INSERT INTO {table}_trigram({table}_trigram, rowid, value) VALUES ('delete', old.id, old.value); END",
+        "CREATE TRIGGER {table}_trigram_update AFTER UPDATE OF value ON {table} BEGIN "
+        "INSERT INTO {table}_trigram({table}_trigram, rowid, value) VALUES ('delete', old.id, old.value); "
+        "INSERT INTO {table}_trigram(rowid, value) VALUES (new.id, new.value); END",
+        "INSERT INTO {table}_trigram({table}_trigram) VALUES ('rebuild')",
+    ]
+    teardown_sql = [
+        "DROP TRIGGER IF EXISTS {table}_trigram_update",
+        "DROP TRIGGER IF EXISTS {table}_trigram_delete",
+        "DROP TRIGGER IF EXISTS {table}_trigram_insert",
+        "DROP TABLE IF EXISTS {table}_trigram",
+    ]
+
+    def is_available(self, connection):
+        # The trigram tokenizer was added in SQLite 3.34
+        if connection.Database.sqlite_version_info < (3, 34, 0):
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def filter(self, queryset, value):
+        if len(value) >= MIN_LENGTH:
+            candidates = 'SELECT rowid FROM {table}_trigram WHERE {table}_trigram MATCH %s'
+            queryset = queryset.filter(pk__in=Candidates(candidates.format(table=ARTIFACTS_TABLE),
+                                                         [u'"{}"'.format(value.replace(u'"', u'""'))]))
+        return super(SQLiteIndex, self).filter(queryset, value)
+
+
+class PostgreSQLIndex(ValueIndex):
+    """
+    GIN trigram index of the values, used by the LIKE queries of the ``contains`` lookup
+    """
+    setup_sql = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX {table}_value_trigram ON {table} USING GIN (value gin_trgm_ops)",
+    ]
+    teardown_sql = [
+        "DROP INDEX IF EXISTS {table}_value_trigram",
+    ]
+
+
+def get_index(connection=None):
+    """
+    Returns the substring index of ``connection``, a plain ``ValueIndex`` if its database has none
+    """
+    if connection is None:
+        from django.db import connection
+    name = INDEXES.get(connection.vendor)
+    if name is None:
+        return ValueIndex()
+    index = globals()[name]()
+    if (connection.alias, name) not in _available:
+        _available[(connection.alias, name)] = index.is_available(connection)
+    return index if _available[(connection.alias, name)] else ValueIndex()
+
+
+def setup(connection):
+    """
+    Creates the substring index of ``connection``, if any
+    """
+    with connection.cursor() as cursor:
+        for sql in get_index(connection).setup_sql:
+            cursor.execute(sql.format(table=ARTIFACTS_TABLE))
+
+
+def teardown(connection):
+    with connection.cursor() as cursor:
+        for sql in get_index(connection).teardown_sql:
+            cursor.execute(sql.format(table=ARTIFACTS_TABLE))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from fir_artifacts import index
+
+
+def hash_values(apps, schema_editor):
+    Artifact = apps.get_model('fir_artifacts', 'Artifact')
+    for pk, value in Artifact.objects.values_list('pk', 'value').iterator():
+        Artifact.objects.filter(pk=pk).update(value_hash=index.get_hash(value))
+
+
+def create_value_index(apps, schema_editor):
+    index.setup(schema_editor.connection)
+
+
+def drop_value_index(apps, schema_editor):
+    index.teardown(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fir_artifacts', '0006_auto_20170110_1415'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artifact',
+            name='value_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(hash_values, migrations.RunPython.noop),
+        migrations.RunPython(create_value_index, drop_value_index),
+    ]
@@ -3,6 +3,8 @@ import os
 from django.db import models
 from fir_plugins.models import ManyLinkableModel, OneLinkableModel
 
+from fir_artifacts import index
+
 
 class ArtifactBlacklistItem(models.Model):
     type = models.CharField(max_length=20)
@@ -15,6 +17,11 @@ class ArtifactBlacklistItem(models.Model):
 class Artifact(ManyLinkableModel):
     type = models.CharField(max_length=20)
     value = models.TextField()
+    value_hash = models.CharField(max_length=40, db_index=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.value_hash = index.get_hash(self.value)
+        super(Artifact, self).save(*args, **kwargs)
 
     def __unicode__(self):
         display = self.value
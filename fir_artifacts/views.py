@@ -17,6 +17,10 @@ def artifacts_correlations(request, artifact_id):
     correlations = a.relations_for_user(request.user).group()
     if all([not link_type.objects.exists() for link_type in correlations.values()]):
         raise PermissionDenied
+    for link_type in correlations.values():
+        if hasattr(link_type.model.model, 'authorization'):
+            link_type.model.model.authorization.permissions_for(
+                request.user, link_type.objects, ['incidents.view_incidents', 'incidents.handle_incidents'])
     return render(request, 'fir_artifacts/correlation_list.html', {'correlations': correlations,
                                                                    'artifact': a,
                                                                    'incident_show_id': settings.INCIDENT_SHOW_ID})
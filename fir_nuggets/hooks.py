@@ -1,22 +1,32 @@
-import re
-
 from django.db.models import Q
 
-def keyword_filter(q, query_string):
-    nugget = re.search("nugget:(\S+)", query_string)
-    if nugget:
-        nugget = nugget.group(1)
-        q = q & Q(nugget__source__icontains=nugget) | Q(nugget__raw_data__icontains=nugget) | Q(nugget__interpretation__icontains=nugget)
-        query_string = query_string.replace('nugget:' + nugget, '')
-    return q, query_string
+from incidents.search.query import SearchOperator
+
+
+def nuggets_filter(value):
+    from fir_nuggets.models import Nugget
+
+    nuggets = Nugget.objects.filter(Q(source__icontains=value) | Q(raw_data__icontains=value) |
+                                    Q(interpretation__icontains=value))
+    return Q(pk__in=nuggets.values('incident'))
 
 
 def search_filter(q, query_string):
-    q = q | (Q(nugget__source__icontains=query_string) | Q(nugget__raw_data__icontains=query_string) | Q(nugget__interpretation__icontains=query_string))
+    q = q | nuggets_filter(query_string)
     return q, query_string
 
 
+def search_text(incident_ids):
+    from fir_nuggets.models import Nugget
+
+    for nugget in Nugget.objects.filter(incident__in=incident_ids).order_by('date', 'pk'):
+        yield nugget.incident_id, u"\n".join([nugget.source, nugget.raw_data, nugget.interpretation])
+
+
 hooks = {
-    "keyword_filter": keyword_filter,
-    "search_filter": search_filter
+    "search_operators": {
+        "nugget": SearchOperator(lambda value, comparator, user: nuggets_filter(value))
+    },
+    "search_filter": search_filter,
+    "search_text": search_text
 }
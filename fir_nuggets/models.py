@@ -2,10 +2,13 @@
 import datetime
 
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django import forms
 from django.contrib.auth.models import User
 
 from incidents.models import Incident
+from incidents.search import index as search_index
 
 
 class Nugget(models.Model):
@@ -24,6 +27,12 @@ class Nugget(models.Model):
         return u"Nugget: {} in {} ({})".format(self.source, self.incident, self.interpretation)
 
 
+@receiver(post_save, sender=Nugget)
+@receiver(post_delete, sender=Nugget)
+def index_nugget_search_document(sender, instance, **kwargs):
+    search_index.schedule_refresh([instance.incident_id], after_commit=kwargs['signal'] is post_delete)
+
+
 class NuggetForm(forms.ModelForm):
 
     class Meta:
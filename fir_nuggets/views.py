@@ -66,7 +66,7 @@ def new(request, event_id, authorization_target=None):
 
 @login_required
 def edit(request, nugget_id):
-    n = get_object_or_404(Nugget, pk=nugget_id)
+    n = get_object_or_404(Nugget.objects.select_related('incident'), pk=nugget_id)
     e = n.incident
     if not request.user.has_perm('incidents.handle_incidents', obj=e):
         ret = {'status': 'error', 'data': ['Permission denied', ]}
@@ -97,7 +97,7 @@ def edit(request, nugget_id):
 
 @login_required
 def delete(request, nugget_id):
-    n = get_object_or_404(Nugget, pk=nugget_id)
+    n = get_object_or_404(Nugget.objects.select_related('incident'), pk=nugget_id)
     e = n.incident
     if not request.user.has_perm('incidents.handle_incidents', obj=e):
         ret = {'status': 'error', 'data': ['Permission denied', ]}
@@ -96,7 +96,16 @@ class RelationQuerySet(models.QuerySet):
 
     def as_template_objects(self, request, relation_type='target'):
         relations = []
-        for relation in self:
+        loaded = list(self.prefetch_related('source', 'target'))
+        objects = {}
+        for relation in loaded:
+            for obj in (relation.source, relation.target):
+                if obj is not None and hasattr(obj.__class__, 'authorization'):
+                    objects.setdefault(obj.__class__, []).append(obj)
+        for model, model_objects in objects.items():
+            model.authorization.permissions_for(request.user, model_objects,
+                                                ['incidents.view_incidents', 'incidents.handle_incidents'])
+        for relation in loaded:
             template_relation = TemplateRelation(relation, request, relation_type=relation_type)
             if template_relation.can_view:
                 relations.append(template_relation)
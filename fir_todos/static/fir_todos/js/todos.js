@@ -2,8 +2,9 @@ $(function () {
 	if ($('#fir_todos').length > 0) {
 		function refresh_tasks_dashboard(element) {
 			page = element.data('page') || 1;
+			cursor = element.data('cursor') || '';
 			url = $('#tab_tasks').data('url');
-			$.get(url, { 'page': page }, function (data) {
+			$.get(url, { 'page': page, 'cursor': cursor }, function (data) {
 				$('#fir_todos').html(data);
 			});
 		}
@@ -6,9 +6,9 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
 
+from incidents import pagination
 from incidents.authorization.decorator import authorization_required
 from incidents.views import is_incident_viewer
 from incidents.models import Incident, model_created, BusinessLine
@@ -18,7 +18,8 @@ from fir_todos.models import TodoItem, TodoItemForm, TodoListTemplate
 
 @require_POST
 @login_required
-@authorization_required('incidents.handle_incidents', Incident, view_arg='incident_id')
+@authorization_required('incidents.handle_incidents', Incident, view_arg='incident_id',
+                        select_related=('category',))
 def create(request, incident_id, authorization_target=None):
     if authorization_target is None:
         incident = get_object_or_404(
@@ -46,7 +47,7 @@ def list(request, incident_id, authorization_target=None):
             pk=incident_id)
     else:
         incident = authorization_target
-    todos = incident.todoitem_set.all()
+    todos = incident.todoitem_set.select_related('category', 'business_line')
     if request.user.has_perm('incidents.handle_incidents', obj=incident):
         form = TodoItemForm(for_user=request.user)
     else:
@@ -60,7 +61,7 @@ def list(request, incident_id, authorization_target=None):
 @require_POST
 @login_required
 def delete(request, todo_id):
-    todo = get_object_or_404(TodoItem, pk=todo_id)
+    todo = get_object_or_404(TodoItem.objects.select_related('incident', 'business_line'), pk=todo_id)
     if not request.user.has_perm(todo.incident, 'incidents.handle_incidents'):
         raise PermissionDenied()
     todo.delete()
@@ -71,7 +72,7 @@ def delete(request, todo_id):
 @require_POST
 @login_required
 def toggle_status(request, todo_id):
-    todo = get_object_or_404(TodoItem, pk=todo_id)
+    todo = get_object_or_404(TodoItem.objects.select_related('incident', 'business_line'), pk=todo_id)
     if (todo.business_line and request.user.has_perm('incidents.view_incidents', obj=todo.business_line)) or \
             request.user.has_perm('incidents.handle_incidents', obj=todo.incident):
         todo.done = not todo.done
@@ -98,14 +99,9 @@ def dashboard(request):
     todos = todos.select_related('incident', 'category')
     todos = todos.order_by('-incident__date')
 
-    page = request.GET.get('page', 1)
-    todos_per_page = request.user.profile.incident_number
-    p = Paginator(todos, todos_per_page)
-
-    try:
-        todos = p.page(page)
-    except (PageNotAnInteger, EmptyPage):
-        todos = p.page(1)
+    todos = pagination.paginate(request, todos, request.user.profile.incident_number)
+    Incident.authorization.permissions_for(request.user, [todo.incident for todo in todos],
+                                           'incidents.handle_incidents')
 
     return render(request, 'fir_todos/dashboard.html', {'todos': todos})
 
@@ -0,0 +1,182 @@
+"""
+Authorization benchmark helpers
+
+ Synthetic fixtures are inserted with ``bulk_create`` and are meant for a throwaway database.
+
+"""
+import datetime
+import random
+import time
+
+import django
+from django.contrib.auth.models import Group, Permission, User
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from incidents.authorization import cache as authorization_cache
+
+BATCH_SIZE = 10000
+
+
+def generate_forest(model, roots, depth, fanout, prefix='Benchmark'):
+    """
+    Creates ``roots`` trees of ``depth`` levels where every node has ``fanout`` children, returns all the nodes
+    """
+    nodes = []
+    level = []
+    for i in range(roots):
+        level.append(model.add_root(name='{} {}'.format(prefix, i)))
+    nodes.extend(level)
+    for d in range(1, depth):
+        children = []
+        for node in level:
+            for j in range(fanout):
+                children.append(node.add_child(name='{}.{}'.format(node.name, j)))
+        nodes.extend(children)
+        level = children
+    return nodes
+
+
+def generate_role(name, permissions):
+    role = Group.objects.create(name=name)
+    for permission in permissions:
+        app_label, codename = permission.split('.', 1)
+        role.permissions.add(Permission.objects.get(content_type__app_label=app_label, codename=codename))
+    return role
+
+
+def generate_user(username, business_lines, role):
+    """
+    Creates a user holding ``role`` on ``business_lines``
+    """
+    from incidents.models import AccessControlEntry, Profile
+
+    user = User.objects.create_user(username, '{}@example.com'.format(username), username)
+    Profile.objects.create(user=user)
+    for business_line in business_lines:
+        AccessControlEntry.objects.create(user=user, business_line=business_line, role=role)
+    return user
+
+
+def generate_incidents(model, count, business_lines, category, detection, opened_by, seed=0):
+    """
+    Inserts ``count`` incidents concerning one or two random ``business_lines``
+    """
+    rng = random.Random(seed)
+    through = model.concerned_business_lines.through
+    now = datetime.datetime.now()
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        with transaction.atomic():
+            model.objects.bulk_create([
+                model(subject='Benchmark incident {}'.format(start + i), description='Benchmark',
+                      category=category, detection=detection, opened_by=opened_by,
+                      severity=rng.randint(1, 4), status=rng.choice('OBC'),
+                      date=now - datetime.timedelta(minutes=rng.randint(0, 1051200)))
+                for i in range(size)])
+            pks = list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+            links = []
+            for pk in pks:
+                for business_line in rng.sample(business_lines, rng.randint(1, 2)):
+                    links.append(through(incident_id=pk, businessline_id=business_line.pk))
+            through.objects.bulk_create(links)
+            last = pks[-1]
+
+
+def generate_fixture(roots=2, depth=3, fanout=5, users=5, aces=3, incidents=1000, seed=0):
+    """
+    Creates a business line forest, users holding a role on ``aces`` random nodes and ``incidents`` incidents
+
+    Needs the seed data (categories and labels). Returns the created users.
+    """
+    from incidents.models import BusinessLine, Incident, IncidentCategory, Label
+
+    rng = random.Random(seed)
+    business_lines = generate_forest(BusinessLine, roots, depth, fanout)
+    role = generate_role('Benchmark role', ['incidents.view_incidents', 'incidents.handle_incidents'])
+    created = [generate_user('benchmark{}'.format(i), rng.sample(business_lines, min(aces, len(business_lines))), role)
+               for i in range(users)]
+    owner = User.objects.create_user('benchmark', 'benchmark@example.com', 'benchmark')
+    generate_incidents(Incident, incidents, business_lines, IncidentCategory.objects.first(),
+                       Label.objects.filter(group__name='detection').first(), owner, seed=seed)
+    return created
+
+
+def measure(function, repeat=3, setup=None):
+    """
+    Returns the wall clock times of ``repeat`` calls to ``function``, in seconds
+
+    ``setup`` is called before each run, outside of the measure.
+    """
+    timings = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'mean': sum(timings) / len(timings),
+        'max': timings[-1],
+    }
+
+
+def run(users, repeat=3, page_size=50, permission='incidents.view_incidents'):
+    """
+    Times the authorization entry points for each of ``users``
+
+    Returns a JSON serializable dict of timing summaries, one per operation.
+    """
+    from incidents.models import Incident
+    from incidents.views import search
+
+    factory = RequestFactory()
+    sample = list(Incident.objects.order_by('?')[:page_size])
+
+    def clear_caches():
+        authorization_cache.invalidate_all()
+        for user in users:
+            for attribute in ('_perm_cache', '_user_perm_cache', '_group_perm_cache'):
+                if hasattr(user, attribute):
+                    delattr(user, attribute)
+
+    def search_view(user):
+        request = factory.get('/search/', {'q': 'Benchmark'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user
+        return search(request)
+
+    operations = [
+        ('get_authorization_paths', lambda user: Incident._authorization_meta.model.get_authorization_paths(
+            user, (permission,))),
+        ('for_user.count', lambda user: Incident.authorization.for_user(user, permission).count()),
+        ('for_user.page', lambda user: list(
+            Incident.authorization.for_user(user, permission).order_by('-date')[:page_size])),
+        ('has_perm', lambda user: [user.has_perm(permission, obj=incident) for incident in sample]),
+        ('has_model_perm', lambda user: Incident.has_model_perm(user, permission)),
+        ('search', search_view),
+    ]
+    results = {}
+    for name, operation in operations:
+        timings = []
+        for user in users:
+            timings.extend(measure(lambda: operation(user), repeat=repeat, setup=clear_caches))
+        results[name] = summarize(timings)
+    results['has_perm']['objects'] = len(sample)
+    return results
+
+
+def environment():
+    return {
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'date': datetime.datetime.now().isoformat(),
+    }
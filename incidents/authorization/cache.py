@@ -0,0 +1,120 @@
+"""
+Tree authorization paths cache
+
+ Two layers:
+  - a request layer, stored on the user instance (like Django's ``_perm_cache``)
+  - a shared layer, using the Django cache named by ``AUTHORIZATION_CACHE``
+
+ Entries are invalidated with generation counters: one per user and a global one.
+
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import six
+
+USER_CACHE_ATTRIBUTE = '_authorization_paths_cache'
+OBJECT_CACHE_ATTRIBUTE = '_authorization_permissions_cache'
+
+_local_generation = [0]
+
+
+def _get_shared_cache():
+    alias = getattr(settings, 'AUTHORIZATION_CACHE', None)
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def _generation_key(user_id=None):
+    if user_id is None:
+        return 'fir:authorization:generation'
+    return 'fir:authorization:generation:{}'.format(user_id)
+
+
+def get_permission_key(permission):
+    if permission is None:
+        return None
+    if isinstance(permission, six.string_types):
+        permission = (permission,)
+    return tuple(sorted(set(permission)))
+
+
+def bump_generation(cache, key):
+    # Start from the current time: an evicted counter will not be reset to an old value
+    if cache.add(key, int(time.time() * 1000), None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def get_paths(model, user, permission, loader):
+    """
+    Returns the cached authorization paths of ``user`` on the tree ``model`` for ``permission``
+
+    ``loader`` is called to fetch the paths from the database when no layer holds them
+    """
+    key = (model._meta.label_lower, get_permission_key(permission))
+    local = getattr(user, USER_CACHE_ATTRIBUTE, None)
+    if local is None or local.get('generation') != _local_generation[0]:
+        local = {'generation': _local_generation[0]}
+        setattr(user, USER_CACHE_ATTRIBUTE, local)
+    if key in local:
+        return local[key]
+    shared = _get_shared_cache()
+    if shared is None or user.pk is None:
+        paths = list(loader())
+    else:
+        generation_keys = [_generation_key(), _generation_key(user.pk)]
+        generations = shared.get_many(generation_keys)
+        cache_key = 'fir:authorization:paths:{}:{}:{}:{}:{}'.format(
+            key[0], user.pk,
+            generations.get(generation_keys[0], 0), generations.get(generation_keys[1], 0),
+            ','.join(key[1]) if key[1] is not None else '*')
+        paths = shared.get(cache_key)
+        if paths is None:
+            paths = list(loader())
+            shared.set(cache_key, paths, getattr(settings, 'AUTHORIZATION_CACHE_TIMEOUT', 300))
+    local[key] = paths
+    return paths
+
+
+def get_object_permission(obj, user, permission):
+    """
+    Returns the permission resolved in bulk for ``user`` on ``obj``, None if unknown
+    """
+    return getattr(obj, OBJECT_CACHE_ATTRIBUTE, {}).get((user.pk, get_permission_key(permission)))
+
+
+def set_object_permission(obj, user, permission, granted):
+    if not hasattr(obj, OBJECT_CACHE_ATTRIBUTE):
+        setattr(obj, OBJECT_CACHE_ATTRIBUTE, {})
+    getattr(obj, OBJECT_CACHE_ATTRIBUTE)[(user.pk, get_permission_key(permission))] = granted
+
+
+def invalidate_user(user_id):
+    """
+    Invalidates the cached paths of a single user
+    """
+    _local_generation[0] += 1
+    shared = _get_shared_cache()
+    if shared is not None and user_id is not None:
+        bump_generation(shared, _generation_key(user_id))
+
+
+def invalidate_users(user_ids):
+    for user_id in set(user_ids):
+        invalidate_user(user_id)
+
+
+def invalidate_all():
+    """
+    Invalidates the cached paths of every user (e.g. after a tree move)
+    """
+    _local_generation[0] += 1
+    shared = _get_shared_cache()
+    if shared is not None:
+        bump_generation(shared, _generation_key())
@@ -5,6 +5,7 @@ from django.utils import six
 from django.apps.registry import apps
 
 from incidents.authorization import AuthorizationManager
+from incidents.authorization import cache as authorization_cache
 
 
 def get_authorization_filter(cls, user, permission=None, fields=None):
@@ -29,21 +30,24 @@ def has_perm(self, user, permission):
         return True
     if isinstance(permission, six.string_types):
         permission = [permission, ]
+    granted = authorization_cache.get_object_permission(self, user, permission)
+    if granted is not None:
+        return granted
     if user.has_perms(permission):
         return True
     if self._authorization_meta.owner_field and self._authorization_meta.owner_permission and \
        self._authorization_meta.owner_permission in permission and \
        user.pk == getattr(self, self._authorization_meta.owner_field).pk:
         return True
-    paths = self._authorization_meta.model.get_authorization_paths(user, permission)
-    if not paths.count():
+    tree_model = self._authorization_meta.model
+    paths = tree_model.minimize_paths(tree_model.get_authorization_paths(user, permission))
+    if not len(paths):
         return False
     for field in self._authorization_meta.fields:
         f = self._meta.get_field(field)
         relation = getattr(self, field)
         if isinstance(f, models.ManyToManyField):
-            qs_filter = reduce(lambda x, y: x | y, [Q(path__startswith=path) for path in paths])
-            if relation.filter(qs_filter).distinct().exists():
+            if relation.filter(tree_model.get_path_filter(paths)).exists():
                 return True
         elif isinstance(f, models.ForeignKey):
             if relation is not None and any(relation.path.startswith(p) for p in paths):
@@ -59,7 +63,8 @@ def has_model_perm(cls, user, permission):
     return model_perm
 
 
-def tree_authorization(fields=None, tree_model='incidents.BusinessLine', owner_field=None, owner_permission=None):
+def tree_authorization(fields=None, tree_model='incidents.BusinessLine', owner_field=None, owner_permission=None,
+                       index_model=None):
     def set_meta(cls):
         if not hasattr(cls, '_authorization_meta'):
             class AuthorizationMeta:
@@ -67,6 +72,7 @@ def tree_authorization(fields=None, tree_model='incidents.BusinessLine', owner_f
                 owner_permission = None
                 fields = ('business_lines',)
                 tree_model = None
+                index = None
 
                 @property
                 def model(self):
@@ -74,7 +80,14 @@ def tree_authorization(fields=None, tree_model='incidents.BusinessLine', owner_f
                         self.tree_model = apps.get_model(*self.tree_model.split('.'))
                     return self.tree_model
 
+                @property
+                def index_model(self):
+                    if isinstance(self.index, six.string_types):
+                        self.index = apps.get_model(*self.index.split('.'))
+                    return self.index
+
             AuthorizationMeta.tree_model = tree_model
+            AuthorizationMeta.index = index_model
             cls._authorization_meta = AuthorizationMeta()
         if fields is not None:
             if isinstance(fields, (tuple, list)):
@@ -101,22 +114,37 @@ def tree_authorization(fields=None, tree_model='incidents.BusinessLine', owner_f
     return set_meta
 
 
-def authorization_required(perm, model, view_arg=None):
+def authorization_required(perm, model, view_arg=None, select_related=None, prefetch_related=None, queryset=None):
+    """
+    Fetches the object named by ``view_arg`` among the ones ``perm`` grants to the user and
+    passes it to the view as ``authorization_target``
+
+    ``select_related`` and ``prefetch_related`` are applied to the lookup, so the object arrives
+    with everything the view needs. ``queryset`` may instead be a callable receiving the
+    authorized queryset and returning the one to fetch the object from.
+    A missing object (or a malformed identifier) raises PermissionDenied, other errors propagate.
+    """
+
+    def _get_object(request, obj_id):
+        objects = model.authorization.for_user(request.user, perm)
+        if select_related is not None:
+            objects = objects.select_related(*select_related)
+        if prefetch_related is not None:
+            objects = objects.prefetch_related(*prefetch_related)
+        if queryset is not None:
+            objects = queryset(objects)
+        try:
+            return objects.get(pk=obj_id)
+        except (model.DoesNotExist, ValueError):
+            raise PermissionDenied()
 
     def _decorator(view_func):
         def _view(request, *args, **kwargs):
             obj = model
             if isinstance(view_arg, six.string_types):
-                try:
-                    obj_id = kwargs.get(view_arg)
-                    obj = model.authorization.for_user(request.user, perm).get(pk=obj_id)
-                except:
-                    raise PermissionDenied()
+                obj = _get_object(request, kwargs.get(view_arg))
             elif isinstance(view_arg, int):
-                try:
-                    obj = model.authorization.for_user(request.user, perm).get(pk=args[view_arg])
-                except:
-                    raise PermissionDenied()
+                obj = _get_object(request, args[view_arg])
             else:
                 if not request.user.has_perm(perm, obj=model):
                     raise PermissionDenied()
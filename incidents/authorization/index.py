@@ -0,0 +1,197 @@
+"""
+Materialized authorization index
+
+ Stores one (user, object, permission) row for each object a user can reach through
+ an access control entry (or as its owner), so that ``for_user`` becomes a semi-join.
+
+ The index is only used and maintained when ``AUTHORIZATION_INDEX`` is True.
+
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+BATCH_SIZE = 1000
+
+
+def is_enabled(model):
+    if not getattr(settings, 'AUTHORIZATION_INDEX', False):
+        return False
+    meta = getattr(model, '_authorization_meta', None)
+    return meta is not None and meta.index_model is not None
+
+
+def get_object_field(model):
+    index_model = model._authorization_meta.index_model
+    for field in index_model._meta.fields:
+        if field.related_model is model:
+            return field.name
+    raise Exception("Authorization index {} has no link to {}".format(index_model.__name__, model.__name__))
+
+
+def get_owner_permission_id(model):
+    meta = model._authorization_meta
+    if not meta.owner_field or not meta.owner_permission:
+        return None
+    return meta.model._get_permission_ids([meta.owner_permission])[0]
+
+
+def index_filter(model, user, permission=None):
+    """
+    Returns a lookup keeping the objects indexed for ``user`` with one of the ``permission``
+    """
+    index_model = model._authorization_meta.index_model
+    rows = index_model.objects.filter(user=user.pk)
+    if permission is not None:
+        rows = rows.filter(permission__in=model._authorization_meta.model._get_permission_ids(permission))
+    return Q(pk__in=rows.values('{}_id'.format(get_object_field(model))))
+
+
+def _get_prefixes(tree_model, path):
+    return [path[:i] for i in range(tree_model.steplen, len(path) + 1, tree_model.steplen)]
+
+
+def compute_rows(model, pks):
+    """
+    Returns the (user_id, object_id, permission_id) rows the live rule grants on objects ``pks``
+    """
+    meta = model._authorization_meta
+    tree_model = meta.model
+    links = set()
+    for field in meta.fields:
+        links.update(model.objects.filter(pk__in=pks, **{'{}__isnull'.format(field): False}).values_list(
+            'pk', '{}__path'.format(field)))
+    prefixes = set()
+    for pk, path in links:
+        prefixes.update(_get_prefixes(tree_model, path))
+    grants = defaultdict(set)
+    if len(prefixes):
+        for path, user_id, permission_id in tree_model.objects.filter(
+                path__in=prefixes, acl__role__permissions__isnull=False).values_list(
+                'path', 'acl__user', 'acl__role__permissions'):
+            grants[path].add((user_id, permission_id))
+    rows = set()
+    for pk, path in links:
+        for prefix in _get_prefixes(tree_model, path):
+            for user_id, permission_id in grants.get(prefix, ()):
+                rows.add((user_id, pk, permission_id))
+    owner_permission = get_owner_permission_id(model)
+    if owner_permission is not None:
+        for pk, owner in model.objects.filter(pk__in=pks).values_list('pk', meta.owner_field):
+            if owner is not None:
+                rows.add((owner, pk, owner_permission))
+    return rows
+
+
+def compute_user_rows(model, user_id):
+    """
+    Returns the (user_id, object_id, permission_id) rows the live rule grants to ``user_id``
+    """
+    meta = model._authorization_meta
+    tree_model = meta.model
+    permissions = defaultdict(set)
+    for path, permission_id in tree_model.objects.filter(
+            acl__user=user_id, acl__role__permissions__isnull=False).values_list('path', 'acl__role__permissions'):
+        permissions[path].add(permission_id)
+    rows = set()
+    for path, path_permissions in permissions.items():
+        lookup = Q()
+        for field in meta.fields:
+            lookup |= tree_model.get_path_filter([path], key='{}__path'.format(field))
+        for pk in model.objects.filter(lookup).values_list('pk', flat=True).distinct():
+            for permission_id in path_permissions:
+                rows.add((user_id, pk, permission_id))
+    owner_permission = get_owner_permission_id(model)
+    if owner_permission is not None:
+        for pk in model.objects.filter(**{meta.owner_field: user_id}).values_list('pk', flat=True):
+            rows.add((user_id, pk, owner_permission))
+    return rows
+
+
+def _store(model, rows):
+    index_model = model._authorization_meta.index_model
+    object_field = '{}_id'.format(get_object_field(model))
+    rows = list(rows)
+    for i in range(0, len(rows), BATCH_SIZE):
+        index_model.objects.bulk_create([
+            index_model(**{'user_id': user_id, object_field: pk, 'permission_id': permission_id})
+            for user_id, pk, permission_id in rows[i:i + BATCH_SIZE]])
+
+
+def refresh_objects(model, pks):
+    """
+    Recomputes the index rows of the objects ``pks``
+    """
+    pks = list(set(pks))
+    index_model = model._authorization_meta.index_model
+    object_field = '{}_id__in'.format(get_object_field(model))
+    for i in range(0, len(pks), BATCH_SIZE):
+        batch = pks[i:i + BATCH_SIZE]
+        with transaction.atomic():
+            index_model.objects.filter(**{object_field: batch}).delete()
+            _store(model, compute_rows(model, batch))
+
+
+def refresh_users(model, user_ids):
+    """
+    Recomputes the index rows of the users ``user_ids``
+    """
+    index_model = model._authorization_meta.index_model
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        with transaction.atomic():
+            index_model.objects.filter(user=user_id).delete()
+            _store(model, compute_user_rows(model, user_id))
+
+
+def rebuild(model):
+    """
+    Rebuilds the whole index from the live rule
+    """
+    index_model = model._authorization_meta.index_model
+    with transaction.atomic():
+        index_model.objects.all().delete()
+        pks = list(model.objects.values_list('pk', flat=True))
+        for i in range(0, len(pks), BATCH_SIZE):
+            _store(model, compute_rows(model, pks[i:i + BATCH_SIZE]))
+
+
+def verify(model):
+    """
+    Compares the index with the live authorization filter
+
+    Returns a list of (user_id, permission_id, missing object ids, extra object ids)
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Permission
+
+    meta = model._authorization_meta
+    index_model = meta.index_model
+    object_field = '{}_id'.format(get_object_field(model))
+    pairs = set(index_model.objects.values_list('user_id', 'permission_id').distinct())
+    pairs.update(meta.model.objects.filter(acl__role__permissions__isnull=False).values_list(
+        'acl__user', 'acl__role__permissions').distinct())
+    owner_permission = get_owner_permission_id(model)
+    if owner_permission is not None:
+        pairs.update((owner, owner_permission) for owner in
+                     model.objects.values_list(meta.owner_field, flat=True).distinct() if owner is not None)
+    users = get_user_model().objects.in_bulk(set(user_id for user_id, permission_id in pairs))
+    permissions = dict((p.pk, '{}.{}'.format(p.content_type.app_label, p.codename)) for p in
+                       Permission.objects.filter(pk__in=set(p for u, p in pairs)).select_related('content_type'))
+    differences = []
+    for user_id, permission_id in sorted(pairs):
+        user = users[user_id]
+        permission = permissions[permission_id]
+        # Users with a global permission do not go through the index
+        if user.is_superuser or user.has_perms([permission]):
+            continue
+        indexed = set(index_model.objects.filter(user=user_id, permission=permission_id).values_list(
+            object_field, flat=True))
+        live = set(model.objects.filter(model.get_authorization_filter(user, permission)).values_list(
+            'pk', flat=True).distinct())
+        if indexed != live:
+            differences.append((user_id, permission_id, sorted(live - indexed), sorted(indexed - live)))
+    return differences
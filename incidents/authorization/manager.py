@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.utils import six
 
+from incidents.authorization import cache as authorization_cache
+from incidents.authorization import index as authorization_index
+
 
 class AuthorizationManager(models.Manager):
     def for_user(self, user, permission=None):
@@ -10,5 +15,54 @@ class AuthorizationManager(models.Manager):
             return self.get_queryset()
         if permission is not None and user.has_perms(permission):
             return self.get_queryset()
+        if authorization_index.is_enabled(self.model):
+            return self.get_queryset().filter(authorization_index.index_filter(self.model, user, permission))
         qs_filter = self.model.get_authorization_filter(user, permission)
-        return self.get_queryset().filter(qs_filter).distinct()
+        return self.filter_authorized(qs_filter)
+
+    def filter_authorized(self, qs_filter):
+        """
+        Applies the authorization filter following ``AUTHORIZATION_QUERY_STRATEGY``
+
+         - 'subquery': ``pk IN (SELECT ...)`` over a narrow subquery
+         - 'exists': correlated ``EXISTS`` subquery
+         - 'distinct': join and deduplicate the outer query (previous behaviour)
+
+        Tree models are filtered on their own path, they never need a semi-join.
+        """
+        strategy = getattr(settings, 'AUTHORIZATION_QUERY_STRATEGY', 'subquery')
+        if strategy == 'distinct':
+            return self.get_queryset().filter(qs_filter).distinct()
+        if not hasattr(self.model, '_authorization_meta'):
+            return self.get_queryset().filter(qs_filter)
+        authorized = self.model._default_manager.filter(qs_filter)
+        if strategy == 'exists':
+            return self.get_queryset().annotate(
+                _authorized=Exists(authorized.filter(pk=OuterRef('pk')).values('pk'))).filter(_authorized=True)
+        if strategy == 'subquery':
+            return self.get_queryset().filter(pk__in=authorized.values('pk'))
+        raise ValueError("Unknown authorization query strategy '{}'".format(strategy))
+
+    def permissions_for(self, user, objects, permissions):
+        """
+        Resolves ``permissions`` for ``user`` on all ``objects`` with one query per permission
+
+        Each permission may also be a list of permissions, matched like in ``for_user``.
+        Returns a dict mapping the object primary keys to their granted permissions. The results
+        are also kept on the objects, where ``has_perm`` looks for them first.
+        """
+        if isinstance(permissions, six.string_types):
+            permissions = (permissions,)
+        objects = list(objects)
+        pks = [obj.pk for obj in objects]
+        granted = dict((pk, set()) for pk in pks)
+        if not len(pks):
+            return granted
+        for permission in permissions:
+            key = permission if isinstance(permission, six.string_types) else tuple(permission)
+            allowed = set(self.for_user(user, permission).filter(pk__in=pks).values_list('pk', flat=True))
+            for obj in objects:
+                authorization_cache.set_object_permission(obj, user, permission, obj.pk in allowed)
+                if obj.pk in allowed:
+                    granted[obj.pk].add(key)
+        return granted
@@ -3,6 +3,7 @@ from django.db import models
 from django.utils import six
 
 from incidents.authorization import AuthorizationManager
+from incidents.authorization import cache as authorization_cache
 
 
 class AuthorizationModelMixin(models.Model):
@@ -30,10 +31,14 @@ class AuthorizationModelMixin(models.Model):
             permissions.append(perm_id)
         return permissions
 
+    @classmethod
+    def get_root_paths(cls):
+        return list(cls.get_root_nodes().values_list('path', flat=True))
+
     @classmethod
     def get_authorization_paths(cls, user, permission=None):
         if user.is_superuser:
-            return cls.objects.all()
+            return cls.get_root_paths()
         user_obj = user
         user = user.pk
         qs_filter = {'acl__user': user}
@@ -41,7 +46,7 @@ class AuthorizationModelMixin(models.Model):
             if not isinstance(permission, (tuple, list)):
                 permission = (permission,)
             if user_obj.has_perms(permission):
-                return cls.objects.all()
+                return cls.get_root_paths()
 
             permissions = cls._get_permission_ids(permission)
 
@@ -49,7 +54,47 @@ class AuthorizationModelMixin(models.Model):
                 qs_filter['acl__role__permissions'] = permissions[0]
             else:
                 qs_filter['acl__role__permissions__in'] = permissions
-        return cls.objects.filter(**qs_filter).distinct().values_list('path', flat=True)
+        return authorization_cache.get_paths(
+            cls, user_obj, permission,
+            lambda: cls.objects.filter(**qs_filter).distinct().values_list('path', flat=True))
+
+    @classmethod
+    def minimize_paths(cls, paths):
+        """
+        Drops the paths already covered by an ancestor path
+        """
+        minimized = []
+        for path in sorted(paths):
+            if len(minimized) and path.startswith(minimized[-1]):
+                continue
+            minimized.append(path)
+        return minimized
+
+    @classmethod
+    def get_path_upper_bound(cls, path):
+        """
+        Returns the first path of the same length sorting after all the descendants of ``path``, None if there is none
+        """
+        alphabet = getattr(cls, 'alphabet', '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+        for i in reversed(range(len(path))):
+            position = alphabet.index(path[i])
+            if position + 1 < len(alphabet):
+                return path[:i] + alphabet[position + 1] + alphabet[0] * (len(path) - i - 1)
+        return None
+
+    @classmethod
+    def get_path_filter(cls, paths, key='path'):
+        """
+        Returns a filter matching the nodes under ``paths`` with index friendly range lookups
+        """
+        lookup = models.Q()
+        for path in cls.minimize_paths(paths):
+            path_lookup = models.Q(**{'{}__gte'.format(key): path})
+            upper_bound = cls.get_path_upper_bound(path)
+            if upper_bound is not None:
+                path_lookup &= models.Q(**{'{}__lt'.format(key): upper_bound})
+            lookup |= path_lookup
+        return lookup
 
     @classmethod
     def get_authorization_filter(cls, user, permission=None):
@@ -57,25 +102,28 @@ class AuthorizationModelMixin(models.Model):
         if permission is not None and user.has_perms(permission):
             return models.Q()
         paths = cls.get_authorization_paths(user, permission=permission)
-        if not paths.count():
+        if not len(paths):
             return lookup
-        lookup |= reduce(lambda x, y: x | y, [models.Q(**{'path__startswith': path}) for path in paths])
+        lookup |= cls.get_path_filter(paths)
         return lookup
 
     @classmethod
     def get_authorization_objects_filter(cls, user, fields, permission=None):
         paths = cls.get_authorization_paths(user, permission=permission)
         lookup = models.Q(pk=0)
-        if not paths.count():
+        if not len(paths):
             return lookup
         if isinstance(fields, six.string_types):
             fields = (fields,)
         for field in fields:
-            key = '{field}__path__startswith'.format(field=field)
-            lookup |= reduce(lambda x, y: x | y, [models.Q(**{key: path}) for path in paths])
+            key = '{field}__path'.format(field=field)
+            lookup |= cls.get_path_filter(paths, key=key)
         return lookup
 
     def has_perm(self, user, permission):
+        granted = authorization_cache.get_object_permission(self, user, permission)
+        if granted is not None:
+            return granted
         return self.__class__.authorization.for_user(user, permission).filter(pk=self.pk).distinct().exists()
 
     @classmethod
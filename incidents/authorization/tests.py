@@ -1,7 +1,12 @@
 from django.contrib.auth.models import User, Group, Permission
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import FieldError, PermissionDenied
+from django.test import RequestFactory, TestCase, override_settings
 
 from incidents import models
+from incidents.authorization import benchmark
+from incidents.authorization import index as authorization_index
+from incidents.authorization.decorator import authorization_required
 
 
 # Create your tests here.
@@ -180,6 +185,57 @@ class IncidentTestCase(TestCase):
         self.assertTrue(self.user3.has_perm('incidents.view_incidents', obj=self.incident_root_1))
         self.assertFalse(self.user3.has_perm('incidents.delete_incident', obj=self.incident_root_1))
 
+    def test_bulk_permissions(self):
+        permissions = ['incidents.add_incident', 'incidents.delete_incident', 'incidents.view_incidents']
+        incidents = list(models.Incident.objects.all())
+        granted = models.Incident.authorization.permissions_for(self.user1, incidents, permissions)
+        self.assertEqual(granted, {
+            self.incident_root_1.pk: {'incidents.add_incident'},
+            self.incident_child_12.pk: {'incidents.add_incident'},
+            self.incident_child_22.pk: set()})
+        with self.assertNumQueries(0):
+            for incident in incidents:
+                self.assertTrue(incident.has_perm(self.user1, 'incidents.add_incident') or
+                                incident == self.incident_child_22)
+        for incident in models.Incident.objects.all():
+            for permission in permissions:
+                self.assertEqual(incident.has_perm(self.user1, permission), permission in granted[incident.pk])
+
+    def test_authorization_required(self):
+        @authorization_required('incidents.add_incident', models.Incident, view_arg='incident_id',
+                                select_related=('category', 'opened_by'),
+                                prefetch_related=('concerned_business_lines',))
+        def view(request, incident_id, authorization_target=None):
+            return authorization_target
+
+        request = RequestFactory().get('/')
+        request.user = self.user1
+        incident = view(request, incident_id=self.incident_child_12.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(incident.category.name, "Incident category")
+            self.assertEqual(list(incident.concerned_business_lines.all()), [self.child12])
+        self.assertRaises(PermissionDenied, view, request, incident_id=self.incident_child_22.pk)
+        self.assertRaises(PermissionDenied, view, request, incident_id=0)
+        self.assertRaises(PermissionDenied, view, request, incident_id='nope')
+
+        @authorization_required('incidents.add_incident', models.Incident, view_arg='incident_id',
+                                queryset=lambda incidents: incidents.select_related('unknown'))
+        def broken_view(request, incident_id, authorization_target=None):
+            return authorization_target
+
+        self.assertRaises(FieldError, broken_view, request, incident_id=self.incident_child_12.pk)
+
+    def test_query_strategies(self):
+        self.incident_child_12.concerned_business_lines.add(self.child11)
+        for strategy in ['subquery', 'exists', 'distinct']:
+            with self.settings(AUTHORIZATION_QUERY_STRATEGY=strategy):
+                incidents = models.Incident.authorization.for_user(self.user1, 'incidents.add_incident')
+                self.assertEqual(sorted(i.pk for i in incidents),
+                                 sorted([self.incident_root_1.pk, self.incident_child_12.pk]))
+                self.assertEqual(incidents.count(), 2)
+                if strategy != 'distinct':
+                    self.assertNotIn('DISTINCT', str(incidents.query))
+
 
 class QuerySetBLTestCase(TestCase):
     def setUp(self):
@@ -244,3 +300,130 @@ class QuerySetBLTestCase(TestCase):
         self.assertEqual(models.BusinessLine.authorization.for_user(self.admin).count(), 6)
         self.assertEqual(models.BusinessLine.authorization.for_user(self.user1).count(), 3)
         self.assertEqual(models.BusinessLine.authorization.for_user(self.user2).count(), 4)
+
+    def test_minimized_paths(self):
+        paths = [self.child11.path, self.root_1.path, self.child12.path, self.root_2.path]
+        self.assertEqual(models.BusinessLine.minimize_paths(paths), sorted([self.root_1.path, self.root_2.path]))
+        path_filter = models.BusinessLine.get_path_filter([self.child11.path, self.root_1.path])
+        self.assertEqual(models.BusinessLine.objects.filter(path_filter).count(), 3)
+
+    def test_path_upper_bound(self):
+        self.assertEqual(models.BusinessLine.get_path_upper_bound('0001'), '0002')
+        self.assertEqual(models.BusinessLine.get_path_upper_bound('000Z'), '0010')
+        self.assertEqual(models.BusinessLine.get_path_upper_bound('00010009'), '0001000A')
+        self.assertIsNone(models.BusinessLine.get_path_upper_bound('ZZZZ'))
+
+
+@override_settings(AUTHORIZATION_CACHE='default')
+class AuthorizationCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root_1 = models.BusinessLine.add_root(name='Root 1')
+        self.child11 = self.root_1.add_child(name='Child 11')
+
+        self.root_2 = models.BusinessLine.add_root(name='Root 2')
+        self.child21 = self.root_2.add_child(name='Child 21')
+
+        self.user1 = User.objects.create_user('user1', 'user1@example.com', 'password')
+
+        self.adder, created = Group.objects.get_or_create(name='Adder')
+        self.adder.permissions.clear()
+        self.adder.permissions.add(get_permission_for_app(codename='add_incident'))
+
+        models.AccessControlEntry.objects.create(user=self.user1, business_line=self.child11, role=self.adder)
+
+    def get_paths(self, user=None):
+        if user is None:
+            user = User.objects.get(pk=self.user1.pk)
+        return models.BusinessLine.get_authorization_paths(user, 'incidents.add_incident')
+
+    def test_request_cache(self):
+        user = User.objects.get(pk=self.user1.pk)
+        self.assertEqual(self.get_paths(user), [self.child11.path])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_paths(user), [self.child11.path])
+
+    def test_shared_cache(self):
+        self.get_paths()
+        user = User.objects.get(pk=self.user1.pk)
+        # Only the global permission check is left
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_paths(user), [self.child11.path])
+
+    def test_acl_invalidation(self):
+        self.assertEqual(self.get_paths(), [self.child11.path])
+        ace = models.AccessControlEntry.objects.create(user=self.user1, business_line=self.root_2, role=self.adder)
+        self.assertEqual(sorted(self.get_paths()), sorted([self.child11.path, self.root_2.path]))
+        ace.delete()
+        self.assertEqual(self.get_paths(), [self.child11.path])
+
+    def test_role_invalidation(self):
+        self.assertEqual(self.get_paths(), [self.child11.path])
+        self.adder.permissions.clear()
+        self.assertEqual(self.get_paths(), [])
+
+    def test_move_invalidation(self):
+        self.assertEqual(self.get_paths(), [self.child11.path])
+        self.child11.move(self.root_2, pos='last-child')
+        self.child11 = models.BusinessLine.objects.get(pk=self.child11.pk)
+        self.assertEqual(self.get_paths(), [self.child11.path])
+        self.assertTrue(self.child11.path.startswith(self.root_2.path))
+
+
+@override_settings(AUTHORIZATION_INDEX=True)
+class IncidentIndexTestCase(IncidentTestCase):
+    def assertIndexMatches(self):
+        self.assertEqual(authorization_index.verify(models.Incident), [])
+
+    def test_incremental(self):
+        self.assertIndexMatches()
+        self.assertEqual(
+            set(models.Incident.authorization.for_user(self.user1, 'incidents.add_incident')),
+            {self.incident_root_1, self.incident_child_12})
+
+    def test_acl_changes(self):
+        adder = Group.objects.get(name='Adder')
+        ace = models.AccessControlEntry.objects.create(user=self.user2, business_line=self.child22, role=adder)
+        self.assertIndexMatches()
+        self.assertEqual(list(models.Incident.authorization.for_user(self.user2, 'incidents.add_incident')),
+                         [self.incident_child_22])
+        ace.delete()
+        self.assertIndexMatches()
+        self.assertFalse(models.Incident.authorization.for_user(self.user2, 'incidents.add_incident').exists())
+
+    def test_business_line_changes(self):
+        self.incident_child_22.concerned_business_lines.add(self.child11)
+        self.assertIndexMatches()
+        self.child22.move(self.root_1, pos='last-child')
+        self.assertIndexMatches()
+        self.assertEqual(models.Incident.authorization.for_user(self.user1, 'incidents.add_incident').count(), 3)
+
+    def test_rebuild(self):
+        models.IncidentAuthorization.objects.all().delete()
+        self.assertNotEqual(authorization_index.verify(models.Incident), [])
+        authorization_index.rebuild(models.Incident)
+        self.assertIndexMatches()
+
+
+class BenchmarkTestCase(TestCase):
+    fixtures = ['incidents/fixtures/seed_data.json', ]
+
+    def test_fixture(self):
+        business_lines = models.BusinessLine.objects.count()
+        users = benchmark.generate_fixture(roots=2, depth=2, fanout=3, users=2, aces=1, incidents=40)
+        self.assertEqual(models.BusinessLine.objects.count(), business_lines + 8)
+        self.assertEqual(models.Incident.objects.count(), 40)
+        for user in users:
+            business_line = models.AccessControlEntry.objects.get(user=user).business_line
+            self.assertEqual(
+                set(models.Incident.authorization.for_user(user, 'incidents.view_incidents')),
+                set(models.Incident.objects.filter(concerned_business_lines__path__startswith=business_line.path)))
+
+    def test_run(self):
+        users = benchmark.generate_fixture(roots=1, depth=2, fanout=2, users=1, aces=1, incidents=10)
+        results = benchmark.run(users, repeat=1)
+        self.assertEqual(set(results), {'get_authorization_paths', 'for_user.count', 'for_user.page', 'has_perm',
+                                        'has_model_perm', 'search'})
+        for summary in results.values():
+            self.assertEqual(summary['runs'], 1)
+            self.assertLessEqual(summary['min'], summary['max'])
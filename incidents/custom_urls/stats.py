@@ -24,7 +24,11 @@ urlpatterns = [
     url(r'^data/yearly/compare/(?P<year>\d+)/(?P<type>\w+)$', views.data_yearly_compare, name='data_yearly_compare'),
     # evolution (by divisor and type)
     url(r'^data/yearly/compare/evolution/(?P<year>\d+)/(?P<type>\w+)/(?P<divisor>\w+)$', views.data_yearly_evolution, name='data_yearly_evolution'),
-    url(r"^data/yearly/(?P<field>\w+)$", views.data_yearly_field, name="data_yearly_field"),
+    url(r"^data/yearly/(?P<field>\w+)$", views.data_field_distribution, name="data_yearly_field"),
+    # distribution by field (date window and type as parameters)
+    url(r"^data/distribution/(?P<field>\w+)$", views.data_field_distribution, name="data_field_distribution"),
+    # several charts in one request (charts as parameters)
+    url(r'^data/batch$', views.data_batch, name='data_batch'),
 
     # major incidents
     url(r'^quarterly/major$', views.quarterly_major, name='quarterly_major'),
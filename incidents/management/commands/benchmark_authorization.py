@@ -0,0 +1,42 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from incidents.authorization import benchmark
+
+
+class Command(BaseCommand):
+    help = "Times the tree authorization on a synthetic business line forest, in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roots', type=int, default=2, help="Number of root business lines")
+        parser.add_argument('--depth', type=int, default=3, help="Number of levels of each tree")
+        parser.add_argument('--fanout', type=int, default=5, help="Number of children of each business line")
+        parser.add_argument('--users', type=int, default=5, help="Number of users")
+        parser.add_argument('--aces', type=int, default=3, help="Number of access control entries per user")
+        parser.add_argument('--incidents', type=int, default=10000, help="Number of incidents")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per operation and user")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help="Writes the JSON results to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        parameters = dict((key, options[key]) for key in
+                          ('roots', 'depth', 'fanout', 'users', 'aces', 'incidents', 'repeat', 'seed'))
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('loaddata', 'incidents/fixtures/seed_data.json', verbosity=0)
+            users = benchmark.generate_fixture(
+                roots=options['roots'], depth=options['depth'], fanout=options['fanout'], users=options['users'],
+                aces=options['aces'], incidents=options['incidents'], seed=options['seed'])
+            results = benchmark.run(users, repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report = {'environment': benchmark.environment(), 'parameters': parameters, 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+
+from incidents.authorization import benchmark
+from incidents.models import BusinessLine, Incident, IncidentCategory, Label
+
+STRATEGIES = ['subquery', 'exists', 'distinct']
+
+
+class Command(BaseCommand):
+    help = "Compares the authorization query strategies on a synthetic incident table, in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incidents', type=int, default=1000000, help="Number of incidents to generate")
+        parser.add_argument('--roots', type=int, default=10, help="Number of root business lines")
+        parser.add_argument('--children', type=int, default=10, help="Number of children per root business line")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per query, the best one is kept")
+        parser.add_argument('--page-size', type=int, default=50, dest='page_size')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        call_command('loaddata', 'incidents/fixtures/seed_data.json', verbosity=0)
+        business_lines = benchmark.generate_forest(BusinessLine, options['roots'], 2, options['children'])
+        # The user can see the incidents of half of the roots (and their children)
+        visible = [bl for bl in business_lines if bl.depth == 1][:max(1, options['roots'] // 2)]
+        role = benchmark.generate_role('Benchmark role', ['incidents.view_incidents'])
+        user = benchmark.generate_user('benchmark', visible, role)
+        owner = User.objects.create_user('owner', 'owner@example.com', 'owner')
+        self.stdout.write(u"Generating {} incidents...".format(options['incidents']))
+        benchmark.generate_incidents(Incident, options['incidents'], business_lines,
+                                     IncidentCategory.objects.first(), Label.objects.filter(group__name='detection').first(),
+                                     owner)
+
+        page_size = options['page_size']
+
+        def authorized():
+            return Incident.authorization.for_user(user, 'incidents.view_incidents')
+
+        queries = [
+            ('count', lambda: authorized().count()),
+            ('first page', lambda: list(authorized().order_by('-date')[:page_size])),
+            ('last action page', lambda: list(authorized().annotate(Max('comments__date')).order_by(
+                '-comments__date__max')[:page_size])),
+            ('paginator', lambda: list(Paginator(authorized().order_by('-date'), page_size).page(1))),
+        ]
+        self.stdout.write(u"{:<20}{}".format('', ''.join(u"{:>12}".format(s) for s in STRATEGIES)))
+        for name, query in queries:
+            timings = []
+            for strategy in STRATEGIES:
+                with override_settings(AUTHORIZATION_QUERY_STRATEGY=strategy):
+                    timings.append(min(benchmark.measure(query, repeat=options['repeat'])))
+            self.stdout.write(u"{:<20}{}".format(name, ''.join(u"{:>11.3f}s".format(t) for t in timings)))
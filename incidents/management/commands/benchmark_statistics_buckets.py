@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from incidents.authorization.benchmark import environment
+from incidents.statistics import benchmark
+
+
+class Command(BaseCommand):
+    help = "Times the attributes time bucketing on synthetic incidents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incidents', type=int, default=100000, help="Number of incidents")
+        parser.add_argument('--buckets', type=int, default=500, help="Number of time ranges")
+        parser.add_argument('--attributes', type=int, default=2, help="Number of attributes per incident")
+        parser.add_argument('--scan-incidents', type=int, default=0,
+                            help="Also times the previous rescanning implementation on this many incidents")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per operation")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help="Writes the JSON results to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        parameters = dict((key, options[key]) for key in
+                          ('incidents', 'buckets', 'attributes', 'scan_incidents', 'repeat', 'seed'))
+        results = benchmark.run(incidents=options['incidents'], buckets=options['buckets'],
+                                attributes=options['attributes'], repeat=options['repeat'],
+                                scan_incidents=options['scan_incidents'], seed=options['seed'])
+        report = {'environment': environment(), 'parameters': parameters, 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from incidents.authorization import index as authorization_index
+from incidents.models import Incident
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the incident authorization index and verifies it against the live authorization rule"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true', dest='verify_only', default=False,
+                            help="Only compare the current index with the live rule")
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            authorization_index.rebuild(Incident)
+            self.stdout.write(u"Authorization index rebuilt.")
+        differences = authorization_index.verify(Incident)
+        for user_id, permission_id, missing, extra in differences:
+            self.stderr.write(u"User {user} / permission {permission}: {missing} missing, {extra} extra".format(
+                user=user_id, permission=permission_id, missing=len(missing), extra=len(extra)))
+        if len(differences):
+            raise CommandError(u"Authorization index differs from the live rule.")
+        self.stdout.write(u"Authorization index matches the live rule.")
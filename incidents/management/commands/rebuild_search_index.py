@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from incidents.search import backends as search_backends
+from incidents.search import index as search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of the incidents"
+
+    def handle(self, *args, **options):
+        if search_backends.get_backend() is None:
+            raise CommandError(u"The database has no full-text search backend.")
+        search_index.rebuild()
+        self.stdout.write(u"Search index rebuilt.")
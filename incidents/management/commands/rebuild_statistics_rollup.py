@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from incidents.statistics import rollup as statistics_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the monthly incident rollup used by the statistics views"
+
+    def handle(self, *args, **options):
+        statistics_rollup.rebuild()
+        self.stdout.write(u"Statistics rollup rebuilt.")
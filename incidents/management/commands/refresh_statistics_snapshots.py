@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from incidents.statistics import snapshots as statistics_snapshots
+
+
+class Command(BaseCommand):
+    help = "Recomputes the statistics snapshots of every authorization scope"
+
+    def handle(self, *args, **options):
+        if not statistics_snapshots.is_enabled():
+            raise CommandError("STATISTICS_SNAPSHOTS is disabled.")
+        statistics_snapshots.refresh()
+        self.stdout.write(u"Statistics snapshots refreshed.")
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 07:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0011_incidentauthorization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True)),
+                ('severity', models.IntegerField(choices=[(1, b'1'), (2, b'2'), (3, b'3'), (4, b'4')])),
+                ('status', models.CharField(choices=[(b'O', 'Open'), (b'C', 'Closed'), (b'B', 'Blocked')], max_length=20)),
+                ('is_incident', models.BooleanField(default=False)),
+                ('is_major', models.BooleanField(default=False)),
+                ('confidentiality', models.IntegerField(choices=[(0, b'C0'), (1, b'C1'), (2, b'C2'), (3, b'C3')])),
+                ('count', models.IntegerField(default=0)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.Label')),
+                ('business_line', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.IncidentCategory')),
+                ('detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.Label')),
+                ('plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.Label')),
+                ('root_business_line', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 07:51
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0012_incidentrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='incident',
+            name='date',
+            field=models.DateTimeField(blank=True, db_index=True, default=datetime.datetime.now),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=[b'status', b'date'], name='incidents_i_status_1a62f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=[b'is_incident', b'date'], name='incidents_i_is_inci_a7c61a_idx'),
+        ),
+    ]
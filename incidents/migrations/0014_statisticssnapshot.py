@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 08:16
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0013_incident_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(db_index=True, max_length=40)),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('name', models.CharField(max_length=500)),
+                ('content', models.TextField()),
+                ('content_type', models.CharField(max_length=100)),
+                ('computed_at', models.DateTimeField(db_index=True, default=datetime.datetime.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 08:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from incidents.search import backends
+
+
+def create_full_text_index(apps, schema_editor):
+    backends.setup(schema_editor.connection)
+
+
+def drop_full_text_index(apps, schema_editor):
+    backends.teardown(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0014_statisticssnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('incident', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='incidents.Incident')),
+                ('subject', models.TextField()),
+                ('body', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
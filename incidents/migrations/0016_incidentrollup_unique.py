@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 08:57
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+KEY_FIELDS = ('month', 'root_business_line', 'business_line', 'category', 'severity', 'detection', 'actor', 'plan',
+              'status', 'is_incident', 'is_major', 'confidentiality')
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    IncidentRollup = apps.get_model('incidents', 'IncidentRollup')
+    duplicates = IncidentRollup.objects.order_by().values(*KEY_FIELDS).annotate(rows=Count('pk')).filter(rows__gt=1)
+    for key in list(duplicates):
+        del key['rows']
+        rows = list(IncidentRollup.objects.filter(**key).order_by('pk'))
+        rows[0].count = sum(row.count for row in rows)
+        rows[0].save()
+        IncidentRollup.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0015_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='incidentrollup',
+            unique_together=set([('month', 'root_business_line', 'business_line', 'category', 'severity', 'detection', 'actor', 'plan', 'status', 'is_incident', 'is_major', 'confidentiality')]),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 09:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+# Key column value of the rows without root business line, business line, actor or plan
+NONE = 0
+
+KEY_FIELDS = ('month', 'root_business_line', 'business_line', 'category', 'severity', 'detection', 'actor', 'plan',
+              'status', 'is_incident', 'is_major', 'confidentiality')
+
+
+def set_none(apps, schema_editor):
+    IncidentRollup = apps.get_model('incidents', 'IncidentRollup')
+    for field in ('root_business_line', 'business_line', 'actor', 'plan'):
+        IncidentRollup.objects.filter(**{field + '__isnull': True}).update(**{field: NONE})
+    # The rows of keys with NULL columns may have been duplicated
+    duplicates = IncidentRollup.objects.order_by().values(*KEY_FIELDS).annotate(rows=Count('pk')).filter(rows__gt=1)
+    for key in list(duplicates):
+        del key['rows']
+        rows = list(IncidentRollup.objects.filter(**key).order_by('pk'))
+        rows[0].count = sum(row.count for row in rows)
+        rows[0].save()
+        IncidentRollup.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+def set_null(apps, schema_editor):
+    IncidentRollup = apps.get_model('incidents', 'IncidentRollup')
+    for field in ('root_business_line', 'business_line', 'actor', 'plan'):
+        IncidentRollup.objects.filter(**{field: NONE}).update(**{field: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0016_incidentrollup_unique'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='incidentrollup',
+            unique_together=set([]),
+        ),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='actor',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.Label'),
+        ),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='business_line',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine'),
+        ),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='plan',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.Label'),
+        ),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='root_business_line',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine'),
+        ),
+        migrations.RunPython(set_none, set_null),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='business_line',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine'),
+        ),
+        migrations.AlterField(
+            model_name='incidentrollup',
+            name='root_business_line',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='incidents.BusinessLine'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='incidentrollup',
+            unique_together=set([('month', 'root_business_line', 'business_line', 'category', 'severity', 'detection', 'actor', 'plan', 'status', 'is_incident', 'is_major', 'confidentiality')]),
+        ),
+    ]
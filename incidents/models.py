@@ -1,19 +1,26 @@
 # -*- coding: utf-8 -*-
 import datetime
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import Signal, receiver
 from django.db import models
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 
 from treebeard.mp_tree import MP_Node
 
 from fir_artifacts import artifacts
+from fir_artifacts import index as artifact_index
 from fir_artifacts.models import Artifact, File
 from fir_plugins.models import link_to
 from incidents.authorization import tree_authorization, AuthorizationModelMixin
+from incidents.authorization import cache as authorization_cache
+from incidents.authorization import index as authorization_index
+from incidents.search import index as search_index
+from incidents.statistics import cache as statistics_cache
+from incidents.statistics import rollup as statistics_rollup
+from incidents.statistics import snapshots as statistics_snapshots
 
 STATUS_CHOICES = (
     ("O", _("Open")),
@@ -49,6 +56,7 @@ CONFIDENTIALITY_LEVEL = (
 model_created = Signal(providing_args=['instance'])
 model_updated = Signal(providing_args=['instance'])
 model_status_changed = Signal(providing_args=['instance', 'previous_status'])
+business_line_moved = Signal(providing_args=['instance'])
 
 
 class FIRModel:
@@ -116,11 +124,18 @@ class BusinessLine(MP_Node, AuthorizationModelMixin):
     class Meta:
         verbose_name = _('business line')
 
+    def move(self, target, pos=None):
+        super(BusinessLine, self).move(target, pos=pos)
+        business_line_moved.send(sender=BusinessLine, instance=self)
+
+    def get_incidents_filter(self):
+        """
+        Returns a filter matching the incidents concerning this business line or one of its descendants
+        """
+        return self.get_path_filter([self.path], key='concerned_business_lines__path')
+
     def get_incident_count(self, query):
-        incident_count = self.incident_set.filter(query).distinct().count()
-        incident_count += Incident.objects.filter(query).filter(
-            concerned_business_lines__in=self.get_descendants()).distinct().count()
-        return incident_count
+        return Incident.objects.filter(query).filter(self.get_incidents_filter()).distinct().count()
 
 
 class AccessControlEntry(models.Model):
@@ -167,11 +182,12 @@ class IncidentCategory(models.Model):
 # Core models ================================================================
 
 @tree_authorization(fields=['concerned_business_lines', ], tree_model='incidents.BusinessLine',
-                    owner_field='opened_by', owner_permission=settings.INCIDENT_CREATOR_PERMISSION)
+                    owner_field='opened_by', owner_permission=settings.INCIDENT_CREATOR_PERMISSION,
+                    index_model='incidents.IncidentAuthorization')
 @link_to(File)
 @link_to(Artifact)
 class Incident(FIRModel, models.Model):
-    date = models.DateTimeField(default=datetime.datetime.now, blank=True)
+    date = models.DateTimeField(default=datetime.datetime.now, blank=True, db_index=True)
     is_starred = models.BooleanField(default=False)
     subject = models.CharField(max_length=256)
     description = models.TextField()
@@ -252,7 +268,7 @@ class Incident(FIRModel, models.Model):
             for a in found_artifacts[key]:
                 artifact_list.append((key, a))
 
-        db_artifacts = Artifact.objects.filter(value__in=[a[1] for a in artifact_list])
+        db_artifacts = Artifact.objects.filter(artifact_index.exact_filter([a[1] for a in artifact_list]))
 
         exist = []
 
@@ -279,6 +295,73 @@ class Incident(FIRModel, models.Model):
             ('view_incidents', 'Can view incidents'),
             ('view_statistics', 'Can view statistics'),
         )
+        indexes = [
+            models.Index(fields=['status', 'date']),
+            models.Index(fields=['is_incident', 'date']),
+        ]
+
+
+class IncidentAuthorization(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    incident = models.ForeignKey(Incident, on_delete=models.CASCADE, related_name='+')
+    permission = models.ForeignKey('auth.Permission', on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = (('user', 'permission', 'incident'),)
+
+    def __unicode__(self):
+        return u"{} on incident {} ({})".format(self.user_id, self.incident_id, self.permission_id)
+
+
+class IncidentRollup(models.Model):
+    # The rows without root business line, business line, actor or plan hold statistics_rollup.NONE
+    # instead of NULL (NULL columns are distinct in the unique constraint)
+    month = models.DateField(db_index=True)
+    root_business_line = models.ForeignKey(BusinessLine, on_delete=models.CASCADE, db_constraint=False,
+                                           related_name='+')
+    business_line = models.ForeignKey(BusinessLine, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    category = models.ForeignKey(IncidentCategory, on_delete=models.CASCADE, related_name='+')
+    severity = models.IntegerField(choices=SEVERITY_CHOICES)
+    detection = models.ForeignKey(Label, on_delete=models.CASCADE, related_name='+')
+    # Nullable for the outer joins of the lookups on the labels (e.g. actor__name)
+    actor = models.ForeignKey(Label, null=True, blank=True, on_delete=models.CASCADE, db_constraint=False,
+                              related_name='+')
+    plan = models.ForeignKey(Label, null=True, blank=True, on_delete=models.CASCADE, db_constraint=False,
+                             related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    is_incident = models.BooleanField(default=False)
+    is_major = models.BooleanField(default=False)
+    confidentiality = models.IntegerField(choices=CONFIDENTIALITY_LEVEL)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('month', 'root_business_line', 'business_line', 'category', 'severity', 'detection',
+                            'actor', 'plan', 'status', 'is_incident', 'is_major', 'confidentiality'),)
+
+    def __unicode__(self):
+        return u"{} incidents in {:%Y-%m}".format(self.count, self.month)
+
+
+class StatisticsSnapshot(models.Model):
+    scope = models.CharField(max_length=40, db_index=True)
+    key = models.CharField(max_length=40, unique=True)
+    name = models.CharField(max_length=500)
+    content = models.TextField()
+    content_type = models.CharField(max_length=100)
+    computed_at = models.DateTimeField(default=datetime.datetime.now, db_index=True)
+
+    def __unicode__(self):
+        return u"{} ({:%Y-%m-%d %H:%M})".format(self.name, self.computed_at)
+
+
+class SearchDocument(models.Model):
+    incident = models.OneToOneField(Incident, primary_key=True, on_delete=models.CASCADE,
+                                    related_name='search_document')
+    subject = models.TextField()
+    body = models.TextField()
+
+    def __unicode__(self):
+        return u"Search document of incident {}".format(self.incident_id)
 
 
 class Comments(models.Model):
@@ -415,3 +498,213 @@ def log_new_incident(sender, instance, created, **kwargs):
         what = 'Edit incident'
 
     Log.objects.create(who=instance.opened_by, what=what, incident=instance)
+
+
+# Invalidate cached authorization paths
+
+
+@receiver(pre_save, sender=AccessControlEntry)
+def remember_acl_user(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._previous_user_id = AccessControlEntry.objects.filter(pk=instance.pk).values_list(
+            'user_id', flat=True).first()
+
+
+@receiver(post_save, sender=AccessControlEntry)
+@receiver(post_delete, sender=AccessControlEntry)
+def invalidate_acl_authorization(sender, instance, **kwargs):
+    authorization_cache.invalidate_users([instance.user_id, getattr(instance, '_previous_user_id', None)])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_role_authorization(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        roles = [instance.pk]
+    elif pk_set:
+        roles = pk_set
+    else:
+        authorization_cache.invalidate_all()
+        return
+    authorization_cache.invalidate_users(
+        AccessControlEntry.objects.filter(role__in=roles).values_list('user_id', flat=True))
+
+
+@receiver(business_line_moved, sender=BusinessLine)
+def invalidate_tree_authorization(sender, instance, **kwargs):
+    authorization_cache.invalidate_all()
+
+
+# Maintain the authorization index
+
+
+@receiver(post_save, sender=Incident)
+def index_incident_authorization(sender, instance, **kwargs):
+    if authorization_index.is_enabled(Incident):
+        authorization_index.refresh_objects(Incident, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Incident.concerned_business_lines.through)
+def index_incident_business_lines(sender, instance, action, reverse, pk_set, **kwargs):
+    if not authorization_index.is_enabled(Incident):
+        return
+    if action == 'pre_clear' and reverse:
+        instance._authorization_incidents = list(instance.incident_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        authorization_index.refresh_objects(Incident, [instance.pk])
+    elif action == 'post_clear':
+        authorization_index.refresh_objects(Incident, getattr(instance, '_authorization_incidents', []))
+    else:
+        authorization_index.refresh_objects(Incident, pk_set)
+
+
+@receiver(post_save, sender=AccessControlEntry)
+@receiver(post_delete, sender=AccessControlEntry)
+def index_acl_authorization(sender, instance, **kwargs):
+    if authorization_index.is_enabled(Incident):
+        authorization_index.refresh_users(Incident, [instance.user_id, getattr(instance, '_previous_user_id', None)])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def index_role_authorization(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or not authorization_index.is_enabled(Incident):
+        return
+    if not reverse:
+        roles = [instance.pk]
+    elif pk_set:
+        roles = pk_set
+    else:
+        roles = Group.objects.values_list('pk', flat=True)
+    authorization_index.refresh_users(
+        Incident, AccessControlEntry.objects.filter(role__in=roles).values_list('user_id', flat=True))
+
+
+@receiver(business_line_moved, sender=BusinessLine)
+def index_tree_authorization(sender, instance, **kwargs):
+    if authorization_index.is_enabled(Incident):
+        path = BusinessLine.objects.get(pk=instance.pk).path
+        authorization_index.refresh_objects(Incident, Incident.objects.filter(
+            BusinessLine.get_path_filter([path], key='concerned_business_lines__path')).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=BusinessLine)
+def remember_business_line_incidents(sender, instance, **kwargs):
+    if authorization_index.is_enabled(Incident):
+        instance._authorization_incidents = list(instance.incident_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=BusinessLine)
+def index_deleted_business_line(sender, instance, **kwargs):
+    if authorization_index.is_enabled(Incident):
+        authorization_index.refresh_objects(Incident, getattr(instance, '_authorization_incidents', []))
+
+
+# Maintain the statistics rollup
+
+
+@receiver(pre_save, sender=Incident)
+@receiver(pre_delete, sender=Incident)
+def remember_incident_rollup(sender, instance, **kwargs):
+    if statistics_rollup.is_enabled() and instance.pk is not None:
+        instance._rollup_keys = statistics_rollup.get_keys([instance.pk])
+
+
+@receiver(post_save, sender=Incident)
+def rollup_incident(sender, instance, **kwargs):
+    if statistics_rollup.is_enabled():
+        statistics_rollup.apply(statistics_rollup.get_keys([instance.pk]), getattr(instance, '_rollup_keys', None))
+        instance._rollup_keys = None
+
+
+@receiver(post_delete, sender=Incident)
+def rollup_deleted_incident(sender, instance, **kwargs):
+    if statistics_rollup.is_enabled():
+        statistics_rollup.apply({}, getattr(instance, '_rollup_keys', None))
+
+
+@receiver(m2m_changed, sender=Incident.concerned_business_lines.through)
+@receiver(m2m_changed, sender=Incident.main_business_lines.through)
+def rollup_incident_business_lines(sender, instance, action, reverse, pk_set, **kwargs):
+    if not statistics_rollup.is_enabled():
+        return
+    if not reverse:
+        incidents = [instance.pk]
+    elif action in ('pre_clear', 'post_clear'):
+        incidents = getattr(instance, '_rollup_incidents', None) or list(
+            sender.objects.filter(businessline=instance).values_list('incident_id', flat=True))
+        instance._rollup_incidents = incidents
+    else:
+        incidents = pk_set
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._rollup_keys = statistics_rollup.get_keys(incidents)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        statistics_rollup.apply(statistics_rollup.get_keys(incidents), getattr(instance, '_rollup_keys', None))
+        instance._rollup_keys = None
+        instance._rollup_incidents = None
+
+
+@receiver(business_line_moved, sender=BusinessLine)
+@receiver(post_delete, sender=BusinessLine)
+def rollup_tree(sender, instance, **kwargs):
+    if statistics_rollup.is_enabled():
+        statistics_rollup.schedule_rebuild()
+
+
+# Invalidate the cached statistics
+
+
+@receiver(post_save, sender=Incident)
+@receiver(pre_delete, sender=Incident)
+def invalidate_incident_statistics(sender, instance, **kwargs):
+    if statistics_cache.is_enabled() and instance.pk is not None:
+        statistics_cache.invalidate_incidents([instance.pk])
+
+
+@receiver(m2m_changed, sender=Incident.concerned_business_lines.through)
+def invalidate_incident_business_lines_statistics(sender, instance, action, reverse, pk_set, **kwargs):
+    if not statistics_cache.is_enabled() or action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        statistics_cache.invalidate_incidents([instance.pk], pk_set or ())
+    elif action == 'pre_clear':
+        statistics_cache.invalidate_incidents(instance.incident_set.values_list('pk', flat=True), [instance.pk])
+    else:
+        statistics_cache.invalidate_incidents(pk_set, [instance.pk])
+
+
+@receiver(business_line_moved, sender=BusinessLine)
+@receiver(post_delete, sender=BusinessLine)
+def invalidate_tree_statistics(sender, instance, **kwargs):
+    if statistics_cache.is_enabled():
+        statistics_cache.invalidate_all()
+
+
+# Refresh the statistics snapshots after incident writes
+
+
+@receiver(post_save, sender=Incident)
+@receiver(post_delete, sender=Incident)
+@receiver(m2m_changed, sender=Incident.concerned_business_lines.through)
+def schedule_statistics_snapshots_refresh(sender, **kwargs):
+    statistics_snapshots.schedule_refresh()
+
+
+# Maintain the search index
+
+
+@receiver(post_save, sender=Incident)
+def index_incident_search_document(sender, instance, **kwargs):
+    search_index.schedule_refresh([instance.pk])
+
+
+@receiver(post_save, sender=Comments)
+def index_comment_search_document(sender, instance, **kwargs):
+    search_index.schedule_refresh([instance.incident_id])
+
+
+@receiver(post_delete, sender=Comments)
+def index_deleted_comment_search_document(sender, instance, **kwargs):
+    search_index.schedule_refresh([instance.incident_id], after_commit=True)
@@ -0,0 +1,242 @@
+"""
+List pagination
+
+ With ``LIST_PAGINATION = 'keyset'``, pages are selected by seeking after (or before) the
+ (order column, id) key of the last (or first) row of the previous page, instead of counting
+ and skipping the rows before them with OFFSET. The cost of a page does not depend on its depth.
+ The keys are kept in opaque, signed cursors. Rows with a NULL order column come last.
+
+ The rows are counted once, on the first page, when ``LIST_PAGINATION_COUNT`` is True. The count
+ (and the page number) is then carried by the cursors, so it is approximate on the next pages.
+
+ Lists ordered by a column that cannot be filtered on (``extra`` selects such as the search
+ rank) fall back to offsets, kept in the cursors too.
+
+"""
+import datetime
+import json
+import math
+from collections import Sequence
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import FieldError
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import F, Q
+from django.db.models.expressions import Col, OrderBy
+from django.db.models.sql.constants import LOUTER
+
+SALT = 'incidents.pagination'
+
+KEY = 'keyset_key'
+
+
+def is_keyset():
+    return getattr(settings, 'LIST_PAGINATION', 'offset') == 'keyset'
+
+
+class CursorSerializer(object):
+    """
+    JSON serializer of the cursors, keeping the microseconds of the datetime keys
+    """
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        raise TypeError("{!r} is not JSON serializable".format(value))
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), default=self.default).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class KeysetPage(Sequence):
+    """
+    Page of a ``KeysetPaginator``, with the interface of the Django pages used by the templates
+    """
+
+    def __init__(self, object_list, number, paginator, previous_cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<Page {}>'.format(self.number)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class KeysetPaginator(object):
+    """
+    Paginates ``queryset`` on its first order column and its primary key
+
+    ``count`` and ``num_pages`` are None when the rows are not counted.
+    """
+
+    def __init__(self, queryset, per_page, counted=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.counted = counted
+        self.ordering = [str(field) for field in queryset.query.order_by or queryset.model._meta.ordering or ['pk']]
+        self.count = None
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(int(math.ceil(self.count / float(self.per_page))), 1)
+
+    def get_key(self):
+        """
+        Returns the name of the order column, if it is descending and if it may be NULL, None if it cannot be filtered on
+        """
+        field = self.ordering[0]
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if name in self.queryset.query.extra_select or '?' in name or '.' in name:
+            return None
+        try:
+            query = self.queryset.annotate(**{KEY: F(name)}).query
+        except FieldError:
+            return None
+        # Sorting on NULL first or last would not use the index of a column that cannot be NULL
+        column = query.annotations[KEY]
+        nullable = not isinstance(column, Col) or column.target.null or \
+            getattr(query.alias_map[column.alias], 'join_type', None) == LOUTER
+        return name, descending, nullable
+
+    def encode(self, **position):
+        position.update(ordering=self.ordering, count=self.count)
+        return signing.dumps(position, salt=SALT, serializer=CursorSerializer, compress=True)
+
+    def decode(self, cursor):
+        """
+        Returns the position of ``cursor``, None for the first page or a cursor of another ordering
+        """
+        if not cursor:
+            return None
+        try:
+            position = signing.loads(cursor, salt=SALT, serializer=CursorSerializer)
+        except signing.BadSignature:
+            return None
+        if position.get('ordering') != self.ordering:
+            return None
+        return position
+
+    def page(self, cursor=None):
+        """
+        Returns the page at ``cursor``, the first page without cursor
+        """
+        position = self.decode(cursor)
+        if position is None:
+            if self.counted:
+                self.count = self.queryset.count()
+            number = 1
+        else:
+            self.count = position['count']
+            number = position['number']
+        key = self.get_key()
+        if key is None:
+            return self.offset_page(position, number)
+        return self.seek_page(key, position, number)
+
+    def offset_page(self, position, number):
+        offset = 0 if position is None else max(position['offset'], 0)
+        rows = list(self.queryset[offset:offset + self.per_page + 1])
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = self.encode(offset=offset + self.per_page, number=number + 1)
+        if offset > 0:
+            previous_cursor = self.encode(offset=offset - self.per_page, number=max(number - 1, 1))
+        return KeysetPage(rows[:self.per_page], number, self, previous_cursor, next_cursor)
+
+    def seek_page(self, key, position, number):
+        name, descending, nullable = key
+        backward = position is not None and position['backward']
+        # Seeking backward reads the previous rows in the reverse order
+        reverse = descending != backward
+        queryset = self.queryset.annotate(**{KEY: F(name)})
+        if nullable:
+            queryset = queryset.order_by(OrderBy(F(KEY), descending=reverse, nulls_last=not backward,
+                                                 nulls_first=backward), '-pk' if reverse else 'pk')
+        else:
+            queryset = queryset.order_by('-' + KEY if reverse else KEY, '-pk' if reverse else 'pk')
+        if position is not None:
+            queryset = queryset.filter(
+                self.seek_filter(position['key'], position['pk'], reverse, backward if nullable else None))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+        if not len(rows):
+            # The rows of the cursor were deleted
+            return self.page() if position is not None else KeysetPage(rows, number, self)
+        first, last = rows[0], rows[-1]
+        has_next = more or backward
+        has_previous = more if backward else position is not None
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = self.encode(key=getattr(last, KEY), pk=last.pk, backward=False, number=number + 1)
+        if has_previous:
+            previous_cursor = self.encode(key=getattr(first, KEY), pk=first.pk, backward=True,
+                                          number=max(number - 1, 1))
+        return KeysetPage(rows, number, self, previous_cursor, next_cursor)
+
+    @staticmethod
+    def seek_filter(value, pk, descending, nulls_first):
+        """
+        Returns the filter of the rows after (``value``, ``pk``) in the order of the query
+
+        ``nulls_first`` is None when the column cannot be NULL.
+        """
+        lookup = 'lt' if descending else 'gt'
+        after_key = Q(**{'{}__{}'.format(KEY, lookup): value})
+        after_pk = Q(**{'pk__{}'.format(lookup): pk})
+        is_null = Q(**{'{}__isnull'.format(KEY): True})
+        if value is None:
+            if nulls_first:
+                return ~is_null | (is_null & after_pk)
+            return is_null & after_pk
+        lookup = after_key | (Q(**{KEY: value}) & after_pk)
+        if nulls_first is None or nulls_first:
+            return lookup
+        return lookup | is_null
+
+
+def paginate(request, queryset, per_page):
+    """
+    Returns the page of ``queryset`` requested by the ``cursor`` (keyset pagination) or ``page`` parameter
+    """
+    if is_keyset():
+        paginator = KeysetPaginator(queryset, per_page, counted=getattr(settings, 'LIST_PAGINATION_COUNT', True))
+        return paginator.page(request.GET.get('cursor'))
+    paginator = Paginator(queryset, per_page)
+    try:
+        return paginator.page(request.GET.get('page', 1))
+    except (PageNotAnInteger, EmptyPage):
+        return paginator.page(1)
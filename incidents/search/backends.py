@@ -0,0 +1,175 @@
+"""
+Full-text search backends
+
+ A backend creates the full-text structure of the ``SearchDocument`` table (kept in sync with its rows
+ by the database) and filters incidents with it. ``get_backend`` returns the backend of
+ ``SEARCH_INDEX_BACKEND``, or the one of the database vendor.
+
+"""
+import re
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DOCUMENTS_TABLE = 'incidents_searchdocument'
+
+# Default backend of each database vendor
+BACKENDS = {
+    'sqlite': 'incidents.search.backends.SQLiteBackend',
+    'postgresql': 'incidents.search.backends.PostgreSQLBackend',
+}
+
+_available = {}
+
+
+def get_words(term):
+    return re.findall(r'\w+', term, re.UNICODE)
+
+
+class SearchBackend(object):
+    """
+    Full-text search over the ``SearchDocument`` table
+
+    ``setup_sql`` creates the full-text structure of the table, ``teardown_sql`` drops it.
+    """
+    setup_sql = []
+    teardown_sql = []
+
+    def is_available(self, connection):
+        return True
+
+    def get_query(self, terms):
+        """
+        Returns the full-text query matching the documents containing all the ``terms``, None if they have no word
+        """
+        raise NotImplementedError
+
+    def get_sql(self, table):
+        """
+        Returns the SQL of the (condition, rank) of the ``table`` incidents, with a full-text query parameter each
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, terms):
+        """
+        Returns the ``queryset`` incidents containing all the ``terms``, annotated with their ``search_rank``
+
+        The higher the rank, the more relevant the incident.
+        """
+        query = self.get_query(terms)
+        if query is None:
+            return queryset.extra(select={'search_rank': '0'})
+        condition, rank = self.get_sql(queryset.model._meta.db_table)
+        return queryset.extra(select={'search_rank': rank}, select_params=[query], where=[condition], params=[query])
+
+
+class SQLiteBackend(SearchBackend):
+    """
+    FTS5 external content table over the documents, maintained by triggers
+
+    Each term matches a phrase of word prefixes, subject matches rank ten times higher (BM25).
+    """
+    setup_sql = [
+        "CREATE VIRTUAL TABLE {table}_fts USING fts5(subject, body, content='{table}', content_rowid='incident_id')",
+        "CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {table}_fts(rowid, subject, body) VALUES (new.incident_id, new.subject, new.body); END",
+        "CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, subject, body) "
+        "VALUES ('delete', old.incident_id, old.subject, old.body); END",
+        "CREATE TRIGGER {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, subject, body) "
+        "VALUES ('delete', old.incident_id, old.subject, old.body); "
+        "INSERT INTO {table}_fts(rowid, subject, body) VALUES (new.incident_id, new.subject, new.body); END",
+    ]
+    teardown_sql = [
+        "DROP TRIGGER IF EXISTS {table}_fts_update",
+        "DROP TRIGGER IF EXISTS {table}_fts_delete",
+        "DROP TRIGGER IF EXISTS {table}_fts_insert",
+        "DROP TABLE IF EXISTS {table}_fts",
+    ]
+
+    def is_available(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def get_query(self, terms):
+        phrases = [u'"{}"*'.format(u' '.join(get_words(term))) for term in terms if get_words(term)]
+        return u' AND '.join(phrases) or None
+
+    def get_sql(self, table):
+        condition = '"{table}"."id" IN (SELECT rowid FROM {documents}_fts WHERE {documents}_fts MATCH %s)'
+        rank = ('SELECT -bm25({documents}_fts, 10.0, 1.0) FROM {documents}_fts '
+                'WHERE {documents}_fts MATCH %s AND rowid = "{table}"."id"')
+        return (condition.format(table=table, documents=DOCUMENTS_TABLE),
+                rank.format(table=table, documents=DOCUMENTS_TABLE))
+
+
+class PostgreSQLBackend(SearchBackend):
+    """
+    GIN indexed tsvector column of the documents, maintained by a trigger
+
+    Each term matches a phrase of words, the last one as a prefix, ranked with ``ts_rank``.
+    """
+    setup_sql = [
+        "ALTER TABLE {table} ADD COLUMN vector tsvector",
+        "CREATE INDEX {table}_vector ON {table} USING GIN (vector)",
+        "CREATE TRIGGER {table}_vector BEFORE INSERT OR UPDATE ON {table} FOR EACH ROW "
+        "EXECUTE PROCEDURE tsvector_update_trigger(vector, 'pg_catalog.simple', subject, body)",
+    ]
+    teardown_sql = [
+        "DROP TRIGGER IF EXISTS {table}_vector ON {table}",
+        "DROP INDEX IF EXISTS {table}_vector",
+        "ALTER TABLE {table} DROP COLUMN IF EXISTS vector",
+    ]
+
+    def get_query(self, terms):
+        phrases = []
+        for term in terms:
+            words = [u"'{}'".format(word.lower()) for word in get_words(term)]
+            if words:
+                words[-1] += u':*'
+                phrases.append(u'({})'.format(u' <-> '.join(words)))
+        return u' & '.join(phrases) or None
+
+    def get_sql(self, table):
+        condition = ('"{table}"."id" IN (SELECT incident_id FROM {documents} '
+                     'WHERE vector @@ to_tsquery(\'pg_catalog.simple\', %s))')
+        rank = ('SELECT ts_rank(vector, to_tsquery(\'pg_catalog.simple\', %s)) FROM {documents} '
+                'WHERE incident_id = "{table}"."id"')
+        return (condition.format(table=table, documents=DOCUMENTS_TABLE),
+                rank.format(table=table, documents=DOCUMENTS_TABLE))
+
+
+def get_backend(connection=None):
+    """
+    Returns the full-text search backend of ``connection``, None if its database has none
+    """
+    if connection is None:
+        from django.db import connection
+    path = getattr(settings, 'SEARCH_INDEX_BACKEND', None) or BACKENDS.get(connection.vendor)
+    if path is None:
+        return None
+    backend = import_string(path)()
+    if (connection.alias, path) not in _available:
+        _available[(connection.alias, path)] = backend.is_available(connection)
+    return backend if _available[(connection.alias, path)] else None
+
+
+def setup(connection):
+    """
+    Creates the full-text structure of the backend of ``connection``, if any
+    """
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            for sql in backend.setup_sql:
+                cursor.execute(sql.format(table=DOCUMENTS_TABLE))
+
+
+def teardown(connection):
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            for sql in backend.teardown_sql:
+                cursor.execute(sql.format(table=DOCUMENTS_TABLE))
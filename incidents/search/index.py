@@ -0,0 +1,110 @@
+"""
+Full-text search index
+
+ Each incident is indexed in a ``SearchDocument`` row: its subject, and a body made of its
+ description, comments and of the texts of the plugins (``search_text`` hook, e.g. the nuggets).
+ The full-text structure of the backend (see ``backends``) is kept in sync with the rows by the
+ database, free-text searches then use it instead of scanning the incidents and their comments.
+
+ The index is only used and maintained when ``SEARCH_INDEX`` is True and the database has a
+ backend. It is updated after each write, or in a celery task when ``SEARCH_INDEX_ASYNC`` is True.
+
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+
+from incidents.search import backends
+
+BATCH_SIZE = 500
+
+
+def is_enabled():
+    return getattr(settings, 'SEARCH_INDEX', False) and backends.get_backend() is not None
+
+
+def get_text_hooks():
+    from incidents.views import APP_HOOKS
+
+    return [hooks['search_text'] for hooks in APP_HOOKS.values() if 'search_text' in hooks]
+
+
+def compute_documents(incident_ids):
+    """
+    Returns the (subject, body) of the documents of the incidents ``incident_ids``, keyed by incident pk
+    """
+    Incident = apps.get_model('incidents', 'Incident')
+    Comments = apps.get_model('incidents', 'Comments')
+    texts = defaultdict(list)
+    for incident_id, comment in Comments.objects.filter(incident__in=incident_ids).order_by(
+            'date', 'pk').values_list('incident_id', 'comment'):
+        texts[incident_id].append(comment)
+    for hook in get_text_hooks():
+        for incident_id, text in hook(incident_ids):
+            texts[incident_id].append(text)
+    return dict((pk, (subject, u'\n'.join([description] + texts[pk])))
+                for pk, subject, description in Incident.objects.filter(pk__in=incident_ids).values_list(
+                    'pk', 'subject', 'description'))
+
+
+def _store(documents):
+    SearchDocument = apps.get_model('incidents', 'SearchDocument')
+    SearchDocument.objects.bulk_create([SearchDocument(incident_id=pk, subject=subject, body=body)
+                                        for pk, (subject, body) in documents.items()])
+
+
+def refresh(incident_ids):
+    """
+    Recomputes the documents of the incidents ``incident_ids``
+    """
+    SearchDocument = apps.get_model('incidents', 'SearchDocument')
+    incident_ids = list(set(incident_ids))
+    for i in range(0, len(incident_ids), BATCH_SIZE):
+        batch = incident_ids[i:i + BATCH_SIZE]
+        with transaction.atomic():
+            SearchDocument.objects.filter(incident__in=batch).delete()
+            _store(compute_documents(batch))
+
+
+def rebuild():
+    """
+    Rebuilds the documents of all the incidents
+    """
+    Incident = apps.get_model('incidents', 'Incident')
+    SearchDocument = apps.get_model('incidents', 'SearchDocument')
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        pks = list(Incident.objects.values_list('pk', flat=True))
+        for i in range(0, len(pks), BATCH_SIZE):
+            _store(compute_documents(pks[i:i + BATCH_SIZE]))
+
+
+def schedule_refresh(incident_ids, after_commit=False):
+    """
+    Refreshes the documents of the incidents ``incident_ids`` now (or ``after_commit``), or in a celery task
+    after the commit when ``SEARCH_INDEX_ASYNC`` is True (with the ``fir_celery`` plugin)
+
+    Deletions cascading from an incident are refreshed after the commit, once the incident is gone.
+    """
+    if not is_enabled():
+        return
+    incident_ids = [pk for pk in set(incident_ids) if pk is not None]
+    if getattr(settings, 'SEARCH_INDEX_ASYNC', False) and apps.is_installed('fir_celery'):
+        from incidents.tasks import refresh_search_index
+
+        transaction.on_commit(lambda: refresh_search_index.delay(incident_ids))
+    elif after_commit:
+        transaction.on_commit(lambda: refresh(incident_ids))
+    else:
+        refresh(incident_ids)
+
+
+def search(incidents, terms):
+    """
+    Returns the ``incidents`` containing all the ``terms``, annotated with their ``search_rank``
+
+    Terms match words, or word prefixes for their last word, not any substring.
+    """
+    return backends.get_backend().filter(incidents, terms)
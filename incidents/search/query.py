@@ -0,0 +1,206 @@
+"""
+Search query language
+
+ A search query string is tokenized and parsed into a ``Plan``: conditions of typed operators
+ (``plan:A``, ``bl:"Business line"``, ``severity>2``, ``starred``...) and free-text terms (words and
+ "quoted phrases"). Plugins add operators with the ``search_operators`` hook.
+
+ Plans are cached per normalized query string. A plan compiles to a single filter in which the
+ multi-valued relations (business lines, comments, nuggets...) are semi-joins, so that searching
+ does not multiply the incident rows. Free-text terms use the search index when it is enabled.
+
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db.models import Q
+
+from incidents.search import index as search_index
+
+# Number of parsed query plans kept in memory
+PLAN_CACHE_SIZE = 256
+
+TOKEN = re.compile(r'(?P<name>\w+)(?P<comparator>[:<>])(?:"(?P<quoted>[^"]*)"|(?P<value>\S+))'
+                   r'|"(?P<phrase>[^"]*)"|(?P<word>\S+)', re.UNICODE)
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+class SearchOperator(object):
+    """
+    Search operator: ``compile(value, comparator, user)`` returns the filter of the incidents matching it
+
+    ``type`` converts the value (the token is a free-text term when it fails) and ``comparators``
+    lists the accepted comparators among ':', '<' and '>'. Operators without value (``flag``) are
+    bare words, compiled with a True value.
+    """
+
+    def __init__(self, compile, type=unicode, comparators=(':',), flag=False):
+        self.compile = compile
+        self.type = type
+        self.comparators = comparators
+        self.flag = flag
+
+
+def get_hooks(name):
+    from incidents.views import APP_HOOKS
+
+    return [hooks[name] for hooks in APP_HOOKS.values() if name in hooks]
+
+
+def incidents_filter(lookup):
+    """
+    Returns a filter keeping the incidents matching ``lookup``, as a semi-join
+    """
+    Incident = apps.get_model('incidents', 'Incident')
+    return Q(pk__in=Incident.objects.filter(lookup).values('pk'))
+
+
+def business_line_filter(value, comparator, user):
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    bls = BusinessLine.authorization.for_user(user, 'incidents.view_incidents').filter(name__icontains=value)
+    return incidents_filter(Q(concerned_business_lines__in=bls) | Q(main_business_lines__in=bls))
+
+
+def artifact_filter(value, comparator, user):
+    from fir_artifacts import artifacts as libartifacts
+
+    return libartifacts.incidents_filter(value)
+
+
+def severity_filter(value, comparator, user):
+    return Q(**{{':': 'severity', '<': 'severity__lt', '>': 'severity__gt'}[comparator]: value})
+
+
+OPERATORS = {
+    'plan': SearchOperator(lambda value, comparator, user: Q(plan__name=value)),
+    'bl': SearchOperator(business_line_filter),
+    'opened_by': SearchOperator(lambda value, comparator, user: Q(opened_by__username=value)),
+    'category': SearchOperator(lambda value, comparator, user: Q(category__name__icontains=value)),
+    'status': SearchOperator(lambda value, comparator, user: Q(status=value[0].upper())),
+    'art': SearchOperator(artifact_filter),
+    'severity': SearchOperator(severity_filter, type=int, comparators=(':', '<', '>')),
+    'starred': SearchOperator(lambda value, comparator, user: Q(is_starred=True), flag=True),
+}
+
+
+def get_operators():
+    operators = {}
+    for hook in get_hooks('search_operators'):
+        operators.update(hook)
+    operators.update(OPERATORS)
+    return operators
+
+
+class Plan(object):
+    """
+    Parsed search query: (operator, comparator, value) ``conditions`` and free-text ``terms``
+
+    ``lookup`` is the filter of the legacy ``keyword_filter`` hooks.
+    """
+
+    def __init__(self, conditions, terms, lookup=None):
+        self.conditions = conditions
+        self.terms = terms
+        self.lookup = Q() if lookup is None else lookup
+
+    def compile(self, user):
+        """
+        Returns the filter of the conditions, for ``user``
+        """
+        q = self.lookup
+        for operator, comparator, value in self.conditions:
+            q = q & operator.compile(value, comparator, user)
+        return q
+
+    def get_text_filter(self):
+        """
+        Returns the filter of the incidents containing all the terms, without the search index
+        """
+        Comments = apps.get_model('incidents', 'Comments')
+        q = Q()
+        for term in self.terms:
+            q_term = Q(subject__icontains=term) | Q(description__icontains=term) | Q(
+                pk__in=Comments.objects.filter(comment__icontains=term).values('incident'))
+            for hook in get_hooks('search_filter'):
+                q_term, term = hook(q_term, term)
+            q = q & q_term
+        return q
+
+    def is_ranked(self):
+        """
+        Tells if the incidents filtered with the plan are annotated with their ``search_rank``
+        """
+        return bool(self.terms) and search_index.is_enabled()
+
+    def filter(self, incidents, user):
+        """
+        Returns the ``incidents`` matching the plan for ``user``
+        """
+        incidents = incidents.filter(self.compile(user))
+        if self.is_ranked():
+            return search_index.search(incidents, self.terms)
+        return incidents.filter(self.get_text_filter())
+
+
+def normalize(query_string):
+    return u' '.join(query_string.split())
+
+
+def parse(query_string):
+    """
+    Returns the ``Plan`` of ``query_string``
+
+    Tokens looking like operators but with an unknown name, comparator or an empty or invalid value are free-text
+    terms.
+    """
+    operators = get_operators()
+    lookup = Q()
+    hooks = get_hooks('keyword_filter')
+    for hook in hooks:
+        lookup, query_string = hook(lookup, query_string)
+    conditions = []
+    terms = []
+    for match in TOKEN.finditer(query_string):
+        if match.group('name'):
+            name, comparator = match.group('name'), match.group('comparator')
+            value = match.group('quoted') if match.group('quoted') is not None else match.group('value')
+            operator = operators.get(name.lower())
+            if operator is not None and not operator.flag and comparator in operator.comparators and value.strip():
+                try:
+                    conditions.append((operator, comparator, operator.type(value)))
+                    continue
+                except ValueError:
+                    pass
+            terms.append(name + comparator + value)
+        elif match.group('phrase') is not None:
+            if match.group('phrase').strip():
+                terms.append(normalize(match.group('phrase')))
+        else:
+            operator = operators.get(match.group('word').lower())
+            if operator is not None and operator.flag:
+                conditions.append((operator, None, True))
+            else:
+                terms.append(match.group('word'))
+    return Plan(conditions, terms, lookup=lookup if hooks else None)
+
+
+def get_plan(query_string):
+    """
+    Returns the ``Plan`` of ``query_string``, from the plan cache when it was already parsed
+    """
+    key = normalize(query_string)
+    with _plans_lock:
+        plan = _plans.pop(key, None)
+        if plan is not None:
+            _plans[key] = plan
+            return plan
+    plan = parse(key)
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
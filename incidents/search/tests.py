@@ -0,0 +1,207 @@
+from StringIO import StringIO
+from unittest import skipUnless
+
+from django.apps import apps
+from django.contrib.auth.models import User, Group, Permission
+from django.core.management import call_command
+from django.db.models import Max
+from django.test import TestCase, override_settings
+
+from incidents import models
+from incidents.search import backends as search_backends
+from incidents.search import index as search_index
+from incidents.search import query as search_query
+
+
+@skipUnless(search_backends.get_backend() is not None, "The database has no full-text search backend")
+@override_settings(SEARCH_INDEX=True)
+class SearchIndexTestCase(TestCase):
+    fixtures = ['incidents/fixtures/seed_data.json', ]
+
+    def setUp(self):
+        self.root = models.BusinessLine.add_root(name='Root')
+        self.other = models.BusinessLine.add_root(name='Other')
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.user = User.objects.create_user('user', 'user@example.com', 'user')
+        for user in (self.admin, self.user):
+            models.Profile.objects.create(user=user)
+        role = Group.objects.create(name='Viewer')
+        role.permissions.add(*Permission.objects.filter(codename__in=['view_incidents', 'handle_incidents']))
+        models.AccessControlEntry.objects.create(user=self.user, business_line=self.root, role=role)
+
+        category = models.IncidentCategory.objects.first()
+        detection = models.Label.objects.filter(group__name='detection').first()
+        self.action = models.Label.objects.filter(group__name='action').first()
+        texts = [
+            ('Phishing campaign', 'Mails sent to the finance department'),
+            ('Malware on a laptop', 'The phishing mail dropped a trojan'),
+            ('Scan', 'Port scan from 192.0.2.15'),
+            ('Defacement', 'The intranet homepage was defaced'),
+        ]
+        self.incidents = []
+        for n, (subject, description) in enumerate(texts):
+            incident = models.Incident.objects.create(
+                subject=subject, description=description, category=category, detection=detection, severity=2,
+                opened_by=self.admin)
+            incident.concerned_business_lines = [(self.root, self.other)[n % 2]]
+            self.incidents.append(incident)
+
+    def search(self, user, terms):
+        incidents = models.Incident.authorization.for_user(user, 'incidents.view_incidents')
+        return list(search_index.search(incidents, terms).order_by('-search_rank').values_list('pk', flat=True))
+
+    def test_search(self):
+        phishing, malware, scan, defacement = [incident.pk for incident in self.incidents]
+        # Subject matches rank higher than description matches
+        self.assertEqual(self.search(self.admin, ['phishing']), [phishing, malware])
+        self.assertEqual(self.search(self.admin, ['phish']), [phishing, malware])
+        self.assertEqual(self.search(self.admin, ['phishing', 'trojan']), [malware])
+        self.assertEqual(self.search(self.admin, ['192.0.2']), [scan])
+        self.assertEqual(self.search(self.admin, ['ishing']), [])
+        self.assertEqual(self.search(self.user, ['phishing']), [phishing])
+
+        # Comments are indexed when they are written
+        models.Comments.objects.create(incident=self.incidents[3], comment='Restored from the backup',
+                                       action=self.action, opened_by=self.admin)
+        self.assertEqual(self.search(self.admin, ['backup']), [defacement])
+        self.incidents[2].subject = 'Backup server scan'
+        self.incidents[2].save()
+        self.assertEqual(set(self.search(self.admin, ['backup'])), {scan, defacement})
+
+    @skipUnless(apps.is_installed('fir_nuggets'), "Needs the fir_nuggets plugin")
+    def test_nuggets(self):
+        from fir_nuggets.models import Nugget
+
+        Nugget.objects.create(incident=self.incidents[2], found_by=self.admin, source='Firewall logs',
+                              raw_data='DROP 192.0.2.15', interpretation='Blocked by the perimeter firewall')
+        self.assertEqual(self.search(self.admin, ['perimeter']), [self.incidents[2].pk])
+
+    def test_rebuild(self):
+        expected = search_index.compute_documents([incident.pk for incident in self.incidents])
+        models.SearchDocument.objects.all().delete()
+        self.assertEqual(self.search(self.admin, ['phishing']), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(dict((document.incident_id, (document.subject, document.body))
+                              for document in models.SearchDocument.objects.all()), expected)
+        self.assertEqual(len(self.search(self.admin, ['phishing'])), 2)
+
+    def test_views(self):
+        for user in (self.user, self.admin):
+            self.client.force_login(user)
+            response = self.client.get('/search/', {'q': 'phishing mail'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.status_code, 200)
+            indexed = [incident.pk for incident in response.context['incident_list']]
+            with self.settings(SEARCH_INDEX=False):
+                response = self.client.get('/search/', {'q': 'phishing mail'},
+                                           HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(set(indexed), set(incident.pk for incident in response.context['incident_list']))
+
+        response = self.client.get('/api/incidents/search', {'q': 'phishing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([incident['id'] for incident in response.data['results']],
+                         self.search(self.admin, ['phishing']))
+
+
+class SearchQueryTestCase(TestCase):
+    fixtures = ['incidents/fixtures/seed_data.json', ]
+
+    def setUp(self):
+        self.root = models.BusinessLine.add_root(name='Root')
+        self.other = models.BusinessLine.add_root(name='Other business line')
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        models.Profile.objects.create(user=self.admin)
+
+        category = models.IncidentCategory.objects.first()
+        detection = models.Label.objects.filter(group__name='detection').first()
+        self.action = models.Label.objects.filter(group__name='action').first()
+        self.incidents = []
+        for n, (subject, severity, status) in enumerate([('Phishing campaign', 1, 'O'), ('Phishing mail', 3, 'C'),
+                                                          ('Port scan', 4, 'O')]):
+            incident = models.Incident.objects.create(
+                subject=subject, description='Description', category=category, detection=detection,
+                severity=severity, status=status, opened_by=self.admin, is_starred=n == 2)
+            incident.concerned_business_lines = [self.root, self.other][:n + 1]
+            self.incidents.append(incident)
+        for n in range(2):
+            models.Comments.objects.create(incident=self.incidents[1], comment='Reported by the user',
+                                           action=self.action, opened_by=self.admin)
+
+    def search(self, query_string):
+        incidents = models.Incident.authorization.for_user(self.admin, 'incidents.view_incidents')
+        plan = search_query.get_plan(query_string)
+        return sorted(plan.filter(incidents, self.admin).values_list('pk', flat=True))
+
+    def test_parse(self):
+        plan = search_query.parse(u'severity>2 bl:"Other business line" starred phishing "port  scan" severity:high '
+                                  u'unknown:value')
+        self.assertEqual([(comparator, value) for operator, comparator, value in plan.conditions],
+                         [('>', 2), (':', u'Other business line'), (None, True)])
+        self.assertEqual(plan.terms, [u'phishing', u'port scan', u'severity:high', u'unknown:value'])
+        plan = search_query.parse(u'status:"" bl:" " phishing')
+        self.assertEqual((plan.conditions, plan.terms), ([], [u'status:', u'bl: ', u'phishing']))
+
+        self.assertIs(search_query.get_plan(u' phishing  severity>2'), search_query.get_plan(u'phishing severity>2'))
+
+    def test_search(self):
+        campaign, mail, scan = [incident.pk for incident in self.incidents]
+        self.assertEqual(self.search(u'phishing'), [campaign, mail])
+        self.assertEqual(self.search(u'phishing severity>2'), [mail])
+        self.assertEqual(self.search(u'severity<4'), [campaign, mail])
+        self.assertEqual(self.search(u'status:open'), [campaign, scan])
+        self.assertEqual(self.search(u'starred'), [scan])
+        self.assertEqual(self.search(u'bl:other'), [mail, scan])
+        self.assertEqual(self.search(u'bl:"Other business line" reported'), [mail])
+        self.assertEqual(self.search(u'bl:unknown'), [])
+        self.assertEqual(self.search(u'"phishing mail"'), [mail])
+
+    def test_artifacts(self):
+        from fir_artifacts.index import exact_filter, get_hash
+        from fir_artifacts.models import Artifact
+
+        campaign, mail, scan = self.incidents
+        campaign.refresh_artifacts(u'Sent from 192.0.2.15 and phish.example.com')
+        mail.refresh_artifacts(u'Sent from 192.0.2.16')
+        scan.refresh_artifacts(u'Scanned by 198.51.100.7')
+        self.assertEqual(Artifact.objects.get(value=u'192.0.2.15').value_hash, get_hash(u'192.0.2.15'))
+        self.assertEqual(Artifact.objects.filter(exact_filter([u'192.0.2.16', u'192.0.2.1'])).get().value,
+                         u'192.0.2.16')
+
+        self.assertEqual(self.search(u'art:192.0.2'), [campaign.pk, mail.pk])
+        self.assertEqual(self.search(u'art:PHISH.example'), [campaign.pk])
+        self.assertEqual(self.search(u'art:.1'), [campaign.pk, mail.pk, scan.pk])
+        self.assertEqual(self.search(u'art:192.0.2.16 severity>2'), [mail.pk])
+        self.assertEqual(self.search(u'art:203.0.113'), [])
+
+        # The artifacts are matched in the query of the incidents
+        incidents = models.Incident.authorization.for_user(self.admin, 'incidents.view_incidents')
+        with self.assertNumQueries(1):
+            list(search_query.get_plan(u'art:192.0.2').filter(incidents, self.admin))
+
+    @skipUnless(apps.is_installed('fir_nuggets'), "Needs the fir_nuggets plugin")
+    def test_nuggets(self):
+        from fir_nuggets.models import Nugget
+
+        Nugget.objects.create(incident=self.incidents[2], found_by=self.admin, source='Firewall logs',
+                              raw_data='DROP 192.0.2.15', interpretation='Blocked by the perimeter firewall')
+        self.assertEqual(self.search(u'nugget:perimeter'), [self.incidents[2].pk])
+        self.assertEqual(self.search(u'perimeter'), [self.incidents[2].pk])
+
+    def test_views(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/search/', {'q': 'phishing severity>2'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([incident.pk for incident in response.context['incident_list']], [self.incidents[1].pk])
+        response = self.client.get('/search/', {'q': 'status:""'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+
+        # Ordered by the date of the last comment
+        last_action = lambda incident: (incident.comments_set.aggregate(date=Max('date'))['date'], incident.pk)
+        expected = sorted(self.incidents[:2], key=last_action)
+        for asc in ('true', 'false'):
+            response = self.client.get('/search/', {'q': 'phishing', 'order_by': 'last_action', 'asc': asc},
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual([incident.pk for incident in response.context['incident_list']],
+                             [incident.pk for incident in expected])
+            expected.reverse()
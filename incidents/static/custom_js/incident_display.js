@@ -37,8 +37,9 @@ $(function () {
 		var q = container.data('query');
 
 		page = element.data('page') || 1;
+		cursor = element.data('cursor') || '';
 
-		$.get(url, { 'order_by': order_by, 'asc': asc, 'q': q, 'page': page }, refresh_incident_display(container));
+		$.get(url, { 'order_by': order_by, 'asc': asc, 'q': q, 'page': page, 'cursor': cursor }, refresh_incident_display(container));
 	}
 
 	function toggle_star(link) {
@@ -12,6 +12,15 @@ var color_severity = d3.scale.ordinal()
 
 var colors = {other: color, severity: color_severity};
 
+// Loads the data of a chart from its URL, or copies the data of a chart loaded with a batch of charts
+function load_json(source, callback) {
+	if (typeof source === 'string') {
+		d3.json(source, callback);
+	} else {
+		callback(null, JSON.parse(JSON.stringify(source)));
+	}
+}
+
 function generate_table(selector, url) {
 	$.getJSON(url, function(data) {
 
@@ -38,7 +47,7 @@ function generate_table(selector, url) {
 }
 
 function generate_variation_chart(selector, url) {
-	$.getJSON(url, function(data) {
+	load_json(url, function(error, data) {
 		  var rows = [];
 
 		  var up = '<i class="icon-plus-sign"></i>';
@@ -106,7 +115,7 @@ function generate_stacked_chart(selector, url, width, height, label, legend) {
     width = width - margin.left - margin.right,
     height = height - margin.top - margin.bottom;
 
-	d3.json(url, function(error, data) {
+	load_json(url, function(error, data) {
 
 		var legend_per_col = (Math.floor(height/20));
 		legend = Object.keys(data[0]).length-1;
@@ -248,7 +257,7 @@ function generate_bar_chart(selector, url, width, height, label) {
 	  .append("g")
 	    .attr("transform", "translate(" + margin.left + "," + margin.top + ")");
 
-	d3.json(url, function(error, data) {
+	load_json(url, function(error, data) {
 		 color.domain([]);
 		data.forEach(function (d) {
 			d.label = d.label
@@ -346,7 +355,7 @@ function generate_multiple_donut_chart(selector, url, widths, outer_radius, inne
 	    .sort(null)
 	    .value(function(d) { return d.value; });
 
-	d3.json(url, function(error, data) {
+	load_json(url, function(error, data) {
 	  color.domain(d3.keys(data[0]).filter(function(key) { return key !== 'entry'; }));
 
 	  data.forEach(function(d) {
@@ -438,7 +447,7 @@ function generate_donut_chart(selector, url, dimension, radius) {
     .append("g")
       .attr("transform", "translate(" + width / 2 + "," + height / 2 + ")");
 
-  d3.json(url, function(error, data) {
+  load_json(url, function(error, data) {
 	  var color_scale;
       if (data[0].label == "1/4") {
 		  color_scale = color_severity;
@@ -528,7 +537,7 @@ function generate_multiple_line_chart(selector, url, width, height, dateformat,
 	  .append("g")
 	    .attr("transform", "translate(" + margin.left + "," + margin.top + ")");
 
-	d3.json(url, function(error, data) {
+	load_json(url, function(error, data) {
 	  color.domain(d3.keys(data[0]).filter(function(key) { return key !== "date"; }));
 
 	  data.forEach(function(d) {
@@ -626,7 +635,7 @@ function generate_line_chart(selector, url, width, height) {
 	  .append("g")
 	    .attr("transform", "translate(" + margin.left + "," + margin.top + ")");
 
-	d3.json(url, function(error, chart_data) {
+	load_json(url, function(error, chart_data) {
 
 		chart_data.forEach(function (data){
 
@@ -0,0 +1,321 @@
+"""
+Statistics aggregation
+
+ Counts incidents per month bucket (and per dimension) with one GROUP BY query,
+ instead of one count query per month and per dimension value.
+
+"""
+from django.db.models import Case, Count, Q, Sum, When
+from django.db.models.functions import Substr
+from django.utils import six
+
+from incidents.statistics import windows
+
+
+def authorized_incidents(user, permission):
+    """
+    Returns the incidents ``user`` is granted ``permission`` on, ready to be grouped
+
+    The authorization is kept in a semi-join, so that grouping on a multi-valued relation
+    does not reuse (or get duplicated by) the authorization joins.
+    """
+    from incidents.models import Incident
+
+    incidents = Incident.authorization.for_user(user, permission)
+    if not incidents.query.has_filters():
+        return incidents
+    return Incident.objects.filter(pk__in=incidents.values('pk'))
+
+
+def owner_grants(permission):
+    """
+    Tells if the incidents owners are granted ``permission`` on them (``INCIDENT_CREATOR_PERMISSION``)
+    """
+    from incidents.models import Incident
+
+    meta = Incident._authorization_meta
+    return bool(meta.owner_field and meta.owner_permission and meta.owner_permission == permission)
+
+
+class MonthlyCounts(object):
+    """
+    Distinct incident counts per (month, ``dimension`` values), computed with a single query
+
+    ``months`` are (year, month) tuples, ``dimension`` a field name (or lookup) or a tuple of them to group by.
+    """
+    field = 'date'
+
+    def __init__(self, incidents=None, months=(), dimension=None):
+        if dimension is None:
+            self.dimensions = ()
+        elif isinstance(dimension, six.string_types):
+            self.dimensions = (dimension,)
+        else:
+            self.dimensions = tuple(dimension)
+        self.counts = {}
+        if incidents is not None:
+            self.add(incidents, months)
+
+    def get_rows(self, incidents, months, fields):
+        return incidents.filter(windows.month_filter(months, field=self.field)).annotate(
+            month=windows.month_bucket(self.field)).order_by().values(*fields).annotate(count=Count('pk', distinct=True))
+
+    def add(self, incidents, months, *values):
+        """
+        Adds the counts of ``incidents``, keyed by the constant ``values`` before the dimension values
+        """
+        for row in self.get_rows(incidents, months, ('month',) + self.dimensions):
+            self.increment((row['month'].year, row['month'].month),
+                           values + tuple(row[d] for d in self.dimensions), row['count'])
+
+    def increment(self, month, values=(), count=1):
+        key = (month[0], month[1]) + tuple(values)
+        self.counts[key] = self.counts.get(key, 0) + count
+
+    def get(self, month, *values):
+        return self.counts.get((month[0], month[1]) + values, 0)
+
+    def total(self, months, *values):
+        return sum(self.get(month, *values) for month in months)
+
+    def totals(self, months):
+        """
+        Returns the counts summed over ``months``, keyed by their values
+        """
+        months = set((month[0], month[1]) for month in months)
+        totals = {}
+        for key, count in self.counts.items():
+            if key[:2] in months:
+                totals[key[2:]] = totals.get(key[2:], 0) + count
+        return totals
+
+    def collapse(self, *dimensions):
+        """
+        Returns these counts summed over the values of ``dimensions``
+
+        The charts needing different dimensions can so share the counts grouped by all of them. This
+        only holds for single-valued dimensions, for which an incident is counted in a single group.
+        """
+        kept = [i for i, dimension in enumerate(self.dimensions) if dimension not in dimensions]
+        counts = MonthlyCounts(dimension=tuple(self.dimensions[i] for i in kept))
+        for key, count in self.counts.items():
+            start = len(key) - len(self.dimensions)
+            counts.increment(key[:2], key[2:start] + tuple(key[start + i] for i in kept), count)
+        return counts
+
+
+def root_path(field='concerned_business_lines__path'):
+    """
+    Returns an expression of the root business line path of the business lines ``field`` path
+    """
+    from incidents.models import BusinessLine
+
+    return Substr(field, 1, BusinessLine.steplen)
+
+
+class RootMonthlyCounts(MonthlyCounts):
+    """
+    Distinct incident counts per (month, root business line pk, ``dimension`` values), with a single query
+
+    Incidents are grouped by the root prefix of their concerned business lines paths: an incident
+    concerning several business lines of a tree is counted once for its root.
+    """
+
+    def __init__(self, incidents, months, roots, dimension=None):
+        from incidents.models import BusinessLine
+
+        super(RootMonthlyCounts, self).__init__(dimension=dimension)
+        roots = dict((root.path, root.pk) for root in roots)
+        if not len(roots):
+            return
+        incidents = incidents.filter(BusinessLine.get_path_filter(roots.keys(), key='concerned_business_lines__path'))
+        for row in self.get_rows(incidents.annotate(root_path=root_path()), months,
+                                 ('month', 'root_path') + self.dimensions):
+            self.increment((row['month'].year, row['month'].month),
+                           (roots[row['root_path']],) + tuple(row[d] for d in self.dimensions), row['count'])
+
+
+def conditional_counts(incidents, months, columns):
+    """
+    Returns the distinct counts of ``incidents`` per (month, column key), with a single query
+
+    ``columns`` are (key, filter) pairs, a None filter counting all the incidents. Each column is a
+    conditional aggregate (COUNT(DISTINCT CASE WHEN filter THEN id END)): unlike grouping, an incident
+    is counted in every column it matches, as in the overlapping subtrees of business lines.
+    """
+    from incidents.models import Incident
+
+    counts = MonthlyCounts()
+    aggregates = {}
+    for i, (key, lookup) in enumerate(columns):
+        aggregates['column_{}'.format(i)] = Count('pk' if lookup is None else Case(When(lookup, then='pk')),
+                                                  distinct=True)
+    if not aggregates:
+        return counts
+    incidents = Incident.objects.filter(pk__in=incidents.filter(windows.month_filter(months)).values('pk'))
+    for row in incidents.annotate(month=windows.month_bucket()).order_by().values('month').annotate(**aggregates):
+        for i, (key, lookup) in enumerate(columns):
+            counts.increment((row['month'].year, row['month'].month), (key,), row['column_{}'.format(i)])
+    return counts
+
+
+def business_line_filter(business_line):
+    """
+    Returns the filter the statistics views use for the incidents of ``business_line``
+    """
+    return Q(concerned_business_lines=business_line) | Q(main_business_lines=business_line) | Q(
+        concerned_business_lines__in=business_line.get_children())
+
+
+def monthly_counts(user, permission, months, lookup=None, dimension=None, business_line=None):
+    """
+    Returns the monthly counts of the incidents ``user`` is granted ``permission`` on
+
+    They are read from the rollup when it holds exactly the user's scope, and computed
+    from the incidents otherwise. ``lookup`` and ``dimension`` may only use fields the rollup
+    also has, or ``main_business_lines`` (the root business lines) as dimension.
+    """
+    from incidents.statistics import rollup
+
+    if lookup is None:
+        lookup = Q()
+    if rollup.covers(user, permission, business_line):
+        if dimension == 'main_business_lines':
+            rows = rollup.root_rows(business_line)
+            dimension = 'root_business_line'
+        else:
+            rows = rollup.rows(business_line)
+        return rollup.MonthlyCounts(rows.filter(lookup), months, dimension=dimension)
+    incidents = authorized_incidents(user, permission).filter(lookup)
+    if business_line is not None:
+        incidents = incidents.filter(business_line_filter(business_line))
+    return MonthlyCounts(incidents, months, dimension=dimension)
+
+
+def root_monthly_counts(user, permission, roots, months, lookup=None, dimension=None):
+    """
+    Returns the monthly counts of the incidents of each of the ``roots`` business line trees, keyed by root pk
+
+    An incident concerning several business lines of a tree is counted once for it. The roots must be
+    entirely in the scope of ``user``.
+    """
+    from incidents.models import Incident
+    from incidents.statistics import rollup
+
+    if lookup is None:
+        lookup = Q()
+    roots = list(roots)
+    if dimension is None:
+        dimensions = ()
+    elif isinstance(dimension, six.string_types):
+        dimensions = (dimension,)
+    else:
+        dimensions = tuple(dimension)
+    if all(rollup.covers(user, permission, root) for root in roots):
+        return rollup.MonthlyCounts(rollup.root_rows().filter(lookup, root_business_line__in=roots), months,
+                                    dimension=('root_business_line',) + dimensions)
+    return RootMonthlyCounts(Incident.objects.filter(lookup), months, roots, dimension=dimension)
+
+
+def monthly_counts_many(user, permission, months, lookup=None, dimensions=()):
+    """
+    Returns the monthly counts of the incidents ``user`` is granted ``permission`` on, one per dimension
+
+    From the rollup, this is one grouped query per dimension. Otherwise the matching incidents are
+    fetched once with all the dimension values and counted in memory.
+    """
+    from incidents.statistics import rollup
+
+    if lookup is None:
+        lookup = Q()
+    if rollup.covers(user, permission):
+        return [monthly_counts(user, permission, months, lookup=lookup, dimension=dimension)
+                for dimension in dimensions]
+    counts = [MonthlyCounts(dimension=dimension) for dimension in dimensions]
+    seen = set()
+    incidents = authorized_incidents(user, permission).filter(lookup, windows.month_filter(months))
+    for row in incidents.order_by().values_list('pk', 'date', *dimensions).distinct():
+        for i, value in enumerate(row[2:]):
+            if (i, row[0], value) in seen:
+                continue
+            seen.add((i, row[0], value))
+            counts[i].increment((row[1].year, row[1].month), (value,))
+    return counts
+
+
+# Fields the incidents can be distributed by, with the lookup of the label of their values
+DISTRIBUTION_FIELDS = {
+    'category': 'category__name',
+    'detection': 'detection__name',
+    'actor': 'actor__name',
+    'plan': 'plan__name',
+    'severity': 'severity',
+    'status': 'status',
+    'confidentiality': 'confidentiality',
+    'is_incident': 'is_incident',
+    'is_major': 'is_major',
+}
+
+
+def distribution(user, permission, field, start, end, lookup=None):
+    """
+    Returns (label, count) pairs of the incidents ``user`` is granted ``permission`` on, grouped by ``field``
+
+    Only the incidents with ``start`` <= date < ``end`` are counted. ``field`` must be one of
+    ``DISTRIBUTION_FIELDS``; the values of the same label are counted together. The counts are read
+    from the rollup when it holds the user's scope and the window is made of whole months.
+    """
+    from incidents.statistics import rollup
+
+    if field not in DISTRIBUTION_FIELDS:
+        raise ValueError("Unknown distribution field '{}'".format(field))
+    label = DISTRIBUTION_FIELDS[field]
+    if lookup is None:
+        lookup = Q()
+    if windows.is_month_start(start) and windows.is_month_start(end) and rollup.covers(user, permission):
+        rows = rollup.rows().filter(lookup, windows.range_filter(start.date(), end.date(), field='month')).order_by(
+            label).values(label).annotate(count=Sum('count'))
+    else:
+        rows = authorized_incidents(user, permission).filter(lookup, windows.range_filter(start, end)).order_by(
+            label).values(label).annotate(count=Count('pk', distinct=True))
+    return [(row[label], row['count']) for row in rows]
+
+
+def distributions(user, permission, fields, start, end, lookup=None):
+    """
+    Returns the ``distribution`` of the incidents by each of ``fields``, keyed by field
+
+    When the window is made of whole months, the incidents are counted once, grouped by all the fields.
+    """
+    for field in fields:
+        if field not in DISTRIBUTION_FIELDS:
+            raise ValueError("Unknown distribution field '{}'".format(field))
+    if not windows.is_month_start(start) or not windows.is_month_start(end):
+        return dict((field, distribution(user, permission, field, start, end, lookup=lookup)) for field in fields)
+    labels = tuple(sorted(set(DISTRIBUTION_FIELDS[field] for field in fields)))
+    months = windows.months_between(start, end)
+    counts = monthly_counts(user, permission, months, lookup=lookup, dimension=labels)
+    result = {}
+    for field in fields:
+        label = DISTRIBUTION_FIELDS[field]
+        totals = counts.collapse(*[other for other in labels if other != label]).totals(months)
+        result[field] = sorted((values[0], count) for values, count in totals.items())
+    return result
+
+
+def pivot_table(header, items, months, counts, total=True):
+    """
+    Returns a table of the ``counts`` of each of ``items`` per month, without the rows of zeros
+
+    ``items`` are (label, dimension value) pairs, ``header`` is the first row. With ``total``,
+    each row ends with the sum of its counts.
+    """
+    table = [list(header)]
+    for label, value in items:
+        line = [label] + [counts.get(month, value) for month in months]
+        if not any(line[1:]):
+            continue
+        if total:
+            line.append(sum(line[1:]))
+        table.append(line)
+    return table
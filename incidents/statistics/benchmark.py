@@ -0,0 +1,78 @@
+"""
+Statistics benchmark helpers
+
+ The time bucketing is measured on synthetic in-memory rows, without a database.
+
+"""
+import datetime
+import random
+
+from incidents.authorization.benchmark import measure, summarize
+from incidents.statistics.buckets import TimeBuckets
+
+
+def generate_ranges(start, count, step=datetime.timedelta(hours=1)):
+    return [{'from': start + i * step, 'to': start + (i + 1) * step} for i in range(count)]
+
+
+def generate_rows(ranges, incidents, attributes=2, names=('Accounts', 'Hosts'), seed=0):
+    """
+    Returns ``incidents`` (id, date) rows spread over ``ranges``, and ``attributes`` (incident id, name, value)
+    rows per incident
+    """
+    rng = random.Random(seed)
+    start = ranges[0]['from']
+    span = int((ranges[-1]['to'] - start).total_seconds())
+    incident_rows = [(pk, start + datetime.timedelta(seconds=rng.randrange(span))) for pk in range(incidents)]
+    attribute_rows = [(pk, rng.choice(names), str(rng.randint(0, 100)))
+                      for pk in range(incidents) for i in range(attributes)]
+    return incident_rows, attribute_rows
+
+
+def scan(ranges, incident_rows, attribute_rows, names):
+    """
+    Aggregates the rows by rescanning them for every range, as the attributes views previously did
+    """
+    result = []
+    for date_range in ranges:
+        incident_ids = [pk for pk, date in incident_rows if date_range['from'] <= date < date_range['to']]
+        with_attribute = []
+        attributes = dict((name, []) for name in names)
+        for incident_id, name, value in attribute_rows:
+            if incident_id in incident_ids and name in attributes:
+                if incident_id not in with_attribute:
+                    with_attribute.append(incident_id)
+                attributes[name].append(value)
+        result.append((date_range, len(incident_ids), attributes, len(with_attribute)))
+    return result
+
+
+def bucket(ranges, incident_rows, attribute_rows, names):
+    buckets = TimeBuckets(ranges, names)
+    buckets.add_incidents(incident_rows)
+    buckets.add_attributes(attribute_rows)
+    return list(buckets)
+
+
+def run(incidents=100000, buckets=500, attributes=2, repeat=3, scan_incidents=0, seed=0):
+    """
+    Times the bucketing of ``incidents`` incidents with ``attributes`` attributes each over ``buckets`` ranges
+
+    The previous rescanning implementation is also timed on the first ``scan_incidents`` incidents.
+    Returns a JSON serializable dict of timing summaries.
+    """
+    names = ('Accounts', 'Hosts')
+    ranges = generate_ranges(datetime.datetime(2017, 1, 1), buckets)
+    incident_rows, attribute_rows = generate_rows(ranges, incidents, attributes=attributes, names=names, seed=seed)
+    results = {'bucket': summarize(measure(lambda: bucket(ranges, incident_rows, attribute_rows, names),
+                                           repeat=repeat))}
+    if scan_incidents:
+        incident_sample = incident_rows[:scan_incidents]
+        attribute_sample = attribute_rows[:scan_incidents * attributes]
+        results['scan'] = summarize(measure(lambda: scan(ranges, incident_sample, attribute_sample, names),
+                                            repeat=repeat))
+        results['scan']['incidents'] = scan_incidents
+        results['bucket_sample'] = summarize(measure(
+            lambda: bucket(ranges, incident_sample, attribute_sample, names), repeat=repeat))
+        results['bucket_sample']['incidents'] = scan_incidents
+    return results
@@ -0,0 +1,121 @@
+"""
+Time buckets
+
+ Aggregates incidents and their attributes over consecutive date ranges (dicts with 'from' and 'to'
+ keys, as returned by ``stats_attributes_date_ranges``). Incidents are assigned to a range by bisecting
+ the sorted range starts, attributes are assigned to the range of their incident.
+
+ The statistics of the numeric attribute values are computed with NumPy when it is installed.
+
+"""
+import bisect
+import math
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TimeBuckets(object):
+    """
+    Incident counts and attribute values per date range
+
+    For each range of ``ranges``: ``incidents`` counts the incidents, ``with_attribute`` counts
+    the incidents having one of the attributes ``names`` and ``attributes`` lists the values
+    of each of the attributes ``names``.
+    """
+
+    def __init__(self, ranges, names=()):
+        self.ranges = sorted(ranges, key=itemgetter('from'))
+        self.names = list(names)
+        self.starts = [date_range['from'] for date_range in self.ranges]
+        self.ends = [date_range['to'] for date_range in self.ranges]
+        self.incidents = [0] * len(self.ranges)
+        self.with_attribute = [0] * len(self.ranges)
+        self.attributes = [dict((name, []) for name in self.names) for date_range in self.ranges]
+        self._buckets = {}
+        self._with_attribute = set()
+
+    def index(self, date, lo=0):
+        """
+        Returns the index of the range containing ``date``, None if there is none
+        """
+        i = bisect.bisect_right(self.starts, date, lo) - 1
+        if i >= 0 and date < self.ends[i]:
+            return i
+        return None
+
+    def add_incidents(self, rows):
+        """
+        Counts the incidents from (id, date) ``rows``
+        """
+        lo = 0
+        for incident_id, date in sorted(rows, key=itemgetter(1)):
+            i = self.index(date.replace(tzinfo=None), lo)
+            if i is None:
+                continue
+            lo = i
+            self._buckets[incident_id] = i
+            self.incidents[i] += 1
+
+    def add_attributes(self, rows):
+        """
+        Adds the values of (incident id, name, value) ``rows`` to the ranges of their incidents
+        """
+        for incident_id, name, value in rows:
+            i = self._buckets.get(incident_id)
+            if i is None or name not in self.attributes[i]:
+                continue
+            self.attributes[i][name].append(value)
+            if incident_id not in self._with_attribute:
+                self._with_attribute.add(incident_id)
+                self.with_attribute[i] += 1
+
+    def get_statistics(self, name):
+        """
+        Returns the count, total and standard deviation of the integer values of the attribute ``name``
+        in each range
+        """
+        indexes = []
+        values = []
+        for i, attributes in enumerate(self.attributes):
+            indexes.extend([i] * len(attributes[name]))
+            values.extend(int(value) for value in attributes[name])
+        if numpy is not None:
+            return self._reduce_numpy(indexes, values)
+        return self._reduce(indexes, values)
+
+    def _reduce(self, indexes, values):
+        counts = [0] * len(self.ranges)
+        totals = [0] * len(self.ranges)
+        squares = [0] * len(self.ranges)
+        for i, value in zip(indexes, values):
+            counts[i] += 1
+            totals[i] += value
+            squares[i] += value * value
+        deviations = []
+        for count, total, square in zip(counts, totals, squares):
+            if count:
+                deviations.append(math.sqrt(max(float(square) / count - (float(total) / count) ** 2, 0)))
+            else:
+                deviations.append(0.0)
+        return {'count': counts, 'total': totals, 'std': deviations}
+
+    def _reduce_numpy(self, indexes, values):
+        indexes = numpy.array(indexes, dtype=numpy.intp)
+        values = numpy.array(values, dtype=numpy.float64)
+        counts = numpy.bincount(indexes, minlength=len(self.ranges))
+        totals = numpy.bincount(indexes, weights=values, minlength=len(self.ranges))
+        squares = numpy.bincount(indexes, weights=values * values, minlength=len(self.ranges))
+        divisors = numpy.maximum(counts, 1)
+        deviations = numpy.sqrt(numpy.maximum(squares / divisors - (totals / divisors) ** 2, 0))
+        return {'count': counts.tolist(), 'total': [int(total) for total in totals.tolist()],
+                'std': deviations.tolist()}
+
+    def __iter__(self):
+        """
+        Yields (range, incident count, attribute values by name, count of incidents with an attribute)
+        """
+        return iter(zip(self.ranges, self.incidents, self.attributes, self.with_attribute))
@@ -0,0 +1,135 @@
+"""
+Statistics responses cache
+
+ Chart data responses are shared between the users having the same authorization scope, in the
+ Django cache named by ``STATISTICS_CACHE``. Keys combine the request path and parameters, the
+ current date and the user's scope: global, or their authorization paths on the business lines
+ (and the user when the incidents they opened are also in their scope).
+
+ Entries are invalidated with generation counters:
+  - one per root business line, bumped by the writes of its incidents
+  - a global one, bumped by every incident write (global scopes see all the incidents)
+  - a tree one, bumped when business lines are moved or deleted
+
+ Other changes (category or label names...) are only seen when the entries expire.
+
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.http import HttpResponse
+
+from incidents.authorization.cache import bump_generation
+from incidents.statistics import aggregation
+
+GLOBAL = 'global'
+TREE = 'tree'
+
+
+def is_enabled():
+    return getattr(settings, 'STATISTICS_CACHE', None) is not None
+
+
+def _get_cache():
+    if not is_enabled():
+        return None
+    return caches[settings.STATISTICS_CACHE]
+
+
+def _generation_key(scope):
+    return 'fir:statistics:generation:{}'.format(scope)
+
+
+def get_scope(user, permission):
+    """
+    Returns the minimized authorization paths of ``user`` for ``permission`` (None for a global scope),
+    and the user's pk when the incidents they opened are also in their scope
+    """
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    if user.is_superuser or user.has_perms([permission]):
+        return None, None
+    owner = user.pk if aggregation.owner_grants(permission) else None
+    return BusinessLine.minimize_paths(BusinessLine.get_authorization_paths(user, [permission])), owner
+
+
+def get_generations(cache, paths, owner=None):
+    """
+    Returns the generations the responses computed for the scope ``paths`` (and ``owner``) depend on
+    """
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    if paths is None or owner is not None:
+        scopes = [TREE, GLOBAL]
+    else:
+        scopes = [TREE] + sorted(set(path[:BusinessLine.steplen] for path in paths))
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    return [generations.get(key, 0) for key in keys]
+
+
+def get_key(request, paths, owner, generations):
+    fingerprint = hashlib.sha1()
+    for part in (request.path, sorted(request.GET.lists()), datetime.date.today(), paths, owner, generations):
+        fingerprint.update(repr(part))
+    return 'fir:statistics:response:{}'.format(fingerprint.hexdigest())
+
+
+def cache_response(permission='incidents.view_statistics'):
+    """
+    Caches the successful GET responses of a statistics view between the users sharing the same scope
+
+    The view must only depend on the request and on the incidents ``user`` is granted ``permission`` on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = _get_cache()
+            if cache is None or request.method != 'GET':
+                return view(request, *args, **kwargs)
+            paths, owner = get_scope(request.user, permission)
+            key = get_key(request, paths, owner, get_generations(cache, paths, owner))
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']),
+                          getattr(settings, 'STATISTICS_CACHE_TIMEOUT', 600))
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_paths(paths):
+    """
+    Invalidates the responses depending on the incidents of the business lines ``paths``
+    """
+    cache = _get_cache()
+    if cache is None:
+        return
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    for scope in set([GLOBAL]) | set(path[:BusinessLine.steplen] for path in paths):
+        bump_generation(cache, _generation_key(scope))
+
+
+def invalidate_incidents(incidents, business_lines=()):
+    """
+    Invalidates the responses depending on ``incidents`` and on the given ``business_lines``
+    """
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    invalidate_paths(BusinessLine.objects.filter(
+        Q(incident__in=list(incidents)) | Q(pk__in=list(business_lines))).values_list('path', flat=True).distinct())
+
+
+def invalidate_all():
+    """
+    Invalidates all the responses (e.g. after a tree move)
+    """
+    cache = _get_cache()
+    if cache is not None:
+        bump_generation(cache, _generation_key(TREE))
@@ -0,0 +1,196 @@
+"""
+Monthly incident rollup
+
+ Keeps incident counts per (month, root business line, business line, category, severity,
+ detection, actor, plan, status, is_incident, is_major, confidentiality).
+
+ Each incident is counted in four kinds of rows:
+  - one global row (no business line)
+  - one row per root business line of its concerned business lines (no business line)
+  - one row per root business line it matches with ``aggregation.business_line_filter`` (no root
+    business line): concerned, main business line, or with a concerned child business line
+  - one row per concerned business line (with its root business line)
+ so that distinct incident counts can be summed at each of these levels. The key columns without
+ business line, actor or plan hold ``NONE``, for the unique constraint of the keys to apply to them.
+
+ The rollup is only used and maintained when ``STATISTICS_ROLLUP`` is True. It is updated
+ incrementally from the incident signals; bulk updates bypass them and need a rebuild
+ ('./manage.py rebuild_statistics_rollup').
+
+"""
+import datetime
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from incidents.statistics import aggregation, windows
+
+BATCH_SIZE = 1000
+
+FIELDS = ('category_id', 'severity', 'detection_id', 'actor_id', 'plan_id', 'status', 'is_incident', 'is_major',
+          'confidentiality')
+KEY_FIELDS = ('month', 'root_business_line_id', 'business_line_id') + FIELDS
+
+# Key column value of the rows without root business line, business line, actor or plan
+NONE = 0
+NONE_DIMENSIONS = ('root_business_line', 'business_line', 'actor', 'plan')
+
+
+def is_enabled():
+    return getattr(settings, 'STATISTICS_ROLLUP', False)
+
+
+def _get_models():
+    return apps.get_model('incidents', 'Incident'), apps.get_model('incidents', 'BusinessLine'), \
+           apps.get_model('incidents', 'IncidentRollup')
+
+
+def get_keys(pks):
+    """
+    Returns a Counter of the rollup keys the incidents ``pks`` currently contribute to
+    """
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    keys = Counter()
+    pks = list(pks)
+    if not len(pks):
+        return keys
+    links = {}
+    for incident_id, business_line_id in Incident.concerned_business_lines.through.objects.filter(
+            incident_id__in=pks).values_list('incident_id', 'businessline_id'):
+        links.setdefault(incident_id, set()).add(business_line_id)
+    main_roots = {}
+    for incident_id, business_line_id in Incident.main_business_lines.through.objects.filter(
+            incident_id__in=pks, businessline__depth=1).values_list('incident_id', 'businessline_id'):
+        main_roots.setdefault(incident_id, set()).add(business_line_id)
+    paths = dict(BusinessLine.objects.filter(pk__in=set().union(*links.values())).values_list('pk', 'path'))
+    roots = dict(BusinessLine.objects.filter(
+        path__in=set(path[:BusinessLine.steplen] for path in paths.values())).values_list('path', 'pk'))
+    for row in Incident.objects.filter(pk__in=pks).values_list('pk', 'date', *FIELDS):
+        month = datetime.date(row[1].year, row[1].month, 1)
+        dimensions = tuple(NONE if value is None else value for value in row[2:])
+        keys[(month, NONE, NONE) + dimensions] += 1
+        business_lines = links.get(row[0], ())
+        for root in set(roots[paths[bl][:BusinessLine.steplen]] for bl in business_lines):
+            keys[(month, root, NONE) + dimensions] += 1
+        # The roots of the concerned business lines of depth 1 or 2, and the main business lines
+        matched = set(roots[paths[bl][:BusinessLine.steplen]] for bl in business_lines
+                      if len(paths[bl]) <= 2 * BusinessLine.steplen)
+        for root in matched | main_roots.get(row[0], set()):
+            keys[(month, NONE, root) + dimensions] += 1
+        for bl in business_lines:
+            keys[(month, roots[paths[bl][:BusinessLine.steplen]], bl) + dimensions] += 1
+    return keys
+
+
+def apply(current, previous=None):
+    """
+    Adds the ``current`` keys and removes the ``previous`` ones from the rollup
+    """
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    delta = Counter(current)
+    delta.subtract(previous or Counter())
+    with transaction.atomic():
+        # The rows are locked in the order of their keys, the same in all the transactions
+        for key, count in sorted(delta.items()):
+            if count == 0:
+                continue
+            lookup = dict(zip(KEY_FIELDS, key))
+            rows = IncidentRollup.objects.filter(**lookup)
+            if count < 0:
+                rows.update(count=F('count') + count)
+                rows.filter(count__lte=0).delete()
+                continue
+            # The locking read sees the row a concurrent transaction created, whatever the isolation level:
+            # get_or_create reads it again once when its creation fails, and raises the error otherwise
+            row, created = rows.select_for_update().get_or_create(defaults={'count': count}, **lookup)
+            if not created:
+                rows.filter(pk=row.pk).update(count=F('count') + count)
+
+
+def rebuild():
+    """
+    Rebuilds the whole rollup from the incidents
+    """
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    keys = Counter()
+    pks = list(Incident.objects.values_list('pk', flat=True))
+    for i in range(0, len(pks), BATCH_SIZE):
+        keys.update(get_keys(pks[i:i + BATCH_SIZE]))
+    keys = list(keys.items())
+    with transaction.atomic():
+        IncidentRollup.objects.all().delete()
+        for i in range(0, len(keys), BATCH_SIZE):
+            IncidentRollup.objects.bulk_create([
+                IncidentRollup(count=count, **dict(zip(KEY_FIELDS, key))) for key, count in keys[i:i + BATCH_SIZE]])
+
+
+def schedule_rebuild():
+    """
+    Rebuilds the rollup once the current transaction is committed (e.g. after business lines changes)
+    """
+    connection = transaction.get_connection()
+    if any(function is rebuild for savepoints, function in connection.run_on_commit):
+        return
+    transaction.on_commit(rebuild)
+
+
+def covers(user, permission, business_line=None):
+    """
+    Tells if the rollup counts are exactly what ``user`` is allowed to see
+
+    Global counts need a global ``permission``, root business line counts need the
+    permission on the whole root business line (and no incident owner permission).
+    Other business lines are not covered.
+    """
+    if not is_enabled():
+        return False
+    if business_line is not None and not business_line.is_root():
+        return False
+    if user.is_superuser or user.has_perms([permission]):
+        return True
+    if business_line is None or aggregation.owner_grants(permission):
+        return False
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    return business_line.path in BusinessLine.get_authorization_paths(user, [permission])
+
+
+def rows(business_line=None):
+    """
+    Returns the rollup rows counting each incident once, globally or for a root business line
+
+    The rows of a root business line count the incidents matching its ``aggregation.business_line_filter``.
+    """
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    if business_line is None:
+        return IncidentRollup.objects.filter(root_business_line_id=NONE, business_line_id=NONE)
+    return IncidentRollup.objects.filter(root_business_line_id=NONE, business_line=business_line)
+
+
+def root_rows(business_line=None):
+    """
+    Returns the rollup rows counting each incident once per root business line (or for ``business_line``)
+
+    The rows of a root business line count the incidents concerning any business line of its tree.
+    """
+    Incident, BusinessLine, IncidentRollup = _get_models()
+    if business_line is not None:
+        return IncidentRollup.objects.filter(root_business_line=business_line, business_line_id=NONE)
+    return IncidentRollup.objects.filter(business_line_id=NONE).exclude(root_business_line_id=NONE)
+
+
+class MonthlyCounts(aggregation.MonthlyCounts):
+    """
+    Monthly counts read from rollup rows, with None values for ``NONE``
+    """
+    field = 'month'
+
+    def get_rows(self, rollup_rows, months, fields):
+        for row in rollup_rows.filter(windows.month_filter(months, field=self.field)).order_by().values(
+                *fields).annotate(count=Sum('count')):
+            for field in NONE_DIMENSIONS:
+                if row.get(field) == NONE:
+                    row[field] = None
+            yield row
@@ -0,0 +1,223 @@
+"""
+Statistics snapshots
+
+ The standard statistics (yearly page, quarterly pages of the top business lines of the scope,
+ major incidents tables) are precomputed for each distinct authorization scope and stored in
+ ``StatisticsSnapshot`` rows. Views serve them, with the time they were computed at, and compute
+ the data live when there is no snapshot for the request.
+
+ Snapshots are only used and refreshed when ``STATISTICS_SNAPSHOTS`` is True. They are refreshed
+ every ``STATISTICS_SNAPSHOTS_INTERVAL`` seconds by celery beat (with the ``fir_celery`` plugin),
+ ``STATISTICS_SNAPSHOTS_DELAY`` seconds after a burst of incident writes, or with
+ './manage.py refresh_statistics_snapshots'.
+
+"""
+import datetime
+import hashlib
+from functools import wraps
+from json import dumps
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import resolve, reverse
+from django.db import transaction
+from django.db.models import Min
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.http import urlencode
+
+from incidents.statistics import cache as statistics_cache
+
+PERMISSION = 'incidents.view_statistics'
+
+REFRESH_KEY = 'fir:statistics:snapshots:refresh'
+
+# Charts of the yearly page
+YEARLY_CHARTS = [
+    ('stats:data_yearly_incidents', ()),
+    ('stats:data_yearly_bl', ()),
+    ('stats:data_yearly_bl_detection', ()),
+    ('stats:data_yearly_bl_severity', ()),
+    ('stats:data_yearly_bl_category', ()),
+    ('stats:data_field_distribution', ('category',)),
+    ('stats:data_field_distribution', ('severity',)),
+]
+
+# Charts of the quarterly page of a business line
+QUARTERLY_DIVISORS = ['incidents', 'severity', 'entity', 'category', 'actor', 'monitoring', 'open', 'blocked']
+
+# Batch charts of the yearly page, and of the quarterly page of a business line
+YEARLY_BATCH = ['yearly_incidents', 'distribution_category', 'distribution_severity', 'yearly_bl', 'yearly_bl_detection',
+                'yearly_bl_severity', 'yearly_bl_category']
+QUARTERLY_BATCH = ['quarterly_variation'] + ['quarterly_' + divisor for divisor in QUARTERLY_DIVISORS]
+
+
+def is_enabled():
+    return getattr(settings, 'STATISTICS_SNAPSHOTS', False)
+
+
+def get_scope_key(paths, owner):
+    return hashlib.sha1(repr((None if paths is None else list(paths), owner))).hexdigest()
+
+
+def get_key(scope_key, name, params=()):
+    fingerprint = hashlib.sha1()
+    for part in (scope_key, name, sorted(params), datetime.date.today()):
+        fingerprint.update(repr(part))
+    return fingerprint.hexdigest()
+
+
+def get(user, name, params=(), permission=PERMISSION):
+    """
+    Returns today's snapshot of ``name`` (with ``params``) for the scope of ``user``, None if there is none
+    """
+    StatisticsSnapshot = apps.get_model('incidents', 'StatisticsSnapshot')
+    if not is_enabled():
+        return None
+    scope_key = get_scope_key(*statistics_cache.get_scope(user, permission))
+    return StatisticsSnapshot.objects.filter(key=get_key(scope_key, name, params)).first()
+
+
+def computed_at(user, permission=PERMISSION):
+    """
+    Returns when the oldest of today's snapshots of the scope of ``user`` was computed, None if there is none
+
+    The snapshots of the previous days are not served anymore (their keys hold the date they were computed on).
+    """
+    StatisticsSnapshot = apps.get_model('incidents', 'StatisticsSnapshot')
+    if not is_enabled():
+        return None
+    scope_key = get_scope_key(*statistics_cache.get_scope(user, permission))
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    return StatisticsSnapshot.objects.filter(scope=scope_key, computed_at__gte=today).aggregate(
+        computed_at=Min('computed_at'))['computed_at']
+
+
+def snapshot_response(permission=PERMISSION):
+    """
+    Serves the GET requests of a statistics view from the snapshot of the scope of the user, if any
+
+    The snapshot time is sent in the ``X-Statistics-Computed-At`` header.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or getattr(request, 'refreshing_snapshots', False):
+                return view(request, *args, **kwargs)
+            snapshot = get(request.user, request.path, request.GET.lists(), permission=permission)
+            if snapshot is None:
+                return view(request, *args, **kwargs)
+            response = HttpResponse(snapshot.content, content_type=snapshot.content_type)
+            response['X-Statistics-Computed-At'] = snapshot.computed_at.isoformat()
+            return response
+        return wrapper
+    return decorator
+
+
+def get_batch_path(charts, business_line=None):
+    """
+    Returns the path of the batch request of ``charts`` (of ``business_line``)
+    """
+    params = [('chart', chart) for chart in charts]
+    if business_line is not None:
+        params.append(('business_line', business_line.name))
+    return '{}?{}'.format(reverse('stats:data_batch'), urlencode(params))
+
+
+def get_scopes(permission=PERMISSION):
+    """
+    Returns the distinct scopes of the active users granted ``permission``, with one of their users
+    """
+    Incident = apps.get_model('incidents', 'Incident')
+    scopes = {}
+    for user in User.objects.filter(is_active=True).order_by('pk'):
+        if not user.has_perm(permission, obj=Incident):
+            continue
+        paths, owner = statistics_cache.get_scope(user, permission)
+        scope = (None if paths is None else tuple(paths), owner)
+        if scope not in scopes:
+            scopes[scope] = user
+    return scopes
+
+
+def get_requests(user, permission=PERMISSION):
+    """
+    Returns the paths (with their query) of the standard statistics data of the scope of ``user``
+    """
+    BusinessLine = apps.get_model('incidents', 'BusinessLine')
+    paths = [reverse(name, args=args) for name, args in YEARLY_CHARTS]
+    paths.append(get_batch_path(YEARLY_BATCH))
+    for business_line in BusinessLine.objects.filter(
+            path__in=BusinessLine.minimize_paths(BusinessLine.get_authorization_paths(user, [permission]))):
+        paths.append(get_batch_path(QUARTERLY_BATCH, business_line))
+        paths.append(reverse('stats:data_incident_variation', args=[business_line.name]))
+        for divisor in QUARTERLY_DIVISORS:
+            paths.append(reverse('stats:data_quarterly_bl', args=[business_line.name, divisor]))
+    return paths
+
+
+def get_request(factory, path, user):
+    """
+    Returns the GET request of ``path`` computing a snapshot for ``user``
+
+    The request does not go through the middlewares: ``is_verified`` is set on the user, as ``OTPMiddleware``
+    would for a verified session, for the two-factor authentication check of ``fir_auth_required``.
+    """
+    request = factory.get(path)
+    request.user = user
+    request.user.is_verified = lambda: True
+    request.refreshing_snapshots = True
+    return request
+
+
+def refresh(permission=PERMISSION):
+    """
+    Recomputes the snapshots of all the scopes and drops the previous ones
+    """
+    from incidents.views import quarterly_major_months, quarterly_major_tables
+
+    StatisticsSnapshot = apps.get_model('incidents', 'StatisticsSnapshot')
+    if not is_enabled():
+        return
+    start = datetime.datetime.now()
+    factory = RequestFactory()
+    for (paths, owner), user in get_scopes(permission).items():
+        scope_key = get_scope_key(paths, owner)
+        for path in get_requests(user, permission):
+            request = get_request(factory, path, user)
+            match = resolve(request.path)
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.status_code != 200 or response.streaming:
+                continue
+            save(scope_key, request.path, response.content.decode('utf-8'), response['Content-Type'],
+                 params=request.GET.lists())
+        months = quarterly_major_months()
+        save(scope_key, 'quarterly_major', dumps(quarterly_major_tables(user, months)), 'application/json',
+             params=[('months', months)])
+    StatisticsSnapshot.objects.filter(computed_at__lt=start).delete()
+
+
+def save(scope_key, name, content, content_type, params=()):
+    StatisticsSnapshot = apps.get_model('incidents', 'StatisticsSnapshot')
+    StatisticsSnapshot.objects.update_or_create(
+        key=get_key(scope_key, name, params),
+        defaults={'scope': scope_key, 'name': name, 'content': content, 'content_type': content_type,
+                  'computed_at': datetime.datetime.now()})
+
+
+def schedule_refresh():
+    """
+    Refreshes the snapshots ``STATISTICS_SNAPSHOTS_DELAY`` seconds after the first of a burst of incident writes
+
+    Needs the ``fir_celery`` plugin and a cache shared by the FIR processes to group the writes.
+    """
+    if not is_enabled() or not apps.is_installed('fir_celery'):
+        return
+    delay = getattr(settings, 'STATISTICS_SNAPSHOTS_DELAY', 60)
+    if not cache.add(REFRESH_KEY, True, delay):
+        return
+    from incidents.tasks import refresh_statistics_snapshots
+
+    transaction.on_commit(lambda: refresh_statistics_snapshots.apply_async(countdown=delay))
@@ -0,0 +1,656 @@
+import csv
+import datetime
+from StringIO import StringIO
+from json import dumps, loads
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User, Group, Permission
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
+from django.test import RequestFactory, TestCase, override_settings
+
+from incidents import models
+from incidents.views import cal, quarterly_major_months, quarterly_major_tables, sandbox_table_rows, \
+    stats_attributes_date_ranges, stream_csv
+from incidents.statistics import aggregation, benchmark, buckets, rollup, windows
+from incidents.statistics import cache as statistics_cache
+from incidents.statistics import snapshots as statistics_snapshots
+
+
+class StatisticsTestCase(TestCase):
+    fixtures = ['incidents/fixtures/seed_data.json', ]
+
+    def setUp(self):
+        self.root = models.BusinessLine.add_root(name='Root')
+        self.child1 = self.root.add_child(name='Child 1')
+        self.child2 = self.root.add_child(name='Child 2')
+        self.other = models.BusinessLine.add_root(name='Other')
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.user = User.objects.create_user('user', 'user@example.com', 'user')
+        for user in (self.admin, self.user):
+            models.Profile.objects.create(user=user)
+        role = Group.objects.create(name='Statistics')
+        role.permissions.add(*Permission.objects.filter(codename__in=['view_statistics', 'view_incidents']))
+        models.AccessControlEntry.objects.create(user=self.user, business_line=self.root, role=role)
+
+        self.categories = list(models.IncidentCategory.objects.all()[:2])
+        detection = models.Label.objects.filter(group__name='detection').first()
+        self.actors = list(models.Label.objects.filter(group__name='actor'))
+        plans = list(models.Label.objects.filter(group__name='plan'))
+        self.end = datetime.datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - relativedelta(months=14)
+        business_lines = [self.child1, self.child2, self.other]
+        for n in range(60):
+            incident = models.Incident.objects.create(
+                subject='Incident {}'.format(n), description='Test', category=self.categories[n % 2],
+                detection=detection, severity=n % 4 + 1, is_incident=n % 3 == 0, status='OBC'[n % 3],
+                actor=self.actors[n % len(self.actors)], plan=plans[n % len(plans)], opened_by=self.admin,
+                date=self.end - relativedelta(months=n % 27) + datetime.timedelta(days=n % 20, hours=n))
+            incident.concerned_business_lines = business_lines[n % 3:n % 3 + 1 + n % 2]
+
+    def sandbox(self, user, graph_type, divisor, **params):
+        self.client.force_login(user)
+        query = {'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+                 'detection': '', 'severity': '', 'severity_comparator': 'eq', 'graph_type': graph_type,
+                 'divisor': divisor}
+        query.update(params)
+        response = self.client.get('/stats/data/sandbox/', query)
+        self.assertEqual(response.status_code, 200)
+        return loads(response.content)
+
+    def count(self, user, year, month, **lookups):
+        return models.Incident.authorization.for_user(user, 'incidents.view_statistics').filter(
+            date__year=year, date__month=month, **lookups).distinct().count()
+
+    def months(self):
+        return windows.months_before(self.end, 14)
+
+    def test_month_filter(self):
+        filtered = models.Incident.objects.filter(windows.month_filter(self.months()))
+        for incident in models.Incident.objects.all():
+            self.assertEqual(incident in filtered, (incident.date.year, incident.date.month) in self.months())
+        self.assertFalse(models.Incident.objects.filter(windows.month_filter([])).exists())
+
+    def test_windows(self):
+        self.assertEqual(windows.months_before(datetime.date(2017, 3, 31), 4),
+                         [(2017, 2), (2017, 1), (2016, 12), (2016, 11)])
+        self.assertEqual(windows.months_before(datetime.date(2017, 3, 31), 2, offset=0), [(2017, 3), (2017, 2)])
+        self.assertEqual(windows.year_months('2017')[-1], (2017, 12))
+        self.assertEqual(windows.quarter_months(2017, 4), [(2017, 10), (2017, 11), (2017, 12)])
+        self.assertEqual(windows.shift_years([(2017, 1)], -1), [(2016, 1)])
+
+        # Contiguous months are merged in a single half-open range
+        lookup = windows.month_filter([(2016, 12), (2017, 1), (2017, 3)])
+        self.assertEqual(str(lookup), str(
+            windows.range_filter(datetime.datetime(2016, 12, 1), datetime.datetime(2017, 2, 1)) |
+            windows.range_filter(datetime.datetime(2017, 3, 1), datetime.datetime(2017, 4, 1))))
+        sql = str(models.Incident.objects.filter(lookup).query).lower()
+        self.assertNotIn('extract', sql)
+        self.assertNotIn('strftime', sql)
+
+    def test_monthly_counts(self):
+        for user in (self.admin, self.user):
+            incidents = aggregation.authorized_incidents(user, 'incidents.view_statistics')
+            with self.assertNumQueries(1):
+                counts = aggregation.MonthlyCounts(incidents, self.months(), dimension='concerned_business_lines')
+            for year, month in self.months():
+                for business_line in (self.child1, self.child2, self.other):
+                    self.assertEqual(counts.get((year, month), business_line.pk),
+                                     self.count(user, year, month, concerned_business_lines=business_line))
+
+    def test_root_monthly_counts(self):
+        roots = [self.root, self.other]
+        with self.assertNumQueries(1):
+            counts = aggregation.root_monthly_counts(self.admin, 'incidents.view_statistics', roots, self.months(),
+                                                     dimension='severity')
+        user_counts = aggregation.root_monthly_counts(self.user, 'incidents.view_statistics', [self.root],
+                                                      self.months(), dimension='severity')
+        for year, month in self.months():
+            for severity in range(1, 5):
+                for root in roots:
+                    expected = root.get_incident_count(Q(date__year=year, date__month=month, severity=severity))
+                    self.assertEqual(counts.get((year, month), root.pk, severity), expected)
+                    if root == self.root:
+                        self.assertEqual(user_counts.get((year, month), root.pk, severity), expected)
+
+    def test_sandbox(self):
+        for user in (self.admin, self.user):
+            data = self.sandbox(user, 'line', 'all')
+            self.assertEqual(len(data), 14)
+            for plot, (year, month) in zip(data, self.months()):
+                self.assertEqual(plot['date'], '{}-{}'.format(year, month))
+                self.assertEqual(plot['N'], self.count(user, year, month))
+                self.assertEqual(plot['N-1'], self.count(user, year - 1, month))
+
+            data = self.sandbox(user, 'stacked', 'category', is_incident='1')
+            for plot, (year, month) in zip(data, self.months()):
+                for category in self.categories:
+                    self.assertEqual(plot[category.name],
+                                     self.count(user, year, month, category=category, is_incident=True))
+
+            data = self.sandbox(user, 'bar', 'open')
+            for plot, (year, month) in zip(data, self.months()):
+                self.assertEqual(plot['value'], self.count(user, year, month, status='O'))
+
+            data = self.sandbox(user, 'stacked', 'subentity', concerned_business_lines=self.root.pk)
+            for plot, (year, month) in zip(data, self.months()):
+                for child in (self.child1, self.child2):
+                    self.assertEqual(plot[child.name],
+                                     self.count(user, year, month, concerned_business_lines=child))
+
+    def test_attributes_table(self):
+        accounts = models.ValidAttribute.objects.create(name='Accounts')
+        hosts = models.ValidAttribute.objects.create(name='Hosts')
+        incidents = list(models.Incident.objects.filter(date__gte=self.start, date__lte=self.end).order_by('pk'))
+        for n, incident in enumerate(incidents[:6]):
+            models.Attribute.objects.create(incident=incident, name='Accounts', value=str(n))
+            models.Attribute.objects.create(incident=incident, name='Accounts', value=str(n + 10))
+        models.Attribute.objects.create(incident=incidents[6], name='Hosts', value='host')
+
+        self.client.force_login(self.admin)
+        query = {'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+                 'detection': '', 'severity': '', 'severity_comparator': 'eq', 'bars': hosts.pk,
+                 'attribute_selection': [accounts.pk]}
+        with self.assertNumQueries(7):
+            response = self.client.get('/stats/data/attributes/table/', query)
+            rows = loads(''.join(response.streaming_content))
+        expected = models.Incident.objects.filter(date__range=(self.start, self.end)).order_by('-date')
+        self.assertEqual([row['subject'] for row in rows], [incident.subject for incident in expected])
+        for row in rows:
+            incident = expected.get(subject=row['subject'])
+            self.assertEqual(row['business_lines_names'], incident.get_business_lines_names())
+            if incident in incidents[:6]:
+                n = incidents.index(incident)
+                self.assertEqual(row['attributes'], {'Accounts': '{}, {}'.format(n, n + 10), 'Hosts': ''})
+            elif incident == incidents[6]:
+                self.assertEqual(row['attributes'], {'Accounts': '', 'Hosts': 'host'})
+            else:
+                self.assertEqual(row['attributes'], {'Accounts': '', 'Hosts': ''})
+
+        query['only_with_attribute'] = '1'
+        response = self.client.get('/stats/data/attributes/table/', query)
+        rows = loads(''.join(response.streaming_content))
+        self.assertEqual(sorted(row['subject'] for row in rows),
+                         sorted(incident.subject for incident in incidents[:7]))
+
+    def test_time_buckets(self):
+        names = ['Accounts', 'Hosts']
+        incident_rows = list(models.Incident.objects.values_list('pk', 'date'))
+        attribute_rows = [(pk, names[pk % 3 % 2], str(pk)) for pk, date in incident_rows if pk % 3]
+        attribute_rows.append((incident_rows[0][0], 'Other', '1'))
+        for ranges in (stats_attributes_date_ranges(self.start, self.end),
+                       stats_attributes_date_ranges(self.end - datetime.timedelta(days=2), self.end),
+                       benchmark.generate_ranges(self.start, 100, step=datetime.timedelta(days=3))):
+            self.assertEqual(benchmark.bucket(ranges, incident_rows, attribute_rows, names),
+                             benchmark.scan(ranges, incident_rows, attribute_rows, names))
+
+    def test_attribute_statistics(self):
+        incident_rows = list(models.Incident.objects.values_list('pk', 'date'))
+        attribute_rows = [(pk, 'Accounts', str(pk * n % 17)) for pk, date in incident_rows for n in range(pk % 4)]
+        ranges = stats_attributes_date_ranges(self.start, self.end)
+        time_buckets = buckets.TimeBuckets(ranges, ['Accounts'])
+        time_buckets.add_incidents(incident_rows)
+        time_buckets.add_attributes(attribute_rows)
+
+        statistics = time_buckets.get_statistics('Accounts')
+        for i, values in enumerate(attributes['Accounts'] for attributes in time_buckets.attributes):
+            values = [int(value) for value in values]
+            self.assertEqual(statistics['count'][i], len(values))
+            self.assertEqual(statistics['total'][i], sum(values))
+            mean = float(sum(values)) / len(values) if len(values) else 0
+            deviation = (sum((value - mean) ** 2 for value in values) / len(values)) ** 0.5 if len(values) else 0
+            self.assertAlmostEqual(statistics['std'][i], deviation)
+
+        # The pure Python fallback gives the same results
+        numpy, buckets.numpy = buckets.numpy, None
+        try:
+            fallback = time_buckets.get_statistics('Accounts')
+        finally:
+            buckets.numpy = numpy
+        self.assertEqual(fallback['count'], statistics['count'])
+        self.assertEqual(fallback['total'], statistics['total'])
+        for expected, value in zip(statistics['std'], fallback['std']):
+            self.assertAlmostEqual(expected, value)
+
+    def test_distribution(self):
+        for user in (self.admin, self.user):
+            self.client.force_login(user)
+            for field in ('category', 'severity', 'plan', 'status'):
+                response = self.client.get('/stats/data/distribution/{}'.format(field), {
+                    'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+                    'type': 'incidents'})
+                self.assertEqual(response.status_code, 200)
+                expected = {}
+                for incident in models.Incident.authorization.for_user(user, 'incidents.view_statistics').filter(
+                        date__gte=self.start, date__lt=self.end, is_incident=True).distinct():
+                    label = unicode(getattr(incident, field)) + ('/4' if field == 'severity' else '')
+                    expected[label] = expected.get(label, 0) + 1
+                self.assertEqual(dict((item['label'], item['value']) for item in loads(response.content)), expected)
+        self.assertEqual(self.client.get('/stats/data/distribution/subject').status_code, 404)
+
+    def test_batch(self):
+        urls = {
+            'yearly_incidents': '/stats/data/yearly/incidents',
+            'yearly_bl': '/stats/data/yearly/bl',
+            'yearly_bl_detection': '/stats/data/yearly/bl/detection',
+            'yearly_bl_severity': '/stats/data/yearly/bl/severity',
+            'yearly_bl_category': '/stats/data/yearly/bl/category',
+            'yearly_bl_plan': '/stats/data/yearly/bl/plan',
+            'distribution_category': '/stats/data/distribution/category',
+            'distribution_severity': '/stats/data/distribution/severity',
+            'distribution_status': '/stats/data/distribution/status',
+            'quarterly_variation': '/stats/data/quarterly/{}/variation'.format(self.root.name),
+        }
+        for divisor in statistics_snapshots.QUARTERLY_DIVISORS:
+            urls['quarterly_' + divisor] = '/stats/data/quarterly/{}/{}'.format(self.root.name, divisor)
+        windows_params = [{}, {'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+                               'type': 'incidents'},
+                          {'from_date': '2017-01-15', 'to_date': self.end.strftime('%Y-%m-%d')},
+                          {'num_months': '1'}, {'num_months': '6'}]
+        for user in (self.admin, self.user):
+            self.client.force_login(user)
+            for params in windows_params:
+                query = dict(params, chart=sorted(urls), business_line=self.root.name)
+                response = self.client.get('/stats/data/batch', query)
+                self.assertEqual(response.status_code, 200)
+                charts = loads(response.content)
+                self.assertEqual(sorted(charts), sorted(urls))
+                for chart, url in urls.items():
+                    expected = loads(self.client.get(url, params).content)
+                    if chart.startswith('distribution_'):
+                        charts[chart].sort(key=lambda item: item['label'])
+                        expected.sort(key=lambda item: item['label'])
+                    self.assertEqual(charts[chart], expected, chart)
+        self.assertEqual(self.client.get('/stats/data/batch', {'chart': 'yearly_bl_subject'}).status_code, 404)
+        self.assertEqual(self.client.get('/stats/data/batch', {'chart': 'quarterly_severity', 'num_months': '0',
+                                                               'business_line': self.root.name}).status_code, 404)
+        self.assertEqual(self.client.get('/stats/data/batch', {'chart': 'quarterly_severity',
+                                                               'business_line': self.other.name}).status_code, 404)
+
+    def test_pages(self):
+        self.client.force_login(self.admin)
+        for url, charts in (('/stats/yearly', statistics_snapshots.YEARLY_BATCH),
+                            ('/stats/quarterly/{}'.format(self.root.name), statistics_snapshots.QUARTERLY_BATCH)):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTemplateUsed(response, 'base.html')
+            self.assertContains(response, 'd3.json(', count=1)
+            for chart in charts:
+                self.assertContains(response, 'charts.{}'.format(chart))
+
+    def test_quarterly_entity(self):
+        grandchild = self.child2.add_child(name='Grandchild')
+        for incident in models.Incident.objects.filter(concerned_business_lines=self.child1)[:5]:
+            incident.concerned_business_lines.add(grandchild)
+        months = list(reversed(windows.months_before(datetime.datetime.today(), 3)))
+        for user in (self.admin, self.user):
+            self.client.force_login(user)
+            with self.assertNumQueries(1):
+                counts = aggregation.conditional_counts(
+                    models.Incident.objects.filter(aggregation.business_line_filter(self.root)), months,
+                    [(self.root.pk, None)] + [(child.pk, child.get_incidents_filter())
+                                              for child in (self.child1, self.child2)])
+            response = self.client.get('/stats/data/quarterly/{}/entity'.format(self.root.name))
+            chart = dict((item['entry'], item) for item in loads(response.content))
+            for month in months:
+                q = aggregation.business_line_filter(self.root) & windows.month_filter([month])
+                for child in (self.child1, self.child2):
+                    self.assertEqual(counts.get(month, child.pk), child.get_incident_count(q))
+                self.assertEqual(counts.get(month, self.root.pk), models.Incident.objects.filter(q).distinct().count())
+                expected = models.Incident.authorization.for_user(user, 'incidents.view_statistics').filter(
+                    q, confidentiality__lte=2).distinct().count()
+                for child in (self.child1, self.child2):
+                    count = child.get_incident_count(q & Q(confidentiality__lte=2))
+                    self.assertEqual(chart[cal[month[1] - 1]].get(child.name, 0), count)
+                    expected -= count
+                self.assertEqual(chart[cal[month[1] - 1]].get(self.root.name, 0), expected)
+
+    def test_sandbox_export(self):
+        actions = list(models.Label.objects.filter(group__name='action')[:2])
+        # The first incident of the window has no comment
+        incidents = list(models.Incident.objects.filter(date__gte=self.start, date__lt=self.end).order_by('pk'))
+        incidents[0].comments_set.all().delete()
+        for n, incident in enumerate(incidents[1:]):
+            for i in range(n % 3 + 1):
+                models.Comments.objects.create(incident=incident, comment='Test', action=actions[i % 2],
+                                               opened_by=self.admin, date=incident.date + datetime.timedelta(days=i))
+
+        table = self.sandbox(self.admin, 'table', 'all')
+        self.assertEqual(len(table), len(set(row['id'] for row in table)))
+        for row in table:
+            incident = models.Incident.objects.get(pk=row['id'])
+            if incident == incidents[0]:
+                self.assertEqual((row['last_comment_action'], row['last_comment_date']), ('', ''))
+            else:
+                last_comment = incident.get_last_comment()
+                self.assertEqual(row['last_comment_action'], last_comment.action.name)
+                self.assertEqual(row['last_comment_date'], str(last_comment.date))
+            self.assertEqual(row['business_lines_names'], incident.get_business_lines_names())
+
+        # Streamed exports hold the same rows, with a number of queries independent of the number of incidents
+        with self.assertNumQueries(6):
+            response = self.client.get('/stats/data/sandbox/', {
+                'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+                'detection': '', 'severity': '', 'severity_comparator': 'eq', 'graph_type': 'table', 'divisor': 'all',
+                'format': 'ndjson'})
+            lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual([loads(line) for line in lines], table)
+
+        response = self.client.get('/stats/data/sandbox/', {
+            'from_date': self.start.strftime('%Y-%m-%d'), 'to_date': self.end.strftime('%Y-%m-%d'),
+            'detection': '', 'severity': '', 'severity_comparator': 'eq', 'graph_type': 'table', 'divisor': 'all',
+            'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(''.join(response.streaming_content))))
+        self.assertEqual([row['id'] for row in rows], [str(row['id']) for row in table])
+        self.assertEqual([row['subject'] for row in rows], [row['subject'] for row in table])
+
+        # Non-ASCII labels and usernames are encoded, the incidents deleted during the export are skipped
+        models.Label.objects.filter(pk=incidents[1].detection_id).update(name=u'D\xe9tection interne')
+        self.admin.username = u'admin\xe9'
+        self.admin.save()
+        ids = [incident.pk for incident in incidents[:3]]
+        incidents[2].delete()
+        rows = list(csv.DictReader(StringIO(''.join(stream_csv(['id', 'detection', 'opened_by'],
+                                                               sandbox_table_rows(ids))))))
+        self.assertEqual([(row['id'], row['detection'].decode('utf-8'), row['opened_by'].decode('utf-8'))
+                          for row in rows],
+                         [(str(pk), u'D\xe9tection interne', u'admin\xe9') for pk in ids[:2]])
+
+    def test_quarterly_major(self):
+        for incident in models.Incident.objects.all():
+            incident.refresh_main_business_lines()
+            incident.is_major = incident.severity >= 3
+            incident.save()
+        months = list(reversed(self.months()[:3]))
+        labels = [datetime.date(year, month, 1).strftime('%b').lower() for year, month in months]
+
+        def line(label, lookups, total=True):
+            counts = [self.count(user, year, month, is_major=True, confidentiality__lte=2, **lookups)
+                      for year, month in months]
+            if not any(counts):
+                return []
+            return [[label] + counts + ([sum(counts)] if total else [])]
+
+        def unicode_cells(table):
+            return [[cell() if callable(cell) else cell for cell in row] for row in table]
+
+        for user in (self.admin, self.user):
+            self.client.force_login(user)
+            response = self.client.get('/stats/quarterly/major/{}'.format(self.end.strftime('%Y-%m-%d')))
+            self.assertEqual(response.status_code, 200)
+
+            cert = [['Category'] + labels + ['Total']]
+            for category in models.IncidentCategory.objects.all():
+                cert += line(category.name, {'category': category})
+            self.assertEqual(response.context['cert'], cert)
+
+            bale = [['Bale category'] + labels]
+            for bale_category in models.BaleCategory.objects.filter(parent_category__isnull=False):
+                bale += line(unicode(bale_category), {'category__bale_subcategory': bale_category}, total=False)
+            self.assertEqual(unicode_cells(response.context['bale']), bale)
+
+            bls = [['Business Line'] + labels + ['Total']]
+            for business_line in models.BusinessLine.get_root_nodes():
+                bls += line(unicode(business_line), {'main_business_lines': business_line})
+            self.assertEqual(unicode_cells(response.context['bls']), bls)
+
+            self.assertEqual(response.context['total_major'],
+                             sum(self.count(user, year, month, confidentiality__lte=2) for year, month in months))
+
+
+@override_settings(STATISTICS_ROLLUP=True)
+class RollupTestCase(StatisticsTestCase):
+
+    def snapshot(self):
+        return sorted(models.IncidentRollup.objects.values_list(*rollup.KEY_FIELDS + ('count',)))
+
+    def assertRollupConsistent(self):
+        incremental = self.snapshot()
+        rollup.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertFalse(models.IncidentRollup.objects.filter(count__lte=0).exists())
+
+    def test_incremental(self):
+        self.assertRollupConsistent()
+        self.assertEqual(rollup.rows().aggregate(total=Sum('count'))['total'], models.Incident.objects.count())
+
+        incident, other = models.Incident.objects.order_by('pk')[:2]
+        incident.severity = 4
+        incident.status = 'C'
+        incident.date -= relativedelta(months=1)
+        incident.save()
+        self.assertRollupConsistent()
+
+        incident.concerned_business_lines.add(self.other)
+        incident.concerned_business_lines.remove(self.child1)
+        self.assertRollupConsistent()
+
+        self.other.incident_set.add(other)
+        self.child2.incident_set.clear()
+        incident.concerned_business_lines.clear()
+        self.assertRollupConsistent()
+
+        incident.delete()
+        self.assertRollupConsistent()
+
+    def test_unique_keys(self):
+        incident = models.Incident.objects.order_by('pk').first()
+        incident.actor = incident.plan = None
+        incident.save()
+        self.assertRollupConsistent()
+
+        # The rows without business line, actor or plan are unique too
+        for row in (rollup.rows().filter(actor=rollup.NONE).first(), rollup.root_rows().first(),
+                    rollup.rows(self.root).first(), models.IncidentRollup.objects.exclude(business_line=rollup.NONE)[0]):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                models.IncidentRollup.objects.create(
+                    count=1, **dict((field, getattr(row, field)) for field in rollup.KEY_FIELDS))
+
+        row = rollup.rows().filter(actor=rollup.NONE).first()
+        key = tuple(getattr(row, field) for field in rollup.KEY_FIELDS)
+        rollup.apply({key: 2})
+        self.assertEqual(models.IncidentRollup.objects.get(pk=row.pk).count, row.count + 2)
+        rollup.apply({}, {key: row.count + 2})
+        self.assertFalse(models.IncidentRollup.objects.filter(pk=row.pk).exists())
+        rollup.apply({key: 1})
+        self.assertEqual(models.IncidentRollup.objects.filter(**dict(zip(rollup.KEY_FIELDS, key))).get().count, 1)
+
+        # The counts of the incidents without actor or plan are read as None values
+        rollup.rebuild()
+        months = windows.months_between(self.end - relativedelta(months=27), self.end + relativedelta(months=1))
+        for dimension in ('actor', ('category', 'plan')):
+            with self.settings(STATISTICS_ROLLUP=False):
+                expected = aggregation.monthly_counts(self.admin, 'incidents.view_statistics', months,
+                                                      dimension=dimension)
+            counts = aggregation.monthly_counts(self.admin, 'incidents.view_statistics', months, dimension=dimension)
+            self.assertEqual(counts.counts, expected.counts)
+        start = windows.month_start(months[0])
+        for field in ('actor', 'plan'):
+            with self.settings(STATISTICS_ROLLUP=False):
+                expected = aggregation.distribution(self.admin, 'incidents.view_statistics', field, start, self.end)
+            self.assertEqual(aggregation.distribution(self.admin, 'incidents.view_statistics', field, start, self.end),
+                             expected)
+
+    def test_business_line_filter(self):
+        grandchild = models.BusinessLine.objects.get(pk=self.child1.pk).add_child(name='Grandchild')
+        great_grandchild = grandchild.add_child(name='Great grandchild')
+        incidents = models.Incident.objects.order_by('pk')[:3]
+        for incident, business_line in zip(incidents, [grandchild, great_grandchild, grandchild]):
+            incident.concerned_business_lines = [business_line]
+        # Only the incidents with the root as main business line are counted for it
+        incidents[2].refresh_main_business_lines()
+        self.assertRollupConsistent()
+
+        months = windows.months_between(self.end - relativedelta(months=27), self.end + relativedelta(months=1))
+        for business_line in (self.root, self.other):
+            for dimension in (None, 'severity'):
+                with self.settings(STATISTICS_ROLLUP=False):
+                    expected = aggregation.monthly_counts(self.admin, 'incidents.view_statistics', months,
+                                                          dimension=dimension, business_line=business_line)
+                counts = aggregation.monthly_counts(self.admin, 'incidents.view_statistics', months,
+                                                    dimension=dimension, business_line=business_line)
+                self.assertEqual(counts.counts, expected.counts)
+
+        # The root business line subtrees are still counted whole
+        with self.settings(STATISTICS_ROLLUP=False):
+            expected = aggregation.root_monthly_counts(self.admin, 'incidents.view_statistics', [self.root], months)
+        counts = aggregation.root_monthly_counts(self.admin, 'incidents.view_statistics', [self.root], months)
+        self.assertEqual(counts.counts, expected.counts)
+
+    def test_covers(self):
+        self.assertTrue(rollup.covers(self.admin, 'incidents.view_statistics'))
+        self.assertTrue(rollup.covers(self.user, 'incidents.view_statistics', self.root))
+        self.assertFalse(rollup.covers(self.user, 'incidents.view_statistics'))
+        self.assertFalse(rollup.covers(self.user, 'incidents.view_statistics', self.other))
+        self.assertFalse(rollup.covers(self.admin, 'incidents.view_statistics', self.child1))
+        with self.settings(STATISTICS_ROLLUP=False):
+            self.assertFalse(rollup.covers(self.admin, 'incidents.view_statistics'))
+
+        # The incidents opened by the user are in their scope, wherever they are
+        meta = models.Incident._authorization_meta
+        owner_permission, meta.owner_permission = meta.owner_permission, 'incidents.view_statistics'
+        try:
+            self.assertFalse(rollup.covers(self.user, 'incidents.view_statistics', self.root))
+            self.assertTrue(rollup.covers(self.admin, 'incidents.view_statistics'))
+        finally:
+            meta.owner_permission = owner_permission
+
+    def test_views(self):
+        year = self.end.year
+        urls = ['/stats/data/yearly/incidents', '/stats/data/yearly/bl', '/stats/data/yearly/bl/severity',
+                '/stats/data/yearly/bl/{}/incidents'.format(year), '/stats/data/yearly/bl/detection',
+                '/stats/data/yearly/bl/category', '/stats/data/yearly/bl/plan',
+                '/stats/data/yearly/compare/{}/all'.format(year),
+                '/stats/data/yearly/compare/evolution/{}/incidents/bl'.format(year),
+                '/stats/data/yearly/compare/evolution/{}/all/category'.format(year),
+                '/stats/data/quarterly/Root/variation', '/stats/data/quarterly/Root/severity',
+                '/stats/data/quarterly/Root/category', '/stats/data/quarterly/Root/open',
+                '/stats/data/quarterly/Child 1/actor',
+                '/stats/quarterly/major/{}'.format(self.end.strftime('%Y-%m-%d'))]
+        for user in (self.admin, self.user):
+            self.client.force_login(user)
+            for url in urls:
+                with self.settings(STATISTICS_ROLLUP=False):
+                    expected = self.client.get(url)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content, url)
+
+
+@override_settings(STATISTICS_CACHE='statistics', CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'statistics': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'statistics'},
+})
+class CacheTestCase(StatisticsTestCase):
+    url = '/stats/data/yearly/bl'
+
+    def get(self, user):
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return loads(response.content)
+
+    def get_uncached(self, user):
+        with self.settings(STATISTICS_CACHE=None):
+            return self.get(user)
+
+    def test_scope(self):
+        self.assertEqual(statistics_cache.get_scope(self.admin, 'incidents.view_statistics'), (None, None))
+        self.assertEqual(statistics_cache.get_scope(self.user, 'incidents.view_statistics'), ([self.root.path], None))
+        meta = models.Incident._authorization_meta
+        owner_permission, meta.owner_permission = meta.owner_permission, 'incidents.view_statistics'
+        try:
+            self.assertEqual(statistics_cache.get_scope(self.user, 'incidents.view_statistics'),
+                             ([self.root.path], self.user.pk))
+        finally:
+            meta.owner_permission = owner_permission
+        self.assertNotEqual(self.get(self.admin), self.get(self.user))
+
+    def test_invalidation(self):
+        cached = dict((user, self.get(user)) for user in (self.admin, self.user))
+
+        # Bulk updates do not send signals: the responses are still cached
+        models.Incident.objects.filter(date__gte=self.end).update(confidentiality=3)
+        for user in (self.admin, self.user):
+            self.assertEqual(self.get(user), cached[user])
+            self.assertNotEqual(self.get_uncached(user), cached[user])
+
+        # A write outside of the user's root business line only invalidates the global scope
+        other = models.Incident.objects.filter(concerned_business_lines=self.other).exclude(
+            concerned_business_lines__in=[self.child1, self.child2]).first()
+        other.save()
+        self.assertEqual(self.get(self.admin), self.get_uncached(self.admin))
+        self.assertEqual(self.get(self.user), cached[self.user])
+
+        self.child2.incident_set.add(other)
+        self.assertEqual(self.get(self.user), self.get_uncached(self.user))
+
+
+@override_settings(STATISTICS_SNAPSHOTS=True)
+class SnapshotTestCase(StatisticsTestCase):
+
+    def get(self, user, url, **params):
+        self.client.force_login(user)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_refresh(self):
+        urls = ['/stats/data/yearly/bl/severity', '/stats/data/distribution/category',
+                '/stats/data/quarterly/{}/severity'.format(self.root.name)]
+        live = dict(((user, url), self.get(user, url).content) for user in (self.admin, self.user) for url in urls)
+        for response in (self.get(self.admin, urls[0]), self.get(self.user, '/stats/yearly')):
+            self.assertNotIn('X-Statistics-Computed-At', response)
+        self.assertIsNone(self.get(self.user, '/stats/yearly').context['computed_at'])
+
+        statistics_snapshots.refresh()
+        self.assertEqual(set(models.StatisticsSnapshot.objects.values_list('scope', flat=True)), set(
+            statistics_snapshots.get_scope_key(*statistics_cache.get_scope(user, 'incidents.view_statistics'))
+            for user in (self.admin, self.user)))
+
+        # Later writes are only seen once the snapshots are refreshed
+        models.Incident.objects.filter(concerned_business_lines=self.child1).update(severity=4)
+        for user in (self.admin, self.user):
+            for url in urls:
+                response = self.get(user, url)
+                self.assertIn('X-Statistics-Computed-At', response)
+                self.assertEqual(response.content, live[(user, url)])
+            self.assertIsNotNone(self.get(user, '/stats/yearly').context['computed_at'])
+
+        # Requests without snapshot are computed live
+        response = self.get(self.admin, urls[1], type='incidents')
+        self.assertNotIn('X-Statistics-Computed-At', response)
+
+        statistics_snapshots.refresh()
+        for user in (self.admin, self.user):
+            self.assertNotEqual(self.get(user, urls[0]).content, live[(user, urls[0])])
+
+        # The snapshots computed on the previous days are not reported
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        models.StatisticsSnapshot.objects.update(computed_at=yesterday)
+        self.assertIsNone(statistics_snapshots.computed_at(self.user))
+        statistics_snapshots.save(
+            statistics_snapshots.get_scope_key(*statistics_cache.get_scope(self.user, 'incidents.view_statistics')),
+            'quarterly_major', dumps({}), 'application/json')
+        self.assertGreater(statistics_snapshots.computed_at(self.user), yesterday)
+
+    def test_request(self):
+        # The snapshot requests pass the two-factor authentication check without the OTP middleware
+        request = statistics_snapshots.get_request(RequestFactory(), '/stats/data/yearly/bl', self.user)
+        self.assertTrue(request.user.is_verified())
+        self.assertTrue(request.refreshing_snapshots)
+
+    def test_quarterly_major_snapshot(self):
+        url = '/stats/quarterly/major/{}'.format(self.end.strftime('%Y-%m-%d'))
+        live = self.get(self.user, url).context
+        months = quarterly_major_months(self.end.strftime('%Y-%m-%d'))
+        statistics_snapshots.save(
+            statistics_snapshots.get_scope_key(*statistics_cache.get_scope(self.user, 'incidents.view_statistics')),
+            'quarterly_major', dumps(quarterly_major_tables(self.user, months)), 'application/json',
+            params=[('months', months)])
+        snapshot = self.get(self.user, url).context
+        self.assertIsNotNone(snapshot['computed_at'])
+        for table in ('cert', 'bale', 'bls', 'total_major'):
+            self.assertEqual(snapshot[table], live[table])
@@ -0,0 +1,89 @@
+"""
+Statistics date windows
+
+ Windows are lists of (year, month) tuples. They are filtered with half-open ``date__gte`` /
+ ``date__lt`` ranges, which can use an index on the date column, unlike ``date__year`` /
+ ``date__month`` lookups (EXTRACT on the column). Incidents are grouped per month with ``month_bucket``.
+
+"""
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Q
+from django.db.models.functions import TruncMonth
+
+
+def month_of(date):
+    return date.year, date.month
+
+
+def months_before(date, count, offset=1):
+    """
+    Returns the ``count`` months starting ``offset`` months before the month of ``date``, most recent first
+    """
+    return [month_of(date - relativedelta(months=offset + i)) for i in range(count)]
+
+
+def year_months(year):
+    return [(int(year), month) for month in range(1, 13)]
+
+
+def quarter_months(year, quarter):
+    return [(int(year), 3 * (int(quarter) - 1) + month) for month in range(1, 4)]
+
+
+def shift_years(months, years):
+    return [(year + years, month) for year, month in months]
+
+
+def month_start(month):
+    return datetime.datetime(month[0], month[1], 1)
+
+
+def is_month_start(date):
+    return date == month_start(month_of(date))
+
+
+def months_between(start, end):
+    """
+    Returns the months from the month of ``start`` to the last month starting before ``end``
+    """
+    months = []
+    month = month_of(start)
+    while month_start(month) < end:
+        months.append(month)
+        month = month_of(month_start(month) + relativedelta(months=1))
+    return months
+
+
+def range_filter(start, end, field='date'):
+    """
+    Returns a filter matching ``start`` <= ``field`` < ``end``
+    """
+    return Q(**{'{}__gte'.format(field): start, '{}__lt'.format(field): end})
+
+
+def month_filter(months, field='date'):
+    """
+    Returns a filter matching the (year, month) ``months``, contiguous months being merged in one range
+    """
+    runs = []
+    for month in sorted(set(months)):
+        start = month_start(month)
+        if len(runs) and runs[-1][1] == start:
+            runs[-1][1] = start + relativedelta(months=1)
+        else:
+            runs.append([start, start + relativedelta(months=1)])
+    if not len(runs):
+        return Q(pk__in=[])
+    lookup = range_filter(runs[0][0], runs[0][1], field=field)
+    for start, end in runs[1:]:
+        lookup |= range_filter(start, end, field=field)
+    return lookup
+
+
+def month_bucket(field='date'):
+    """
+    Returns an expression of the first day of the month of ``field``, to group by
+    """
+    return TruncMonth(field)
@@ -0,0 +1,24 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+
+from fir_celery.celeryconf import celery_app
+from incidents.search import index as search_index
+from incidents.statistics import snapshots as statistics_snapshots
+
+
+@celery_app.task
+def refresh_statistics_snapshots():
+    statistics_snapshots.refresh()
+
+
+@celery_app.task
+def refresh_search_index(incident_ids):
+    search_index.refresh(incident_ids)
+
+
+@celery_app.on_after_finalize.connect
+def schedule_statistics_snapshots(sender, **kwargs):
+    if statistics_snapshots.is_enabled():
+        sender.add_periodic_task(getattr(settings, 'STATISTICS_SNAPSHOTS_INTERVAL', 3600),
+                                 refresh_statistics_snapshots.s(), name='Refresh the statistics snapshots')
@@ -0,0 +1,150 @@
+import datetime
+from unittest import skipUnless
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db.models import Max
+from django.test import TestCase
+
+from incidents import models
+from incidents.pagination import KeysetPaginator
+
+
+class PaginationTestCase(TestCase):
+    fixtures = ['incidents/fixtures/seed_data.json', ]
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        models.Profile.objects.create(user=self.admin, incident_number=3)
+
+        category = models.IncidentCategory.objects.first()
+        detection = models.Label.objects.filter(group__name='detection').first()
+        actors = list(models.Label.objects.filter(group__name='actor')[:2]) + [None]
+        action = models.Label.objects.filter(group__name='action').first()
+        date = datetime.datetime(2017, 3, 1, 10, 30, 15, 123456)
+        for n in range(10):
+            # Some incidents share their date, actor or last comment date
+            incident = models.Incident.objects.create(
+                subject='Incident {}'.format(n), description='Description', category=category, detection=detection,
+                actor=actors[n % 3], severity=1 + n % 4, status='O', date=date + datetime.timedelta(days=n // 3),
+                opened_by=self.admin)
+            if n % 2:
+                models.Comments.objects.create(incident=incident, comment='Comment', action=action,
+                                               opened_by=self.admin, date=date + datetime.timedelta(days=n // 4))
+
+    def walk(self, queryset, per_page=3):
+        """
+        Returns the rows of all the pages of ``queryset``, following the next then the previous cursors
+        """
+        paginator = KeysetPaginator(queryset, per_page)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            self.assertEqual(len(pages[-1]), per_page)
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([page.number for page in pages], list(range(1, len(pages) + 1)))
+        backward = [pages[-1]]
+        while backward[-1].has_previous():
+            backward.append(paginator.page(backward[-1].previous_cursor))
+        self.assertEqual([[incident.pk for incident in page] for page in reversed(backward)],
+                         [[incident.pk for incident in page] for page in pages])
+        return [incident.pk for page in pages for incident in page]
+
+    def expected(self, key, reverse=False):
+        """
+        Returns the incidents sorted on ``key`` and their pk, NULL keys last
+        """
+        incidents = list(models.Incident.objects.all())
+        incidents.sort(key=lambda incident: (key(incident), incident.pk), reverse=reverse)
+        incidents.sort(key=lambda incident: key(incident) is None)
+        return [incident.pk for incident in incidents]
+
+    def test_seek(self):
+        incidents = models.Incident.objects.all()
+        self.assertEqual(self.walk(incidents.order_by('-date')), self.expected(lambda i: i.date, reverse=True))
+        self.assertEqual(self.walk(incidents.order_by('severity'), per_page=4), self.expected(lambda i: i.severity))
+        self.assertEqual(self.walk(incidents.order_by('actor__name')),
+                         self.expected(lambda i: i.actor.name if i.actor else None))
+        self.assertEqual(self.walk(incidents.order_by('-actor__name')),
+                         self.expected(lambda i: i.actor.name if i.actor else None, reverse=True))
+
+        last_comment = lambda i: i.comments_set.aggregate(date=Max('date'))['date']
+        self.assertEqual(self.walk(incidents.annotate(Max('comments__date')).order_by('-comments__date__max')),
+                         self.expected(last_comment, reverse=True))
+
+        # Columns that cannot be filtered on are paginated with offsets
+        extra = incidents.extra(select={'rank': 'severity * 10'}).order_by('-rank', 'pk')
+        self.assertEqual(self.walk(extra), list(extra.values_list('pk', flat=True)))
+
+    def test_count(self):
+        incidents = models.Incident.objects.order_by('-date')
+        paginator = KeysetPaginator(incidents, 3)
+        page = paginator.page()
+        self.assertEqual((paginator.count, paginator.num_pages), (10, 4))
+
+        # The count is carried by the cursors
+        models.Incident.objects.filter(pk=page[0].pk).delete()
+        paginator = KeysetPaginator(incidents, 3)
+        paginator.page(page.next_cursor)
+        self.assertEqual(paginator.count, 10)
+        paginator = KeysetPaginator(incidents, 3, counted=False)
+        self.assertEqual((paginator.page().paginator.count, paginator.num_pages), (None, None))
+
+        # Cursors of another ordering restart from the first page
+        paginator = KeysetPaginator(incidents.order_by('date'), 3)
+        self.assertEqual(paginator.page(page.next_cursor).number, 1)
+        self.assertEqual(paginator.page('invalid').number, 1)
+
+    def test_views(self):
+        self.client.force_login(self.admin)
+        expected = self.expected(lambda i: i.date, reverse=True)
+
+        # Numbered pages by default
+        response = self.client.get('/dashboard/open/', {'page': 2})
+        page = response.context['incident_list']
+        self.assertEqual((page.number, page.paginator.num_pages), (2, 4))
+        self.assertEqual([incident.pk for incident in page], expected[3:6])
+
+        with self.settings(LIST_PAGINATION='keyset'):
+            found = []
+            params = {}
+            while True:
+                response = self.client.get('/dashboard/open/', params)
+                page = response.context['incident_list']
+                found.extend(incident.pk for incident in page)
+                if not page.has_next():
+                    break
+                self.assertContains(response, page.next_cursor)
+                params = {'cursor': page.next_cursor}
+            self.assertEqual(found, expected)
+
+    def walk_api(self, url):
+        """
+        Returns the incident ids of all the pages of the API list at ``url`` and its last response
+        """
+        found = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.data['count'], 10)
+            found.extend(incident['id'] for incident in response.data['results'])
+            url = response.data['next']
+        return found, response
+
+    @skipUnless(apps.is_installed('fir_api'), "Needs the fir_api plugin")
+    def test_api(self):
+        from fir_api.pagination import ListPagination
+
+        self.client.force_login(self.admin)
+        self.addCleanup(setattr, ListPagination, 'page_size', ListPagination.page_size)
+        ListPagination.page_size = 4
+        expected = sorted(models.Incident.objects.values_list('pk', flat=True))
+
+        found, response = self.walk_api('/api/incidents')
+        self.assertEqual(found, expected)
+        self.assertIn('page=2', response.data['previous'])
+        response = self.client.get('/api/incidents', {'page': 2})
+        self.assertEqual([incident['id'] for incident in response.data['results']], expected[4:8])
+
+        with self.settings(LIST_PAGINATION='keyset'):
+            found, response = self.walk_api('/api/incidents')
+            self.assertEqual(found, expected)
+            self.assertIn('cursor=', response.data['previous'])
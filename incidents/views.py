@@ -14,6 +14,13 @@ from incidents.models import Attribute, ValidAttribute, IncidentTemplate, Profil
 from incidents.forms import IncidentForm, CommentForm
 
 from incidents.authorization.decorator import authorization_required
+from incidents import pagination
+from incidents.search import query as search_query
+from incidents.statistics import aggregation
+from incidents.statistics.buckets import TimeBuckets
+from incidents.statistics import cache as statistics_cache
+from incidents.statistics import snapshots as statistics_snapshots
+from incidents.statistics import windows
 from fir.config.base import INSTALLED_APPS, ENFORCE_2FA, TF_INSTALLED
 import importlib
 
@@ -21,14 +28,13 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from fir.decorators import fir_auth_required
 from django.core import serializers
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Max
-from django.http import HttpResponse, HttpResponseServerError
+from django.db.models import Q, Max, OuterRef, Subquery
+from django.http import Http404, HttpResponse, HttpResponseServerError, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect, resolve_url
 from django.template import RequestContext
-from json import dumps
+from json import dumps, loads
 from django.template import Template
 
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
@@ -43,7 +49,7 @@ from dateutil.relativedelta import *
 from dateutil.parser import parse
 from bson import json_util
 
-import copy
+import csv
 import math
 
 from fir_artifacts import artifacts as libartifacts
@@ -63,6 +69,14 @@ cal = [
     'dec',
 ]
 
+# Incidents loaded at once when streaming the statistics tables
+STATS_CHUNK_SIZE = 500
+
+# Columns of the sandbox incidents table exports
+SANDBOX_TABLE_COLUMNS = ['date', 'id', 'subject', 'category', 'confidentiality_display', 'severity',
+                         'business_lines_names', 'status_display', 'detection', 'actor', 'last_comment_action',
+                         'last_comment_date', 'opened_by', 'plan']
+
 APP_HOOKS = {}
 
 for app in INSTALLED_APPS:
@@ -239,7 +253,8 @@ def log(what, user, incident=None, comment=None):
 # incidents =======================================================
 
 @fir_auth_required
-@authorization_required('incidents.view_incidents', Incident, view_arg='incident_id')
+@authorization_required('incidents.view_incidents', Incident, view_arg='incident_id',
+                        select_related=('category', 'actor', 'plan', 'opened_by'))
 def followup(request, incident_id, authorization_target=None):
     if authorization_target is None:
         i = get_object_or_404(
@@ -247,7 +262,7 @@ def followup(request, incident_id, authorization_target=None):
             pk=incident_id)
     else:
         i = authorization_target
-    comments = i.comments_set.all().order_by('date')
+    comments = i.comments_set.select_related('action', 'opened_by').order_by('date')
 
     return render(
         request,
@@ -275,7 +290,9 @@ def events_all(request):
 
 
 @fir_auth_required
-@authorization_required('incidents.view_incidents', Incident, view_arg='incident_id')
+@authorization_required('incidents.view_incidents', Incident, view_arg='incident_id',
+                        select_related=('category', 'detection', 'actor', 'plan', 'opened_by'),
+                        prefetch_related=('concerned_business_lines', 'category__validattribute_set', 'attribute_set'))
 def details(request, incident_id, authorization_target=None):
     if authorization_target is None:
         i = get_object_or_404(
@@ -296,7 +313,7 @@ def details(request, incident_id, authorization_target=None):
     valid_attributes = i.category.validattribute_set.all()
     attributes = i.attribute_set.all()
 
-    comments = i.comments_set.all().order_by('date')
+    comments = i.comments_set.select_related('action', 'opened_by').order_by('date')
 
     return render(
         request,
@@ -664,89 +681,16 @@ def search(request):
 
         if request.is_ajax():
             asc = request.GET.get('asc', 'false')
-            q = Q()
-
-            plan = re.search("plan:(\S+)", query_string)
-            if plan:
-                q = q & Q(plan__name=plan.group(1))
-                query_string = query_string.replace("plan:" + plan.group(1), '')
+            plan = search_query.get_plan(query_string)
 
-            try:
-                bl = re.search("bl:(\S+)", query_string).group(1)
-                bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_incidents').filter(
-                    name__icontains=bl)
-                if bls:
-                    q = q & (Q(concerned_business_lines__in=bls) | Q(main_business_lines__in=bls))
-                    query_string = query_string.replace("bl:" + bl, '')
-            except Exception:
-                pass
-
-            opened_by = re.search("opened_by:(\S+)", query_string)
-            if opened_by:
-                q = q & Q(opened_by__username=opened_by.group(1))
-                query_string = query_string.replace('opened_by:' + opened_by.group(1), '')
-
-            category = re.search("category:(\S+)", query_string)
-            if category:
-                q = q & Q(category__name__icontains=category.group(1))
-                query_string = query_string.replace('category:' + category.group(1), '')
-
-            status = re.search("status:(\S+)", query_string)
-            if status:
-                q = q & Q(status=status.group(1)[0])
-                query_string = query_string.replace('status:' + status.group(1), '')
-
-            artifacts = re.search("art:(\S+)", query_string)
-            if artifacts:
-                artifacts = artifacts.group(1)
-                q = q & Q(id__in=[i.id for i in libartifacts.incs_for_art(artifacts)])
-                query_string = query_string.replace('art:' + artifacts, '')
-
-            if query_string.count('starred') > 0:
-                q = q & Q(is_starred=True)
-                query_string = query_string.replace('starred', '')
-
-            severity = re.search("severity(?P<eval>[:<>])(?P<value>\d)", query_string)
-            if severity:
-                if severity.group('eval') == ':':
-                    q = q & Q(severity=severity.group("value"))
-                elif severity.group('eval') == ">":
-                    q = q & Q(severity__gt=severity.group("value"))
-                elif severity.group('eval') == "<":
-                    q = q & Q(severity__lt=severity.group("value"))
-                query_string = query_string.replace('severity' + severity.group('eval') + severity.group("value"), '')
-
-            # app keyword_filters go here
-            for app_name, hooks in APP_HOOKS.items():
-                if "keyword_filter" in hooks:
-                    q, query_string = hooks['keyword_filter'](q, query_string)
-
-            pattern = re.compile('\s+')
-
-            query_string = query_string.strip()
-
-            other = pattern.split(query_string)
-            if query_string != ['']:
-                q_other = Q()
-                for i in other:
-                    q_other &= (
-                        Q(subject__icontains=i) | Q(description__icontains=i) | Q(comments__comment__icontains=i)
-                    )
-
-                    # app search_filters go here
-                    for app_name, hooks in APP_HOOKS.items():
-                        if "search_filter" in hooks:
-                            q_other, query_string = hooks['search_filter'](q_other, query_string)
-            q = (q & q_other)
-
-            # TODO a function that takes in incidents and returns them ordered
-
-            order_param = request.GET.get('order_by', 'date')
+            order_param = request.GET.get('order_by', 'relevance' if plan.is_ranked() else 'date')
 
             order_by = order_param
 
             if order_by not in ['date', 'subject', 'category', 'bl', 'severity', 'status', 'opened_by', 'detection',
-                                'actor', 'confidentiality']:
+                                'actor', 'confidentiality', 'relevance', 'last_action']:
+                order_by = 'date'
+            if order_by == 'relevance' and not plan.is_ranked():
                 order_by = 'date'
 
             if order_by == "category":
@@ -755,20 +699,22 @@ def search(request):
                 order_by = 'detection__name'
             if order_by == 'actor':
                 order_by = 'actor__name'
+            if order_by == 'last_action':
+                order_by = 'comments__date__max'
+
+            if order_by == 'relevance':
+                order_by = 'search_rank'
 
             if asc == 'false':
                 order_by = "-" + order_by
 
-            found_entries = Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(q)
+            found_entries = plan.filter(Incident.authorization.for_user(request.user, 'incidents.view_incidents'),
+                                        request.user)
 
             if order_param == 'last_action':
-                if asc:
-                    found_entries = found_entries.annotate(Max('comments__date')).order_by('comments__date__max')
-                else:
-                    found_entries = found_entries.annotate(Max('comments__date')).order_by('-comments__date__max')
+                found_entries = found_entries.annotate(Max('comments__date'))
 
-            else:
-                found_entries = found_entries.order_by(order_by).all()
+            found_entries = found_entries.order_by(order_by)
 
             # distinct
             found_entries = found_entries.distinct()
@@ -778,17 +724,8 @@ def search(request):
                 found_entries = found_entries.filter(~Q(status='C'))
 
             # get number of pages from user profile
-            page = request.GET.get('page')
-            incident_number = request.user.profile.incident_number
-
-            p = Paginator(found_entries, incident_number)
-
-            try:
-                found_entries = p.page(page)
-            except PageNotAnInteger:
-                found_entries = p.page(1)
-            except EmptyPage:
-                found_entries = p.page(1)
+            found_entries = pagination.paginate(request, found_entries, request.user.profile.incident_number)
+            Incident.authorization.permissions_for(request.user, found_entries, 'incidents.handle_incidents')
 
             return render(request, 'events/table.html',
                           {'incident_list': found_entries, 'order_param': order_param, 'asc': asc})
@@ -797,16 +734,6 @@ def search(request):
     else:
         return redirect('incidents:index')
 
-    if request.is_ajax():
-        query_string = ''
-        found_entries = None
-        if ('q' in request.GET) and request.GET['q'].strip():
-            query_string = request.GET['q']
-        else:
-            return redirect('incidents:index')
-    else:
-        return render(request, 'events/search.html', {'query_string': q})
-
 
 # ajax ======================================================================
 
@@ -897,7 +824,9 @@ def delete_empty_keys(chart_data):
 @fir_auth_required
 @user_passes_test(can_view_statistics)
 def yearly_stats(request):
-    return render(request, 'stats/yearly.html')
+    return render(request, 'stats/yearly.html', {
+        'charts_url': statistics_snapshots.get_batch_path(statistics_snapshots.YEARLY_BATCH),
+        'computed_at': statistics_snapshots.computed_at(request.user)})
 
 
 @fir_auth_required
@@ -924,15 +853,7 @@ def quarterly_bl_stats(request, business_line=None, num_months=3):
         bl = bls[0]
 
     today = datetime.date.today()
-    q_month = Q()
-    for i in xrange(num_months):
-        previous = today - relativedelta(months=i + 1)
-        month = previous.month
-        year = previous.year
-
-        q_month |= Q(date__month=month, date__year=year)
-
-    q = q_month & Q(confidentiality__lte=2)
+    q = windows.month_filter(windows.months_before(today, num_months)) & Q(confidentiality__lte=2)
     qbl = (
         Q(concerned_business_lines=bl) | Q(main_business_lines=bl) | Q(concerned_business_lines__in=bl.get_children()))
     q &= qbl
@@ -944,10 +865,13 @@ def quarterly_bl_stats(request, business_line=None, num_months=3):
     unclosed_incident_list = [i for i in
                               Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
                                   unclosed).order_by('-date').distinct()]
+    Incident.authorization.permissions_for(request.user, incident_list + unclosed_incident_list,
+                                           ['incidents.view_incidents', 'incidents.handle_incidents'])
 
     return render(request, 'stats/quarterly.html',
                   {'bl': bl, 'incident_list': incident_list, 'unclosed_incident_list': unclosed_incident_list,
-                   'bls': bls})
+                   'bls': bls, 'charts_url': statistics_snapshots.get_batch_path(statistics_snapshots.QUARTERLY_BATCH, bl),
+                   'computed_at': statistics_snapshots.computed_at(request.user)})
 
 
 @fir_auth_required
@@ -961,6 +885,36 @@ def yearly_compare(request, year=None):
 
 # comparison ===============================================================
 
+def sandbox_table_rows(incident_ids):
+    """
+    Yields the sandbox table rows of ``incident_ids``, loaded by chunks with their last comment
+    """
+    last_comments = Comments.objects.filter(incident=OuterRef('pk')).order_by('-date')
+    incidents = Incident.objects.select_related('category', 'detection', 'actor', 'opened_by', 'plan').prefetch_related(
+        'concerned_business_lines').annotate(
+        last_comment_date=Subquery(last_comments.values('date')[:1]),
+        last_comment_action=Subquery(last_comments.values('action__name')[:1]))
+    for chunk, chunk_incidents in stats_incident_chunks(incident_ids, incidents):
+        for incident_id in chunk:
+            inc = chunk_incidents[incident_id]
+            plot = {}
+            plot['date'] = str(inc.date)
+            plot['id'] = inc.id
+            plot['subject'] = inc.subject
+            plot['category'] = inc.category.name
+            plot['confidentiality_display'] = inc.get_confidentiality_display()
+            plot['severity'] = inc.severity
+            plot['business_lines_names'] = inc.get_business_lines_names()
+            plot['status_display'] = inc.get_status_display()
+            plot['detection'] = unicode(inc.detection)
+            plot['actor'] = unicode(inc.actor)
+            plot['last_comment_action'] = inc.last_comment_action or ''
+            plot['last_comment_date'] = str(inc.last_comment_date) if inc.last_comment_date is not None else ''
+            plot['opened_by'] = unicode(inc.opened_by)
+            plot['plan'] = unicode(inc.plan)
+            yield plot
+
+
 @fir_auth_required
 @user_passes_test(can_view_statistics)
 def data_sandbox(request):
@@ -978,12 +932,8 @@ def data_sandbox(request):
     divisor = request.GET['divisor']
     graph_type = request.GET['graph_type']
 
-    dates = []
     delta = relativedelta(end, start)
-    months = delta.years * 12 + delta.months
-
-    for i in xrange(months):
-        dates.append(end - relativedelta(months=i + 1))
+    buckets = windows.months_before(end, delta.years * 12 + delta.months)
 
     q_categories = Q()
     for c in category_selection:
@@ -1034,103 +984,71 @@ def data_sandbox(request):
 
     if graph_type == 'table':
         if divisor == 'all':
-            qs = Q()
-            for i in xrange(months):
-                qs |= Q(date__year=dates[i].year, date__month=dates[i].month)
-
-            incidents = Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
-                qs & q_all).distinct()
-            for inc in incidents:
-                plot = {}
-                plot['date'] = str(inc.date)
-                plot['id'] = inc.id
-                plot['subject'] = inc.subject
-                plot['category'] = inc.category.name
-                plot['confidentiality_display'] = inc.get_confidentiality_display()
-                plot['severity'] = inc.severity
-                plot['business_lines_names'] = inc.get_business_lines_names()
-                plot['status_display'] = inc.get_status_display()
-                plot['detection'] = str(inc.detection)
-                plot['actor'] = str(inc.actor)
-                plot['last_comment_action'] = inc.get_last_comment().action.name
-                plot['last_comment_date'] = str(inc.get_last_comment().date)
-                plot['opened_by'] = str(inc.opened_by)
-                plot['plan'] = str(inc.plan)
-                chart_data.append(plot)
+            incident_ids = list(Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
+                windows.month_filter(buckets) & q_all).order_by('-date').distinct().values_list('pk', flat=True))
+            rows = sandbox_table_rows(incident_ids)
+            if request.GET.get('format') == 'csv':
+                response = StreamingHttpResponse(stream_csv(SANDBOX_TABLE_COLUMNS, rows), content_type="text/csv")
+                response['Content-Disposition'] = 'attachment; filename="incidents.csv"'
+                return response
+            if request.GET.get('format') == 'ndjson':
+                response = StreamingHttpResponse(stream_ndjson(rows), content_type="application/x-ndjson")
+                response['Content-Disposition'] = 'attachment; filename="incidents.ndjson"'
+                return response
+            chart_data = list(rows)
+
+    incidents = aggregation.authorized_incidents(request.user, 'incidents.view_statistics')
 
     if graph_type == 'line':
 
         if divisor == 'all':
-            for i in xrange(months):
+            counts = aggregation.MonthlyCounts(incidents.filter(q_all), buckets + windows.shift_years(buckets, -1))
+            for year, month in buckets:
                 plot = {}
-                plot['date'] = str(dates[i].year) + "-" + str(dates[i].month)
-                plot['N'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year, date__month=dates[i].month) & q_all).distinct().count()
-                plot['N-1'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year - 1, date__month=dates[i].month) & q_all).distinct().count()
+                plot['date'] = str(year) + "-" + str(month)
+                plot['N'] = counts.get((year, month))
+                plot['N-1'] = counts.get((year - 1, month))
                 chart_data.append(plot)
 
         if divisor == 'category':
-            for i in xrange(months):
+            counts = aggregation.MonthlyCounts(
+                incidents.filter(q_categories & q_detection & q_severity & q_is_incident & q_is_major & q_bl),
+                buckets, dimension='category')
+            for year, month in buckets:
                 plot = {}
-                plot['date'] = str(dates[i].year) + "-" + str(dates[i].month)
+                plot['date'] = str(year) + "-" + str(month)
 
                 for cat in category_selection:
-                    plot[cat.name] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                        Q(date__year=dates[i].year, date__month=dates[i].month,
-                          category=cat) & q_detection & q_severity & q_is_incident & q_is_major & q_bl).distinct().count()
+                    plot[cat.name] = counts.get((year, month), cat.pk)
                 chart_data.append(plot)
 
     if graph_type == 'bar':
-
-        if divisor == 'months':
-            for i in xrange(months):
-                plot = {}
-                plot['label'] = '%s-%s' % (dates[i].year, dates[i].month)
-                plot['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year, date__month=dates[i].month) & q_all).distinct().count()
-                plot['text'] = plot['value']
-                chart_data.append(plot)
-
-        if divisor == 'monitoring':
-            for i in xrange(months):
-                plot = {}
-                plot['label'] = '%s-%s' % (dates[i].year, dates[i].month)
-                plot['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year, date__month=dates[i].month, plan__name='A') & q_all).distinct().count()
-                plot['text'] = plot['value']
-                chart_data.append(plot)
-
-        if divisor == 'open':
-            for i in xrange(months):
+        bar_filters = {
+            'months': Q(),
+            'monitoring': Q(plan__name='A'),
+            'open': Q(status='O'),
+            'blocked': Q(status='B'),
+        }
+
+        if divisor in bar_filters:
+            counts = aggregation.MonthlyCounts(incidents.filter(bar_filters[divisor] & q_all), buckets)
+            for year, month in buckets:
                 plot = {}
-                plot['label'] = '%s-%s' % (dates[i].year, dates[i].month)
-                plot['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year, date__month=dates[i].month, status='O') & q_all).distinct().count()
-                plot['text'] = plot['value']
-                chart_data.append(plot)
-
-        if divisor == 'blocked':
-            for i in xrange(months):
-                plot = {}
-                plot['label'] = '%s-%s' % (dates[i].year, dates[i].month)
-                plot['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    Q(date__year=dates[i].year, date__month=dates[i].month, status='B') & q_all).distinct().count()
+                plot['label'] = '%s-%s' % (year, month)
+                plot['value'] = counts.get((year, month))
                 plot['text'] = plot['value']
                 chart_data.append(plot)
 
     if graph_type == 'donut' or graph_type == 'stacked':
 
         if divisor == 'severity':
-            for i in xrange(months):
+            counts = aggregation.MonthlyCounts(incidents.filter(q_all), buckets, dimension='severity')
+            for year, month in buckets:
                 plot = {}
-                plot['entry'] = '%s-%s' % (dates[i].year, dates[i].month)
+                plot['entry'] = '%s-%s' % (year, month)
                 append = False
                 for severity in xrange(1, 5):
-                    plot['%s/4' % severity] = Incident.authorization.for_user(request.user,
-                                                                              'incidents.view_statistics').filter(
-                        Q(date__year=dates[i].year, date__month=dates[i].month,
-                          severity=severity) & q_severity & q_categories & q_detection & q_is_incident & q_is_major & q_bl).distinct().count()
+                    plot['%s/4' % severity] = counts.get((year, month), severity)
                     if plot['%s/4' % severity] > 0:
                         append = True
                 if append:
@@ -1141,40 +1059,42 @@ def data_sandbox(request):
                 children = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(
                     depth=1)
             else:
-                bl = BusinessLine.objects.get(id=bl)
-                children = bl.get_children()
-
-            for i in xrange(months):
+                children = BusinessLine.objects.get(id=bls[-1]).get_children()
+            children = list(children)
+
+            counts = aggregation.MonthlyCounts(
+                incidents.filter(Q(concerned_business_lines__in=children) & q_categories & q_detection &
+                                 q_severity & q_is_incident & q_is_major),
+                buckets, dimension='concerned_business_lines')
+            for year, month in buckets:
                 plot = {}
                 for cbl in children:
-                    plot[cbl.name] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                        Q(date__year=dates[i].year, date__month=dates[i].month,
-                          concerned_business_lines=cbl) & q_categories & q_detection & q_severity & q_is_incident & q_is_major).distinct().count()
+                    plot[cbl.name] = counts.get((year, month), cbl.pk)
 
-                plot['entry'] = '%s-%s' % (dates[i].year, dates[i].month)
+                plot['entry'] = '%s-%s' % (year, month)
                 chart_data.append(plot)
 
         if divisor == 'actor':
-            for i in xrange(months):
+            counts = aggregation.MonthlyCounts(incidents.filter(q_all), buckets, dimension='actor')
+            actors = list(Label.objects.filter(group__name='actor'))
+            for year, month in buckets:
                 plot = {}
-                for actor in Label.objects.filter(group__name='actor'):
-                    plot[actor.name] = Incident.authorization.for_user(request.user,
-                                                                       'incidents.view_statistics').filter(
-                        Q(date__year=dates[i].year, date__month=dates[i].month, actor=actor) & q_all).distinct().count()
+                for actor in actors:
+                    plot[actor.name] = counts.get((year, month), actor.pk)
 
-                plot['entry'] = '%s-%s' % (dates[i].year, dates[i].month)
+                plot['entry'] = '%s-%s' % (year, month)
                 chart_data.append(plot)
 
         if divisor == 'category':
-            for i in xrange(months):
+            counts = aggregation.MonthlyCounts(
+                incidents.filter(q_categories & q_detection & q_severity & q_is_incident & q_is_major & q_bl),
+                buckets, dimension='category')
+            for year, month in buckets:
                 plot = {}
                 for category in category_selection:
-                    plot[category.name] = Incident.authorization.for_user(request.user,
-                                                                          'incidents.view_statistics').filter(
-                        Q(date__year=dates[i].year, date__month=dates[i].month,
-                          category=category) & q_detection & q_severity & q_is_incident & q_is_major & q_bl).distinct().count()
+                    plot[category.name] = counts.get((year, month), category.pk)
 
-                plot['entry'] = '%s-%s' % (dates[i].year, dates[i].month)
+                plot['entry'] = '%s-%s' % (year, month)
                 chart_data.append(plot)
 
     return HttpResponse(dumps(chart_data), content_type="application/json")
@@ -1366,46 +1286,99 @@ def stats_attributes_date_ranges(start, end):
     return result
 
 
+def stats_attributes_values(incident_ids, names):
+    """
+    Returns the values of the attributes ``names`` of the incidents, by incident id and attribute name
+    """
+    values = {}
+    for incident_id, name, value in Attribute.objects.filter(
+            incident_id__in=incident_ids, name__in=names).order_by('pk').values_list('incident_id', 'name', 'value'):
+        values.setdefault(incident_id, {}).setdefault(name, []).append(value)
+    return values
+
+
+def stats_incident_chunks(incident_ids, incidents):
+    """
+    Yields the ``incident_ids`` by chunks of ``STATS_CHUNK_SIZE``, with their incidents by id from ``incidents``
+
+    The incidents deleted since their ids were listed are left out of the chunks.
+    """
+    for start in xrange(0, len(incident_ids), STATS_CHUNK_SIZE):
+        chunk_incidents = incidents.in_bulk(incident_ids[start:start + STATS_CHUNK_SIZE])
+        yield [pk for pk in incident_ids[start:start + STATS_CHUNK_SIZE] if pk in chunk_incidents], chunk_incidents
+
+
+def stats_attributes_table_rows(incident_ids, names, only_with_attribute=False):
+    for chunk, incidents in stats_incident_chunks(incident_ids, Incident.objects.select_related(
+            'category').prefetch_related('concerned_business_lines')):
+        values = stats_attributes_values(chunk, names)
+        for incident_id in chunk:
+            if only_with_attribute and incident_id not in values:
+                continue
+            incident = incidents[incident_id]
+            attributes = {}
+            for name in names:
+                attributes[name] = ', '.join(values.get(incident_id, {}).get(name, []))
+
+            row = {}
+            row['date'] = str(incident.date)
+            row['category'] = incident.category.name
+            row['subject'] = incident.subject
+            row['business_lines_names'] = incident.get_business_lines_names()
+
+            if incident.is_incident:
+                row['url'] = reverse('incidents:details', args=[incident.id])
+            else:
+                row['url'] = reverse('events:details', args=[incident.id])
+
+            row['attributes'] = attributes
+
+            yield row
+
+
+def stream_json_list(items):
+    yield '['
+    for i, item in enumerate(items):
+        yield (', ' if i else '') + dumps(item)
+    yield ']'
+
+
+def stream_ndjson(items):
+    for item in items:
+        yield dumps(item) + '\n'
+
+
+class EchoBuffer(object):
+    """
+    File-like object returning what is written, for the csv writer to produce lines
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, items):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(columns)
+    for item in items:
+        yield writer.writerow([unicode(item[column]).encode('utf-8') for column in columns])
+
+
 @fir_auth_required
 @user_passes_test(can_view_statistics)
 def stats_attributes_table(request):
     main_filter = stats_attributes_filter(request)
 
-    result = []
     attribute_selection = request.GET.getlist("attribute_selection")
     if request.GET['bars'] != '0':
         attribute_selection.append(request.GET['bars'])
-    (incidents, all_attributes) = stats_attributes_get_data(main_filter, attribute_selection, request.user,
-                                                            permission='incidents.view_incidents')
-
-    for incident in incidents:
-        attribute_count = 0
-        attributes = {}
-        for valid_attribute in all_attributes:
-            attributes[valid_attribute] = []
-            for attribute in all_attributes[valid_attribute]:
-                if attribute.incident_id == incident.id:
-                    attribute_count += 1
-                    attributes[valid_attribute].append(attribute.value)
-            attributes[valid_attribute] = ', '.join(attributes[valid_attribute])
-
-        if not request.GET.get('only_with_attribute', False) or attribute_count > 0:
-            values = {}
-            values['date'] = str(incident.date)
-            values['category'] = incident.category.name
-            values['subject'] = incident.subject
-            values['business_lines_names'] = incident.get_business_lines_names()
-
-            if incident.is_incident:
-                values['url'] = reverse('incidents:details', args=[incident.id])
-            else:
-                values['url'] = reverse('events:details', args=[incident.id])
-
-            values['attributes'] = attributes
-
-            result.append(values)
+    names = list(set(ValidAttribute.objects.filter(pk__in=attribute_selection).values_list('name', flat=True)))
+    incident_ids = list(Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
+        main_filter).order_by('-date').distinct().values_list('pk', flat=True))
 
-    return HttpResponse(dumps(result), content_type="application/json")
+    rows = stats_attributes_table_rows(incident_ids, names,
+                                       only_with_attribute=bool(request.GET.get('only_with_attribute', False)))
+    return StreamingHttpResponse(stream_json_list(rows), content_type="application/json")
 
 
 def stats_attributes_by_time_range(request):
@@ -1413,110 +1386,64 @@ def stats_attributes_by_time_range(request):
     attribute_selection = request.GET.getlist("attribute_selection")
     if request.GET['bars'] != '0':
         attribute_selection.append(request.GET['bars'])
-    (incidents, all_attributes) = stats_attributes_get_data(main_filter, attribute_selection, request.user)
-    datetime_ranges = stats_attributes_date_ranges(parse(request.GET['from_date']), parse(request.GET['to_date']))
+    names = set(ValidAttribute.objects.filter(pk__in=attribute_selection).values_list('name', flat=True))
+    incidents = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
+        main_filter).distinct()
 
-    for i, datetime_range in enumerate(datetime_ranges):
-        # Get incident ids for selected time range
-        incident_ids = []
-        for incident in incidents:
-            if datetime_range['from'] <= incident.date.replace(tzinfo=None) < datetime_range['to']:
-                incident_ids.append(incident.id)
-
-        with_attribute = []
-        attributes = {}
-        for valid_attribute in all_attributes:
-            attributes[valid_attribute] = []
-            for attribute in all_attributes[valid_attribute]:
-                if attribute.incident_id in incident_ids:
-                    if attribute.incident_id not in with_attribute:
-                        with_attribute.append(attribute.incident_id)
-                    attributes[valid_attribute].append(attribute.value)
+    datetime_ranges = stats_attributes_date_ranges(parse(request.GET['from_date']), parse(request.GET['to_date']))
 
-        yield (datetime_range, incident_ids, attributes, len(with_attribute))
+    buckets = TimeBuckets(datetime_ranges, names)
+    buckets.add_incidents(incidents.order_by('date').values_list('pk', 'date'))
+    buckets.add_attributes(Attribute.objects.filter(incident__in=incidents.order_by().values('pk'),
+                                                    name__in=names).values_list('incident_id', 'name', 'value'))
+    return buckets
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
 def stats_attributes_over_time(request):
-    incident_values = []
-    attribute_values = {}
-    i = 0
-
     bars_attribute = None
     if request.GET['bars'] != '0':
         bars_attribute = ValidAttribute.objects.get(pk=int(request.GET['bars']))
 
-    for date_range, incidents, attributes, with_attribute_count in stats_attributes_by_time_range(request):
-        # First, init dictionnary values (only the first time)
-        if i == 0:
-            for valid_attribute in attributes:
-                attribute_values[valid_attribute] = {}
-                if bars_attribute is not None and bars_attribute.name == valid_attribute:
-                    attribute_values[valid_attribute]['total'] = []
-                else:
-                    if request.GET.get('total', False):
-                        attribute_values[valid_attribute]['total'] = []
-                    if request.GET.get('average', False):
-                        attribute_values[valid_attribute]['avg'] = []
-                    if request.GET.get('deviation', False):
-                        attribute_values[valid_attribute]['std'] = []
-
-        # Compute bars_attribute, if any
-        if bars_attribute is not None:
-            attribute_values[bars_attribute.name]['total'].append(copy.deepcopy(date_range))
-            attribute_values[bars_attribute.name]['total'][i]['y'] = sum(
-                int(x) for x in attributes[bars_attribute.name])
-        # Otherwise, compute incidents
-        else:
-            incident_values.append(copy.deepcopy(date_range))
-            if request.GET.get('only_with_attribute', False):
-                incident_values[i]['y'] = with_attribute_count
-            else:
-                incident_values[i]['y'] = len(incidents)
-
-        # Compute all other attributes
-        for valid_attribute in attributes:
-            if bars_attribute is None or bars_attribute.name != valid_attribute:
-                total = sum(int(x) for x in attributes[valid_attribute])
-                if request.GET.get('total', False):
-                    attribute_values[valid_attribute]['total'].append(copy.deepcopy(date_range))
-                    attribute_values[valid_attribute]['total'][i]['y'] = total
-                if request.GET.get('average', False):
-                    attribute_values[valid_attribute]['avg'].append(copy.deepcopy(date_range))
-                    if bars_attribute is None:
-                        if request.GET.get('only_with_attribute', False):
-                            attribute_values[valid_attribute]['avg'][i]['y'] = average([total], with_attribute_count)
-                        else:
-                            attribute_values[valid_attribute]['avg'][i]['y'] = average([total], len(incidents))
-                    else:
-                        attribute_values[valid_attribute]['avg'][i]['y'] = average([total], attribute_values[
-                            bars_attribute.name]['total'][i]['y'])
-                if request.GET.get('deviation', False):
-                    attribute_values[valid_attribute]['std'].append(copy.deepcopy(date_range))
-                    attribute_values[valid_attribute]['avg'][i]['y'] = 0
-                    if request.GET.get('average', False):
-                        deviation = map(lambda x: (int(x) - attribute_values[valid_attribute]['avg'][i]['y']) ** 2,
-                                        attributes[valid_attribute])
-                        attribute_values[valid_attribute]['std'][i]['y'] = math.sqrt(average(deviation, len(deviation)))
-
-        i = i + 1
+    buckets = stats_attributes_by_time_range(request)
+
+    def series(values):
+        return [dict(date_range, y=value) for date_range, value in zip(buckets.ranges, values)]
 
     result = []
 
     # Add bars attribute, if any
     if bars_attribute is not None:
-        result.append(
-            {"key": bars_attribute.name, "values": attribute_values[bars_attribute.name]['total'], "bar": True})
+        bars = buckets.get_statistics(bars_attribute.name)['total']
+        result.append({"key": bars_attribute.name, "values": series(bars), "bar": True})
     # Otherwise, take incidents as bars
     else:
-        result.append({"key": "Incidents", "values": incident_values, "bar": True})
+        if request.GET.get('only_with_attribute', False):
+            bars = buckets.with_attribute
+        else:
+            bars = buckets.incidents
+        result.append({"key": "Incidents", "values": series(bars), "bar": True})
+
+    # Compute all other attributes, averages are relative to the bars
+    attribute_values = {}
+    for valid_attribute in buckets.names:
+        if bars_attribute is not None and bars_attribute.name == valid_attribute:
+            continue
+        statistics = buckets.get_statistics(valid_attribute)
+        attribute_values[valid_attribute] = {}
+        if request.GET.get('total', False):
+            attribute_values[valid_attribute]['total'] = series(statistics['total'])
+        if request.GET.get('average', False):
+            attribute_values[valid_attribute]['avg'] = series(
+                [average([total], size) for total, size in zip(statistics['total'], bars)])
+        if request.GET.get('deviation', False):
+            attribute_values[valid_attribute]['std'] = series(statistics['std'])
 
     # Add every attribute
     for attribute in attribute_values:
-        if bars_attribute is None or bars_attribute.name != attribute:
-            for stat in attribute_values[attribute]:
-                result.append({"key": "%s %s" % (stat, attribute), "values": attribute_values[attribute][stat]})
+        for stat in attribute_values[attribute]:
+            result.append({"key": "%s %s" % (stat, attribute), "values": attribute_values[attribute][stat]})
 
     return HttpResponse(dumps(result, default=json_util.default), content_type="application/json")
 
@@ -1586,6 +1513,7 @@ def stats_attributes_basic(request):
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
+@statistics_cache.cache_response()
 # set slide=True for a sliding year (current month, 12 months backwards).
 # slide=False for comparing Y-jan -> Y-dec and (Y-1)-jan -> (Y-1)-dec
 def data_yearly_compare(request, year, type='all', slide=True):
@@ -1603,32 +1531,24 @@ def data_yearly_compare(request, year, type='all', slide=True):
     q = q & Q(confidentiality__lte=2)
 
     if slide:
-        dates = []
-        today = datetime.date.today().replace(year=year)
-        for i in xrange(12):
-            dates.append(today - relativedelta(months=i + 1))
-
-        for i in xrange(12):
-            chart_data.append({'date': str(dates[i].year) + "-" + str(dates[i].month),
-                               str(year): Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q).filter(date__year=dates[i].year,
-                                                                            date__month=dates[i].month).count(),
-                               str(year - 1): Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q).filter(date__year=dates[i].year - 1,
-                                                                                date__month=dates[i].month).count()
-                               })
-
+        months = windows.months_before(datetime.date.today().replace(year=year), 12)
     else:
-        for i in xrange(12):
-            chart_data.append({'date': str(year) + "-" + str(i + 1),
-                               str(year): Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q).filter(date__year=year, date__month=i + 1).count(),
-                               str(year - 1): Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q).filter(date__year=year - 1,
-                                                                                date__month=i + 1).count()
-                               })
+        months = windows.year_months(year)
+
+    counts = aggregation.monthly_counts(request.user, 'incidents.view_statistics',
+                                        months + windows.shift_years(months, -1), lookup=q)
+    for y, m in months:
+        chart_data.append({'date': str(y) + "-" + str(m),
+                           str(year): counts.get((y, m)),
+                           str(year - 1): counts.get((y - 1, m))
+                           })
 
     return HttpResponse(dumps(chart_data), content_type="application/json")
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
+@statistics_cache.cache_response()
 def data_yearly_evolution(request, year, type='all', divisor='bl', slide=True):
     chart_data = []
 
@@ -1643,36 +1563,30 @@ def data_yearly_evolution(request, year, type='all', divisor='bl', slide=True):
 
     q = q & Q(confidentiality__lte=2)
 
+    if slide:
+        months = windows.months_before(datetime.datetime.now().replace(day=1, year=year), 12, offset=0)
+    else:
+        months = windows.year_months(year)
+    previous_months = windows.shift_years(months, -1)
+
     if divisor == 'bl':
         items = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
     elif divisor == 'category':
         items = IncidentCategory.objects.all()
+        counts = aggregation.monthly_counts(request.user, 'incidents.view_statistics', months + previous_months,
+                                            lookup=q, dimension='category')
 
     for item in items:
         d = {}
+        d['label'] = item.name
         if divisor == 'bl':
-            new_q = q & (Q(concerned_business_lines=item) | Q(main_business_lines=item) | Q(
-                concerned_business_lines__in=item.get_children()))
+            counts = aggregation.monthly_counts(request.user, 'incidents.view_statistics', months + previous_months,
+                                                lookup=q, business_line=item)
+            d['value'] = counts.total(months)
+            previous_value = counts.total(previous_months)
         elif divisor == 'category':
-            new_q = q & Q(category=item)
-
-        d['label'] = item.name
-        if slide:
-            today = datetime.datetime.now().replace(day=1, year=year)
-            dates = Q()
-            for i in xrange(12):
-                dates |= Q(date__month=(today - relativedelta(months=i)).month,
-                           date__year=(today - relativedelta(months=i)).year)
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(new_q & dates).distinct().count()
-            dates = Q()
-            for i in xrange(12):
-                dates |= Q(date__month=(today - relativedelta(months=i)).month,
-                           date__year=(today - relativedelta(months=i)).year - 1)
-
-            previous_value = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(new_q & dates).distinct().count()
-        else:
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(new_q & Q(date__year=year)).distinct().count()
-            previous_value = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(new_q & Q(date__year=year - 1)).distinct().count()
+            d['value'] = counts.total(months, item.pk)
+            previous_value = counts.total(previous_months, item.pk)
 
         if previous_value > 0:
             delta = d['value'] - previous_value
@@ -1693,220 +1607,256 @@ def data_yearly_evolution(request, year, type='all', divisor='bl', slide=True):
     return HttpResponse(dumps(chart_data), content_type="application/json")
 
 
+def yearly_incidents_chart(user):
+    today = datetime.date.today()
+    months = windows.months_before(today, 12)
+    counts = aggregation.monthly_counts(user, 'incidents.view_statistics', months, lookup=Q(confidentiality__lte=2))
+    return [{'date': str(y) + "-" + str(m), today.year - 1: counts.get((y, m))} for y, m in months]
+
+
 @fir_auth_required
 @user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
 def data_yearly_incidents(request):
-    chart_data = []
+    return HttpResponse(dumps(yearly_incidents_chart(request.user)), content_type="application/json")
 
-    dates = []
-    today = datetime.date.today()
-    for i in xrange(12):
-        dates.append(today - relativedelta(months=i + 1))
-    for i in xrange(12):
-        chart_data.append({'date': str(dates[i].year) + "-" + str(dates[i].month),
-                           today.year - 1: Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(date__year=dates[i].year, date__month=dates[i].month,
-                                                                   confidentiality__lte=2).count()})
 
-    return HttpResponse(dumps(chart_data), content_type="application/json")
+def distribution_window(request):
+    """
+    Returns the ``from_date`` (included) to ``to_date`` (excluded) window of the request, the current year by default
+    """
+    year = datetime.date.today().year
+    start = parse(request.GET['from_date']) if request.GET.get('from_date') else datetime.datetime(year, 1, 1)
+    end = parse(request.GET['to_date']) if request.GET.get('to_date') else datetime.datetime(year + 1, 1, 1)
+    return start, end
 
 
-@fir_auth_required
-@user_passes_test(can_view_statistics)
-def data_yearly_field(request, field):
-    field_dict = {}
-    total = 0
+def distribution_lookup(request):
+    if request.GET.get('type') == 'incidents':
+        return Q(is_incident=True)
+    elif request.GET.get('type') == 'events':
+        return Q(is_incident=False)
+    return Q()
 
-    q = Q(date__year=datetime.date.today().year)
 
-    for i in Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q):
-        field_dict[str(getattr(i, field))] = field_dict.get(str(getattr(i, field)), 0) + 1
-        total += 1
+def distribution_chart(field, counts):
+    total = sum(value for label, value in counts)
 
     chart_data = []
-    for label, value in field_dict.items():
+    for label, value in counts:
+        label = unicode(label)
         if field == 'severity':
             label += "/4"
         chart_data.append(
             {'label': label, 'value': value, 'percentage': float(str(round(float(value) / total, 2) * 100))})
-
-    return HttpResponse(dumps(chart_data), content_type="application/json")
+    return chart_data
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
-def data_yearly_bl(request, year=datetime.date.today().year, type='all'):
-    bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_field_distribution(request, field):
+    """
+    Distribution of the incidents by ``field``, for pie charts
 
-    chart_data = []
-    total = 0
+    Incidents are counted from ``from_date`` (included) to ``to_date`` (excluded), the current year by default.
+    ``type`` selects 'incidents' or 'events' only.
+    """
+    if field not in aggregation.DISTRIBUTION_FIELDS:
+        raise Http404("Unknown field")
 
-    q = Q(date__year=year)
+    start, end = distribution_window(request)
+    counts = aggregation.distribution(request.user, 'incidents.view_statistics', field, start, end,
+                                      lookup=distribution_lookup(request))
 
-    if type == 'incidents':
-        q = q & Q(is_incident=True)
-    elif type == 'events':
-        q = q & Q(is_incident=False)
+    return HttpResponse(dumps(distribution_chart(field, counts)), content_type="application/json")
 
-    q = q & Q(confidentiality__lte=2)
 
-    for bl in bls:
-        d = {}
-        d['label'] = bl.name
-        d['value'] = bl.get_incident_count(q)
-        if d['value'] > 0:
-            chart_data.append(d)
-        total += d['value']
+# Dimension of the root business lines counts each yearly chart is computed from
+YEARLY_BL_DIMENSIONS = {
+    'bl': 'is_incident',
+    'bl_detection': 'detection__name',
+    'bl_severity': 'severity',
+    'bl_category': 'category',
+    'bl_plan': 'plan',
+}
 
-    for d in chart_data:
-        d['percentage'] = float(str(round(float(d['value']) / total, 2) * 100))
 
-    chart_data = delete_empty_keys(chart_data)
+def yearly_bl_counts(user, bls, months, dimensions):
+    """
+    Returns the counts of the root business lines ``bls``, grouped by all the ``dimensions`` of their charts
+    """
+    return aggregation.root_monthly_counts(user, 'incidents.view_statistics', bls, months,
+                                           lookup=Q(confidentiality__lte=2), dimension=tuple(sorted(set(dimensions))))
 
-    return HttpResponse(dumps(chart_data), content_type="application/json")
 
+def yearly_bl_chart(name, bls, months, counts, type='all'):
+    """
+    Returns the data of the yearly chart ``name`` of the root business lines ``bls``
 
-@fir_auth_required
-@user_passes_test(can_view_statistics)
-def data_yearly_bl_detection(request):
-    bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
-    q = Q(date__year=datetime.datetime.now().year)
-    q = q & Q(confidentiality__lte=2)
+    ``counts`` are the ``yearly_bl_counts`` of the chart, summed over the dimensions of the other charts.
+    """
+    if name == 'bl':
+        return yearly_bl_share_chart(bls, months, counts, type)
+
+    dimension = YEARLY_BL_DIMENSIONS[name]
+    if dimension == 'detection__name':
+        items = [('CERT', 'CERT'), ('External', 'External')]
+    elif dimension == 'severity':
+        items = [('%s/4' % severity, severity) for severity in xrange(1, 5)]
+    elif dimension == 'category':
+        items = [(c.name, c.pk) for c in IncidentCategory.objects.all()]
+    else:
+        items = [(p.name, p.pk) for p in Label.objects.filter(group__name='plan')]
 
     chart_data = []
 
     for bl in bls:
         d = {}
         d['entry'] = bl.name
-        cert = bl.get_incident_count(q & Q(detection__name='CERT'))
-        ext = bl.get_incident_count(q & Q(detection__name='External'))
-        d['CERT'] = cert
-        d['External'] = ext
-        if d['CERT'] != 0 or d['External'] != 0:
-            chart_data.append(d)
 
-    chart_data = delete_empty_keys(chart_data)
+        append = False
+        for label, value in items:
+            d[label] = counts.total(months, bl.pk, value)
+            if d[label] > 0:
+                append = True
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+        if append:
+            chart_data.append(d)
 
+    return delete_empty_keys(chart_data)
 
-@fir_auth_required
-@user_passes_test(can_view_statistics)
-def data_yearly_bl_severity(request):
-    bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
 
-    q = Q(date__year=datetime.datetime.now().year)
-    q = q & Q(confidentiality__lte=2)
+def yearly_bl_share_chart(bls, months, counts, type='all'):
+    if type == 'incidents':
+        values = [True]
+    elif type == 'events':
+        values = [False]
+    else:
+        values = [True, False]
 
     chart_data = []
+    total = 0
 
     for bl in bls:
         d = {}
-        d['entry'] = bl.name
+        d['label'] = bl.name
+        d['value'] = sum(counts.total(months, bl.pk, value) for value in values)
+        if d['value'] > 0:
+            chart_data.append(d)
+        total += d['value']
 
-        append = False
-        for i in xrange(4):
-            d[str(i + 1) + '/4'] = bl.get_incident_count(q & Q(severity=i + 1))
-            if d[str(i + 1) + '/4'] > 0:
-                append = True
+    for d in chart_data:
+        d['percentage'] = float(str(round(float(d['value']) / total, 2) * 100))
 
-        if append:
-            chart_data.append(d)
+    return delete_empty_keys(chart_data)
 
-    chart_data = delete_empty_keys(chart_data)
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+def yearly_bl_response(request, name, year=None, type='all'):
+    if year is None:
+        year = datetime.datetime.now().year
+    bls = list(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1))
+    months = windows.year_months(year)
+    counts = yearly_bl_counts(request.user, bls, months, [YEARLY_BL_DIMENSIONS[name]])
+    return HttpResponse(dumps(yearly_bl_chart(name, bls, months, counts, type=type)),
+                        content_type='application/json')
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
-def data_yearly_bl_category(request):
-    bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
-    categories = IncidentCategory.objects.all()
-
-    q = Q(date__year=datetime.datetime.now().year)
-    q = q & Q(confidentiality__lte=2)
-
-    chart_data = []
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_yearly_bl(request, year=datetime.date.today().year, type='all'):
+    return yearly_bl_response(request, 'bl', year=year, type=type)
 
-    for bl in bls:
 
-        d = {}
-        d['entry'] = bl.name
+@fir_auth_required
+@user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_yearly_bl_detection(request):
+    return yearly_bl_response(request, 'bl_detection')
 
-        append = False
-        for c in categories:
-            d[c.name] = bl.get_incident_count(q & Q(category=c))
-            if d[c.name] > 0:
-                append = True
 
-        if append:
-            chart_data.append(d)
+@fir_auth_required
+@user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_yearly_bl_severity(request):
+    return yearly_bl_response(request, 'bl_severity')
 
-    chart_data = delete_empty_keys(chart_data)
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+@fir_auth_required
+@user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_yearly_bl_category(request):
+    return yearly_bl_response(request, 'bl_category')
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
+@statistics_cache.cache_response()
 def data_yearly_bl_plan(request):
-    bls = BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1)
-    plans = Label.objects.filter(group__name='plan')
+    return yearly_bl_response(request, 'bl_plan')
 
-    q = Q(date__year=datetime.datetime.now().year)
-    q = q & Q(confidentiality__lte=2)
 
-    chart_data = []
+# Quarterly charts counting the incidents having a value of a dimension
+QUARTERLY_FILTERS = {'monitoring': ('plan__name', 'A'), 'open': ('status', 'O'), 'blocked': ('status', 'B')}
 
-    for bl in bls:
+# Quarterly charts counting the incidents per value of a dimension
+QUARTERLY_DIMENSIONS = {'severity': 'severity', 'category': 'category', 'actor': 'actor', 'variation': 'category'}
 
-        d = {}
-        d['entry'] = bl.name
 
-        append = False
-        for p in plans:
-            d[p.name] = bl.get_incident_count(q & Q(plan=p))
-            if d[p.name] > 0:
-                append = True
-
-        if append:
-            chart_data.append(d)
-
-    chart_data = delete_empty_keys(chart_data)
+def quarterly_counts(user, bl, months, divisors):
+    """
+    Returns the counts of the incidents of ``bl``, grouped by all the dimensions of the quarterly charts ``divisors``
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+    Returns None when none of the charts is computed from the counts.
+    """
+    dimensions = set()
+    counted = False
+    for divisor in divisors:
+        if divisor in QUARTERLY_FILTERS:
+            dimensions.add(QUARTERLY_FILTERS[divisor][0])
+        elif divisor in QUARTERLY_DIMENSIONS:
+            dimensions.add(QUARTERLY_DIMENSIONS[divisor])
+        elif divisor != 'incidents':
+            continue
+        counted = True
+    if not counted:
+        return None
+    return aggregation.monthly_counts(user, 'incidents.view_statistics', months, lookup=Q(confidentiality__lte=2),
+                                      dimension=tuple(sorted(dimensions)), business_line=bl)
 
 
-@fir_auth_required
-@user_passes_test(can_view_statistics)
-def data_incident_variation(request, business_line, num_months=3):
-    bl = get_object_or_404(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics'), name=business_line)
+def quarterly_variation_chart(months, counts):
+    """
+    Returns the variation of the counts per category between the two ``months`` (most recent first), from
+    ``quarterly_counts``
+    """
+    current, previous = months
+    counts = counts.collapse(*[d for d in counts.dimensions if d != 'category'])
 
     categories = IncidentCategory.objects.all()
 
     chart_data = []
 
-    q = Q(concerned_business_lines=bl) | Q(main_business_lines=bl) | Q(concerned_business_lines__in=bl.get_children())
-    q &= Q(confidentiality__lte=2)
-
     total = 0
     total_previous = 0
     for cat in categories:
 
         d = {}
-        current = datetime.datetime.today() - relativedelta(months=1)
 
         d['category'] = cat.name
-        current_month = q & Q(date__month=current.month, date__year=current.year, category=cat)
 
         d['values'] = {}
-        d['values']['new'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(current_month).distinct().count()
+        d['values']['new'] = counts.get(current, cat.pk)
         total += d['values']['new']
 
-        previous = current - relativedelta(months=1)
-
-        previous_month = q & Q(date__month=previous.month, date__year=previous.year, category=cat)
-        previous_count = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(previous_month).distinct().count()
+        previous_count = counts.get(previous, cat.pk)
         d['values']['variation'] = d['values']['new'] - previous_count
 
         total_previous += previous_count
@@ -1926,250 +1876,247 @@ def data_incident_variation(request, business_line, num_months=3):
 
     chart_data.append({'category': 'Total', 'values': {'new': total, 'variation': total_previous}})
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+    return chart_data
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
-def data_quarterly_bl(request, business_line, divisor, num_months=3, is_incident=True):
-    bl = get_object_or_404(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics'),
-                           name=business_line)
-    children = bl.get_children()
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_incident_variation(request, business_line, num_months=3):
+    bl = get_object_or_404(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics'), name=business_line)
 
-    q = Q(main_business_lines=bl) | Q(concerned_business_lines=bl) | Q(concerned_business_lines__in=children)
-    q = q & Q(confidentiality__lte=2)
+    months = windows.months_before(datetime.datetime.today(), 2)
+    counts = quarterly_counts(request.user, bl, months, ['variation'])
 
-    chart_data = []
+    return HttpResponse(dumps(quarterly_variation_chart(months, counts)), content_type='application/json')
 
-    if divisor == 'incidents':
-        for i in xrange(num_months):
-            d = {}
 
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['label'] = cal[today.month - 1]
-            date_q = q & Q(date__month=today.month, date__year=today.year)
+def quarterly_entity_counts(user, bl, children, months):
+    """
+    Returns the counts of the incidents of ``bl`` per month, keyed by business line pk, with a single query
 
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                date_q).distinct().count()
-            d['text'] = d['value']
+    ``bl`` counts the incidents ``user`` may view the statistics of, each of its ``children`` the incidents
+    concerning the subtree of the child.
+    """
+    authorized = Incident.authorization.for_user(user, 'incidents.view_statistics')
+    columns = [(bl.pk, Q(pk__in=authorized.values('pk')) if authorized.query.has_filters() else None)]
+    columns += [(child.pk, child.get_incidents_filter()) for child in children]
+    incidents = Incident.objects.filter(aggregation.business_line_filter(bl) & Q(confidentiality__lte=2))
+    return aggregation.conditional_counts(incidents, months, columns)
 
-            chart_data.append(d)
 
-    elif divisor == 'severity':
-        for i in xrange(num_months):
-            d = {}
+def quarterly_chart(user, bl, divisor, months, counts):
+    """
+    Returns the data of the quarterly chart ``divisor`` of ``bl`` over ``months``, from ``quarterly_counts``
+    """
+    if divisor in QUARTERLY_FILTERS:
+        counts = counts.collapse(*[d for d in counts.dimensions if d != QUARTERLY_FILTERS[divisor][0]])
+    elif divisor in QUARTERLY_DIMENSIONS:
+        counts = counts.collapse(*[d for d in counts.dimensions if d != QUARTERLY_DIMENSIONS[divisor]])
+    elif divisor == 'incidents':
+        counts = counts.collapse(*counts.dimensions)
 
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['entry'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
+    chart_data = []
 
-            d['1/4'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                Q(severity=1) & q_date).distinct().count()
-            d['2/4'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                Q(severity=2) & q_date).distinct().count()
-            d['3/4'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                Q(severity=3) & q_date).distinct().count()
-            d['4/4'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                Q(severity=4) & q_date).distinct().count()
+    if divisor == 'incidents' or divisor in QUARTERLY_FILTERS:
+        values = (QUARTERLY_FILTERS[divisor][1],) if divisor in QUARTERLY_FILTERS else ()
+        for month in months:
+            d = {}
+            d['label'] = cal[month[1] - 1]
+            d['value'] = counts.get(month, *values)
+            d['text'] = d['value']
+            chart_data.append(d)
 
+    elif divisor == 'severity':
+        for month in months:
+            d = {}
+            d['entry'] = cal[month[1] - 1]
+            for severity in xrange(1, 5):
+                d['%s/4' % severity] = counts.get(month, severity)
             chart_data.append(d)
 
     elif divisor == 'category':
-        for i in xrange(num_months):
+        categories = list(IncidentCategory.objects.all())
+        for month in months:
             d = {}
-
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['entry'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
-
-            for cat in IncidentCategory.objects.all():
-                d[cat.name] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    q_date & Q(category=cat)).distinct().count()
-
+            d['entry'] = cal[month[1] - 1]
+            for cat in categories:
+                d[cat.name] = counts.get(month, cat.pk)
             chart_data.append(d)
 
     elif divisor == 'entity':
-        for i in xrange(num_months):
+        children = list(bl.get_children())
+        counts = quarterly_entity_counts(user, bl, children, months)
+        for month in months:
             d = {}
+            d['entry'] = cal[month[1] - 1]
 
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['entry'] = cal[today.month - 1]
-
-            q_date = q & Q(date__month=today.month, date__year=today.year)
-            d[bl.name] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                q_date).distinct().count()
+            d[bl.name] = counts.get(month, bl.pk)
 
-            for entity in bl.get_children():
-                d[entity.name] = entity.get_incident_count(q_date)
+            for entity in children:
+                d[entity.name] = counts.get(month, entity.pk)
                 d[bl.name] -= d[entity.name]
 
             chart_data.append(d)
 
     elif divisor == 'actor':
-        for i in xrange(num_months):
+        actors = list(Label.objects.filter(group__name='actor').distinct())
+        for month in months:
             d = {}
-
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['entry'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
-
-            for actor in Label.objects.filter(group__name='actor').distinct():
-                d[actor.name] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                    q_date & Q(actor=actor)).distinct().count()
-
+            d['entry'] = cal[month[1] - 1]
+            for actor in actors:
+                d[actor.name] = counts.get(month, actor.pk)
             chart_data.append(d)
 
-    elif divisor == 'monitoring':
-        for i in xrange(num_months):
-            d = {}
-
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['label'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
+    return delete_empty_keys(chart_data)
 
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                q_date & Q(plan__name='A')).distinct().count()
-            d['text'] = d['value']
 
-            chart_data.append(d)
+def quarterly_num_months(request, num_months=3):
+    """
+    Returns the number of months of the quarterly charts: the ``num_months`` parameter, else ``num_months``
+    """
+    try:
+        num_months = int(request.GET.get('num_months', num_months))
+    except ValueError:
+        raise Http404("Invalid number of months")
+    if num_months < 1:
+        raise Http404("Invalid number of months")
+    return num_months
 
-    elif divisor == 'open':
-        for i in xrange(num_months):
-            d = {}
 
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['label'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
+@fir_auth_required
+@user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_quarterly_bl(request, business_line, divisor, num_months=3, is_incident=True):
+    bl = get_object_or_404(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics'),
+                           name=business_line)
 
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                q_date & Q(status='O')).distinct().count()
-            d['text'] = d['value']
-            chart_data.append(d)
+    num_months = quarterly_num_months(request, num_months)
+    months = list(reversed(windows.months_before(datetime.datetime.today(), num_months)))
+    counts = quarterly_counts(request.user, bl, months, [divisor])
 
-    elif divisor == 'blocked':
-        for i in xrange(num_months):
-            d = {}
+    return HttpResponse(dumps(quarterly_chart(request.user, bl, divisor, months, counts)),
+                        content_type='application/json')
 
-            today = datetime.datetime.today() - relativedelta(months=num_months - i)
-            d['label'] = cal[today.month - 1]
-            q_date = q & Q(date__month=today.month, date__year=today.year)
 
-            d['value'] = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(
-                q_date & Q(status='B')).distinct().count()
-            d['text'] = d['value']
-            chart_data.append(d)
+@fir_auth_required
+@user_passes_test(can_view_statistics)
+@statistics_snapshots.snapshot_response()
+@statistics_cache.cache_response()
+def data_batch(request):
+    """
+    Data of several charts in one JSON object, keyed by chart
 
-    chart_data = delete_empty_keys(chart_data)
+    ``chart`` lists the charts: 'yearly_incidents', 'yearly_bl', 'yearly_bl_detection' (and the other
+    ``YEARLY_BL_DIMENSIONS``), 'distribution_<field>' (with the parameters of ``data_field_distribution``),
+    and 'quarterly_<divisor>' or 'quarterly_variation' of ``business_line`` (over ``num_months``). The charts
+    of a page are computed from counts shared between them, grouped by all the dimensions they need.
+    """
+    charts = request.GET.getlist('chart')
+    yearly, fields, divisors = [], [], []
+    for chart in charts:
+        prefix, _, name = chart.partition('_')
+        if prefix == 'yearly' and name in YEARLY_BL_DIMENSIONS:
+            yearly.append(name)
+        elif prefix == 'distribution' and name in aggregation.DISTRIBUTION_FIELDS:
+            fields.append(name)
+        elif prefix == 'quarterly' and (name in statistics_snapshots.QUARTERLY_DIVISORS or name == 'variation'):
+            divisors.append(name)
+        elif chart != 'yearly_incidents':
+            raise Http404("Unknown chart")
+
+    data = {}
+
+    if 'yearly_incidents' in charts:
+        data['yearly_incidents'] = yearly_incidents_chart(request.user)
+
+    if yearly:
+        bls = list(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics').filter(depth=1))
+        months = windows.year_months(datetime.datetime.now().year)
+        dimensions = [YEARLY_BL_DIMENSIONS[name] for name in yearly]
+        counts = yearly_bl_counts(request.user, bls, months, dimensions)
+        for name in yearly:
+            data['yearly_' + name] = yearly_bl_chart(
+                name, bls, months, counts.collapse(*[d for d in dimensions if d != YEARLY_BL_DIMENSIONS[name]]))
+
+    if fields:
+        start, end = distribution_window(request)
+        distributions = aggregation.distributions(request.user, 'incidents.view_statistics', fields, start, end,
+                                                  lookup=distribution_lookup(request))
+        for field in fields:
+            data['distribution_' + field] = distribution_chart(field, distributions[field])
+
+    if divisors:
+        bl = get_object_or_404(BusinessLine.authorization.for_user(request.user, 'incidents.view_statistics'),
+                               name=request.GET.get('business_line'))
+        num_months = quarterly_num_months(request)
+        # The variation compares the last two months, whatever the number of months of the other charts
+        months = windows.months_before(datetime.datetime.today(),
+                                       max(num_months, 2) if 'variation' in divisors else num_months)
+        counts = quarterly_counts(request.user, bl, months, divisors)
+        for divisor in divisors:
+            if divisor == 'variation':
+                data['quarterly_variation'] = quarterly_variation_chart(months[:2], counts)
+            else:
+                data['quarterly_' + divisor] = quarterly_chart(request.user, bl, divisor,
+                                                               list(reversed(months[:num_months])), counts)
 
-    return HttpResponse(dumps(chart_data), content_type='application/json')
+    return HttpResponse(dumps(data), content_type='application/json')
 
 
 @fir_auth_required
 @user_passes_test(can_view_statistics)
 def quarterly_major(request, start_date=None, num_months=3):
+    months = quarterly_major_months(start_date, num_months)
+
+    snapshot = statistics_snapshots.get(request.user, 'quarterly_major', [('months', months)])
+    if snapshot is not None:
+        context = loads(snapshot.content)
+        context['computed_at'] = snapshot.computed_at
+    else:
+        context = quarterly_major_tables(request.user, months)
+
+    context['incident_list'] = Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
+        Q(is_major=True) & windows.month_filter(months) & Q(confidentiality__lte=2)).order_by('-date')
+    return render(request, 'stats/major.html', context)
+
+
+def quarterly_major_months(start_date=None, num_months=3):
+    if start_date is None:
+        today = datetime.datetime.today()
+    else:
+        today = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+
+    return list(reversed(windows.months_before(today, int(num_months))))
+
+
+def quarterly_major_tables(user, months):
     q_major = Q(is_major=True)
     q_confid = Q(confidentiality__lte=2)
     balecats = BaleCategory.objects.filter(Q(parent_category__isnull=False))
     certcats = IncidentCategory.objects.all()
     parent_bls = BusinessLine.get_root_nodes()
 
-    num_months = int(num_months)
+    labels = [cal[month[1] - 1] for month in months]
 
-    bale = []
-    cert = []
-    bls = []
+    cert_counts, bale_counts, bl_counts = aggregation.monthly_counts_many(
+        user, 'incidents.view_statistics', months, lookup=q_major & q_confid,
+        dimensions=('category', 'category__bale_subcategory', 'main_business_lines'))
+    total_counts = aggregation.monthly_counts(user, 'incidents.view_statistics', months, lookup=q_confid)
 
-    if start_date is None:
-        today = datetime.datetime.today()
-    else:
-        today = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    cert = aggregation.pivot_table(['Category'] + labels + ['Total'],
+                                   [(certcat.name, certcat.pk) for certcat in certcats], months, cert_counts)
+    bale = aggregation.pivot_table(['Bale category'] + labels,
+                                   [(unicode(balecat), balecat.pk) for balecat in balecats], months, bale_counts,
+                                   total=False)
+    bls = aggregation.pivot_table(['Business Line'] + labels + ['Total'],
+                                  [(unicode(bl), bl.pk) for bl in parent_bls], months, bl_counts)
 
-    cert.append(['Category'])
-    for i in xrange(num_months):
-        then = today - relativedelta(months=num_months - i)
-        cert[0].append(cal[then.month - 1])
-    cert[0].append('Total')
-    for certcat in certcats:
-        line = []
-        q_certcat = Q(category=certcat) & q_major
-        line.append(certcat.name)
-        add = False
-        total = 0
-        for i in xrange(num_months):
-            then = today - relativedelta(months=num_months - i)
-            q_date = q_certcat & Q(date__month=then.month, date__year=then.year)
-            count = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q_date & q_confid).count()
-            line.append(count)
-
-            if count != 0:
-                add = True
-                total += count
-
-        line.append(total)
-
-        if add:
-            cert.append(line)
-
-    bale.append(['Bale category'])
-    for i in xrange(num_months):
-        then = today - relativedelta(months=num_months - i)
-        bale[0].append(cal[then.month - 1])
-
-    for balecat in balecats:
-        line = []
-        q_balecat = Q(category__bale_subcategory=balecat) & q_major
-        line.append(balecat.__unicode__)
-        add = False
-        for i in xrange(num_months):
-            then = today - relativedelta(months=num_months - i)
-            q_date = q_balecat & Q(date__month=then.month, date__year=then.year)
-            count = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q_date & q_confid).count()
-            line.append(count)
-            if count != 0:
-                add = True
-
-        if add:
-            bale.append(line)
-
-    bls.append(['Business Line'])
-    for i in xrange(num_months):
-        then = today - relativedelta(months=num_months - i)
-        bls[0].append(cal[then.month - 1])
-    bls[0].append('Total')
-
-    for bl in parent_bls:
-        line = []
-        q_bl = Q(main_business_lines=bl) & q_major
-        line.append(bl.__unicode__)
-        add = False
-
-        total = 0
-        for i in xrange(num_months):
-            then = today - relativedelta(months=num_months - i)
-            q_date = q_bl & Q(date__month=then.month, date__year=then.year)
-
-            count = Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(q_date & q_confid).count()
-            line.append(count)
-            if count != 0:
-                add = True
-                total += count
-        line.append(total)
-        if add:
-            bls.append(line)
-
-    total_major = 0
-    for i in xrange(num_months):
-        d = today - relativedelta(months=num_months - i)
-        total_major += Incident.authorization.for_user(request.user, 'incidents.view_statistics').filter(date__month=d.month, date__year=d.year, confidentiality__lte=2).count()
-
-    past_months = Q()
-    for i in xrange(num_months):
-        d = today - relativedelta(months=num_months - i)
-        past_months |= Q(date__month=d.month, date__year=d.year)
-
-    return render(request, 'stats/major.html', {'bale': bale, 'cert': cert, 'total_major': total_major, 'bls': bls,
-                                                'incident_list': Incident.authorization.for_user(request.user, 'incidents.view_incidents').filter(
-                                                    q_major & past_months & q_confid).order_by('-date')})
+    total_major = total_counts.total(months)
+
+    return {'bale': bale, 'cert': cert, 'total_major': total_major, 'bls': bls}
 
 
 # Dashboard =======================================================
@@ -2201,14 +2148,9 @@ def incident_display(request, filter, incident_view=True, paginated=True):
         incident_list = pre_list.filter(filter).order_by(order_by)
 
     if paginated:
-        page = request.GET.get('page', 1)
-        incidents_per_page = request.user.profile.incident_number
-        p = Paginator(incident_list, incidents_per_page)
+        incident_list = pagination.paginate(request, incident_list, request.user.profile.incident_number)
 
-        try:
-            incident_list = p.page(page)
-        except (PageNotAnInteger, EmptyPage):
-            incident_list = p.page(1)
+    Incident.authorization.permissions_for(request.user, incident_list, 'incidents.handle_incidents')
 
     return render(request, 'events/table.html', {
         'incident_list': incident_list,
@@ -2251,6 +2193,7 @@ def dashboard_old(request):
     incident_list = Incident.authorization.for_user(request.user, permissions).filter(status='O').annotate(
         Max('comments__date')).order_by('comments__date__max')[
                     :20]
+    Incident.authorization.permissions_for(request.user, incident_list, 'incidents.handle_incidents')
 
     return render(request, 'events/table.html', {
         'incident_list': incident_list,